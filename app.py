@@ -1,22 +1,238 @@
+import time
+
+# Początek startu procesu - punkt odniesienia raportu czasu startu (StartupTimer)
+_PROCESS_START = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 from datetime import datetime, timedelta
+from itertools import accumulate
+import argparse
+import bisect
+import collections
+import csv
+import functools
+import glob
+import hashlib
+import http.server
+import importlib.util
+import itertools
 import json
+import math
+import mmap
 import os
+import queue
+import re
+import shutil
+import signal
+import sqlite3
+import struct
+import sys
+import textwrap
+import threading
+import types
+import uuid
+
+# reportlab jest importowany dopiero przy pierwszym renderowaniu PDF
+# (load_reportlab) - sam import trwa dłużej niż start całego interfejsu
+REPORTLAB_AVAILABLE = importlib.util.find_spec("reportlab") is not None
+REPORTLAB_VERSION = None
+_reportlab_loaded = False
+_reportlab_lock = threading.Lock()
+
+
+def load_reportlab():
+    """
+    Importuje reportlab przy pierwszym użyciu i udostępnia jego nazwy w module.
+    Zwraca False, jeśli biblioteka nie jest zainstalowana.
+    """
+    global _reportlab_loaded, REPORTLAB_AVAILABLE, REPORTLAB_VERSION, PagedItemsTable, CachedParagraph
+    global A4, colors, mm, SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Flowable
+    global getSampleStyleSheet, ParagraphStyle, TA_CENTER, TA_LEFT, TA_RIGHT, pdfmetrics, TTFont
+    global ImageReader
+    if _reportlab_loaded:
+        return REPORTLAB_AVAILABLE
+    with _reportlab_lock:
+        if _reportlab_loaded:
+            return REPORTLAB_AVAILABLE
+        try:
+            from reportlab.lib.pagesizes import A4
+            from reportlab.lib import colors
+            from reportlab.lib.units import mm
+            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Flowable
+            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+            from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+            from reportlab.lib.utils import ImageReader
+            from reportlab import Version as REPORTLAB_VERSION
+        except ImportError:
+            REPORTLAB_AVAILABLE = False
+        else:
+            PagedItemsTable = type("PagedItemsTable", (_PagedItemsTable, Flowable),
+                                   {"__doc__": _PagedItemsTable.__doc__})
+            CachedParagraph = type("CachedParagraph", (_CachedWrap, Paragraph),
+                                   {"__doc__": _CachedWrap.__doc__})
+            REPORTLAB_AVAILABLE = True
+        _reportlab_loaded = True
+    return REPORTLAB_AVAILABLE
+
+
+# Zmienna środowiskowa włączająca śledzenie (ścieżka pliku wynikowego)
+TRACE_ENV = "OFFER_TRACE"
+
+
+class _Span:
+    """
+    Przedział czasu jednej operacji. Liczniki (np. pozycji, bajtów) można
+    uzupełniać w trakcie: span["bytes"] = ...
+    """
+    
+    __slots__ = ("tracer", "name", "args", "start")
+    
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = time.perf_counter()
+    
+    def __setitem__(self, key, value):
+        self.args[key] = value
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.end()
+    
+    def end(self):
+        self.tracer.events.append((self.name, self.start, time.perf_counter(),
+                                   threading.current_thread().name, self.args))
+
+
+class _NullSpan:
+    """
+    Przedział przy wyłączonym śledzeniu - niczego nie zapisuje.
+    """
+    
+    def __setitem__(self, key, value):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        pass
+    
+    def end(self):
+        pass
 
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.units import mm
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    import reportlab.rl_config
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Pomiar czasu nazwanych operacji (fonty, budowa i zapis PDF, JSON, naprawa
+    kodowania, odświeżanie list, zapis odbiorców). Włączany przez OFFER_TRACE
+    lub --trace; wynik to plik Chrome trace (chrome://tracing, Perfetto)
+    i tabela podsumowania ze szczytowym zużyciem pamięci z tracemalloc.
+    Wyłączony kosztuje jedno sprawdzenie na operację.
+    """
+    
+    def __init__(self):
+        self.path = None
+        self.events = []
+        self.peak_memory = None
+    
+    @property
+    def enabled(self):
+        return self.path is not None
+    
+    def start(self, path):
+        import tracemalloc
+        self.path = path
+        self.events = []
+        tracemalloc.start()
+    
+    def span(self, name, **counts):
+        if self.path is None:
+            return _NULL_SPAN
+        return _Span(self, name, counts)
+    
+    def summary(self):
+        """
+        Zwraca listę (nazwa, liczba wywołań, łączny czas, najdłuższy czas,
+        sumy liczników) posortowaną malejąco według łącznego czasu.
+        """
+        stats = {}
+        for name, start, end, thread, counts in self.events:
+            entry = stats.setdefault(name, [0, 0.0, 0.0, {}])
+            entry[0] += 1
+            entry[1] += end - start
+            entry[2] = max(entry[2], end - start)
+            for key, value in counts.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry[3][key] = entry[3].get(key, 0) + value
+        return sorted(((name, *entry) for name, entry in stats.items()),
+                      key=lambda row: row[2], reverse=True)
+    
+    def report(self):
+        lines = [f"{'operacja':<24} {'wywołań':>8} {'łącznie':>12} {'najdłużej':>12}  liczniki"]
+        for name, calls, total, longest, counts in self.summary():
+            counters = ", ".join(f"{key}={value:.15g}" for key, value in sorted(counts.items()))
+            lines.append(f"{name:<24} {calls:>8} {total * 1000:9.1f} ms {longest * 1000:9.1f} ms  "
+                         f"{counters}")
+        if self.peak_memory is not None:
+            lines.append(f"Szczytowe zużycie pamięci (tracemalloc): "
+                         f"{self.peak_memory / (1024 * 1024):.1f} MB")
+        lines.append(f"Zapis śledzenia: {self.path}")
+        return "\n".join(lines)
+    
+    def save(self):
+        """
+        Zapisuje zebrane przedziały w formacie Chrome trace (JSON) i kończy
+        pomiar pamięci.
+        """
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        pid = os.getpid()
+        threads = {}
+        events = []
+        for name, start, end, thread, counts in self.events:
+            tid = threads.setdefault(thread, len(threads) + 1)
+            events.append({
+                "name": name,
+                "cat": name.split(".", 1)[0],
+                "ph": "X",
+                "ts": (start - _PROCESS_START) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": {key: value if isinstance(value, (int, float, str, bool)) else str(value)
+                         for key, value in counts.items()}
+            })
+        for thread, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": thread}})
+        trace = {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "peak_memory_bytes": self.peak_memory,
+                "summary": [{"name": name, "calls": calls, "total_ms": total * 1000,
+                             "max_ms": longest * 1000, "counts": counts}
+                            for name, calls, total, longest, counts in self.summary()]
+            }
+        }
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False)
+
+
+# Wspólny obiekt śledzenia (włączany w main)
+tracer = Tracer()
 
 
 def normalize_encoding(text):
@@ -27,45 +243,30 @@ def normalize_encoding(text):
     if not text or not isinstance(text, str):
         return text
     
-    # Jeśli tekst już jest poprawny i nie zawiera znaków zastępczych, zwróć go
-    try:
-        text.encode('utf-8')
-        # Sprawdź czy nie zawiera znaków zastępczych (kwadraty, pytajniki itp.)
-        if '\ufffd' not in text and '' not in text and '■' not in text:
-            return text
-    except UnicodeEncodeError:
-        pass
+    # Szybka ścieżka: tekst bez znaków zastępczych (kwadraty, pytajniki itp.)
+    # jest poprawny - zwróć go bez kopiowania
+    if '\ufffd' not in text and '■' not in text:
+        return text
     
-    # Jeśli tekst zawiera znaki zastępcze, spróbuj naprawić
-    # Najpierw spróbuj traktować jako Windows-1250 (typowe dla polskich systemów)
+    return _repair_encoding(text)
+
+
+@functools.lru_cache(maxsize=4096)
+def _repair_encoding(text):
+    """
+    Próbuje naprawić tekst ze znakami zastępczymi (wyniki są zapamiętywane).
+    """
+    # Zakoduj jako latin1 (zachowuje bajty) i zdekoduj jako Windows-1250
+    # (typowe dla polskich systemów) lub ISO-8859-2
     try:
-        # Jeśli tekst zawiera znaki zastępcze, spróbuj różnych kodowań
-        if isinstance(text, bytes):
-            # Jeśli to bytes, spróbuj zdekodować
-            for encoding in ['utf-8', 'windows-1250', 'iso-8859-2', 'cp1250']:
-                try:
-                    decoded = text.decode(encoding)
-                    if '\ufffd' not in decoded and '' not in decoded:
-                        return decoded
-                except (UnicodeDecodeError, UnicodeEncodeError):
-                    continue
-        else:
-            # Jeśli to string z uszkodzonymi znakami, spróbuj naprawić
-            # Najpierw zakoduj jako latin1 (zachowuje bajty) i zdekoduj jako windows-1250
-            try:
-                encoded = text.encode('latin1', errors='ignore')
-                for encoding in ['windows-1250', 'iso-8859-2', 'cp1250']:
-                    try:
-                        decoded = encoded.decode(encoding, errors='ignore')
-                        if '\ufffd' not in decoded and '' not in decoded and '■' not in decoded:
-                            # Sprawdź czy zawiera polskie znaki (znak że naprawa zadziałała)
-                            if any(c in decoded for c in 'ąćęłńóśźżĄĆĘŁŃÓŚŹŻ'):
-                                return decoded
-                    except (UnicodeDecodeError, UnicodeEncodeError):
-                        continue
-            except:
-                pass
-    except:
+        encoded = text.encode('latin1', errors='ignore')
+        for encoding in ['windows-1250', 'iso-8859-2', 'cp1250']:
+            decoded = encoded.decode(encoding, errors='ignore')
+            if '\ufffd' not in decoded and '' not in decoded and '■' not in decoded:
+                # Sprawdź czy zawiera polskie znaki (znak że naprawa zadziałała)
+                if any(c in decoded for c in 'ąćęłńóśźżĄĆĘŁŃÓŚŹŻ'):
+                    return decoded
+    except (UnicodeEncodeError, UnicodeDecodeError):
         pass
     
     # Jeśli nic nie zadziałało, zwróć oryginalny tekst
@@ -76,547 +277,4782 @@ def fix_string_encoding(text):
     """
     Naprawia kodowanie pojedynczego stringa.
     """
+    with tracer.span("encoding.fix"):
+        return _fix_string_encoding(text)
+
+
+def _fix_string_encoding(text):
     if isinstance(text, dict):
-        return {k: fix_string_encoding(v) for k, v in text.items()}
+        return {k: _fix_string_encoding(v) for k, v in text.items()}
     elif isinstance(text, list):
-        return [fix_string_encoding(item) for item in text]
+        return [_fix_string_encoding(item) for item in text]
     elif isinstance(text, str):
         return normalize_encoding(text)
     else:
         return text
 
 
-class OfferCreatorApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Tworzenie Ofert")
-        self.root.geometry("1000x700")
-        
-        # Dane firmy (stałe)
-        self.company_data = {
-            "name": "",
-            "address": "",
-            "city": "",
-            "postal_code": "",
-            "nip": "",
-            "phone": "",
-            "email": "",
-            "bank_account": ""
+# Klucz oznaczający zapisane dane, których kodowanie zostało już naprawione
+NORMALIZED_KEY = "normalized"
+
+
+def mark_normalized(data):
+    """
+    Zwraca kopię słownika z markerem naprawionego kodowania (do zapisu w pliku).
+    """
+    return {NORMALIZED_KEY: True, **data}
+
+
+def load_normalized(data):
+    """
+    Naprawia kodowanie wczytanych danych. Dane z markerem zapisanym przez
+    mark_normalized są zwracane bez przechodzenia całej struktury.
+    """
+    if isinstance(data, dict) and data.get(NORMALIZED_KEY) is True:
+        data = dict(data)
+        del data[NORMALIZED_KEY]
+        return data
+    return fix_string_encoding(data)
+
+# Rodziny fontów Unicode w kolejności preferencji:
+# (nazwa, nazwa pogrubiona, typowe ścieżki fontu regularnego, (plik regularny, plik pogrubiony))
+UNICODE_FONT_FAMILIES = [
+    ('DejaVuSans', 'DejaVuSans-Bold', [
+        'C:/Windows/Fonts/DejaVuSans.ttf',
+        'C:/Windows/Fonts/dejavu/DejaVuSans.ttf',
+        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+        '/usr/share/fonts/TTF/DejaVuSans.ttf',
+    ], ('DejaVuSans.ttf', 'DejaVuSans-Bold.ttf')),
+    # Arial Unicode MS (Windows) nie ma wersji pogrubionej
+    ('ArialUnicode', 'ArialUnicode', [
+        'C:/Windows/Fonts/ARIALUNI.TTF',
+        'C:/Windows/Fonts/arialuni.ttf',
+    ], ('ARIALUNI.TTF', None)),
+    ('LiberationSans', 'LiberationSans-Bold', [
+        '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
+        '/usr/share/fonts/TTF/LiberationSans-Regular.ttf',
+    ], ('LiberationSans-Regular.ttf', 'LiberationSans-Bold.ttf')),
+]
+
+def user_cache_dir():
+    """
+    Zwraca katalog na pliki pomocnicze aplikacji (niezależny od katalogu,
+    z którego ją uruchomiono).
+    """
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "offer_creator")
+
+
+FONT_CACHE_FILE = os.path.join(user_cache_dir(), "font_cache.json")
+
+
+class FontRegistry:
+    """
+    Rejestr fontów Unicode dla PDF. Rodzina fontów jest wyszukiwana i rejestrowana
+    w reportlab raz na proces, a znalezione ścieżki są zapamiętywane w pliku
+    cache (ważne dopóki nie zmieni się czas modyfikacji plików fontów).
+    """
+    
+    def __init__(self, cache_file=FONT_CACHE_FILE, search_dirs=None):
+        self.cache_file = cache_file
+        self.search_dirs = []
+        for path in search_dirs or []:
+            self.add_search_dir(path)
+        self._fonts = None
+        self._files = {}
+    
+    def add_search_dir(self, path):
+        """
+        Dodaje katalog przeszukiwany przed typowymi lokalizacjami fontów.
+        """
+        path = os.path.abspath(path)
+        if path not in self.search_dirs:
+            self.search_dirs.append(path)
+            self._fonts = None
+    
+    def fonts(self):
+        """
+        Zwraca (font, font pogrubiony) - przy pierwszym wywołaniu rejestruje fonty.
+        """
+        if self._fonts is None:
+            with tracer.span("fonts.resolve") as span:
+                self._fonts = self._resolve()
+                span["files"] = len(self._files)
+        return self._fonts
+    
+    def resolved_files(self):
+        """
+        Zwraca słownik {nazwa fontu: ścieżka} zarejestrowanych plików TTF.
+        """
+        self.fonts()
+        return dict(self._files)
+    
+    def _candidates(self, family):
+        name, bold_name, default_paths, (regular_file, bold_file) = family
+        for directory in self.search_dirs:
+            path = os.path.join(directory, regular_file)
+            bold_path = os.path.join(directory, bold_file) if bold_file else None
+            yield path, bold_path
+        for path in default_paths:
+            bold_path = path.replace(regular_file, bold_file) if bold_file else None
+            yield path, bold_path
+    
+    def _register(self, files):
+        """
+        Rejestruje fonty z podanych plików (pomija już zarejestrowane).
+        """
+        load_reportlab()
+        registered = pdfmetrics.getRegisteredFontNames()
+        for font, path in files.items():
+            if font not in registered:
+                pdfmetrics.registerFont(TTFont(font, path))
+    
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            if cache.get("search_dirs") != self.search_dirs:
+                return None
+            files = {}
+            for font, entry in cache["files"].items():
+                if os.path.getmtime(entry["path"]) != entry["mtime"]:
+                    return None
+                files[font] = entry["path"]
+            return cache["font_name"], cache["font_bold"], files
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+    
+    def _save_cache(self, font_name, font_bold, files):
+        cache = {
+            "search_dirs": self.search_dirs,
+            "font_name": font_name,
+            "font_bold": font_bold,
+            "files": {font: {"path": path, "mtime": os.path.getmtime(path)}
+                      for font, path in files.items()}
         }
-        
-        # Odbiorcy (zmienne)
-        self.recipients = []
-        
-        # Pozycje oferty
-        self.offer_items = []
-        
-        self.setup_ui()
-        self.load_company_data()
+        # Zapis atomowy - plik może być zapisywany przez kilka procesów naraz
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass
     
-    def setup_ui(self):
-        # Główny kontener z zakładkami
-        notebook = ttk.Notebook(self.root)
-        notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        # Zakładka 1: Dane firmy
-        company_frame = ttk.Frame(notebook)
-        notebook.add(company_frame, text="Dane Firmy")
-        self.setup_company_tab(company_frame)
+    def _resolve(self):
+        # Najpierw spróbuj ścieżek zapamiętanych w cache
+        cached = self._load_cache()
+        if cached:
+            font_name, font_bold, files = cached
+            try:
+                self._register(files)
+                self._files = files
+                return font_name, font_bold
+            except Exception:
+                pass
         
-        # Zakładka 2: Odbiorcy
-        recipients_frame = ttk.Frame(notebook)
-        notebook.add(recipients_frame, text="Odbiorcy")
-        self.setup_recipients_tab(recipients_frame)
+        for family in UNICODE_FONT_FAMILIES:
+            name, bold_name = family[0], family[1]
+            for path, bold_path in self._candidates(family):
+                if not os.path.exists(path):
+                    continue
+                files = {name: path}
+                if bold_path and bold_name != name and os.path.exists(bold_path):
+                    files[bold_name] = bold_path
+                try:
+                    self._register(files)
+                except Exception:
+                    continue
+                # Bez wersji pogrubionej użyj fontu regularnego
+                font_bold = bold_name if bold_name in files else name
+                self._files = files
+                self._save_cache(name, font_bold, files)
+                return name, font_bold
         
-        # Zakładka 3: Tworzenie Oferty
-        offer_frame = ttk.Frame(notebook)
-        notebook.add(offer_frame, text="Tworzenie Oferty")
-        self.setup_offer_tab(offer_frame)
+        # Jeśli żaden font Unicode nie został znaleziony, użyj domyślnych
+        # Helvetica w reportlab ma ograniczone wsparcie dla Unicode
+        self._files = {}
+        return 'Helvetica', 'Helvetica-Bold'
+
+
+def _font_dirs_from_env():
+    value = os.environ.get("OFFER_FONT_DIRS", "")
+    return [path for path in value.split(os.pathsep) if path]
+
+
+font_registry = FontRegistry(search_dirs=_font_dirs_from_env())
+
+
+def get_unicode_fonts():
+    """
+    Zwraca (font, font pogrubiony) obsługujące polskie znaki.
+    """
+    return font_registry.fonts()
+
+
+def configure_fonts(search_dirs=()):
+    """
+    Dodaje katalogi przeszukiwane w poszukiwaniu fontów.
+    """
+    for path in search_dirs:
+        font_registry.add_search_dir(path)
+
+
+def load_offer_data(filename):
+    """
+    Wczytuje ofertę z pliku JSON (format zapisywany przez save_offer_json)
+    lub z pliku binarnego .offb. Naprawia kodowanie i uzupełnia brakujące
+    wartości pozycji.
+    """
+    if is_offer_binary(filename):
+        with tracer.span("offer.load_offb") as span, OfferBinaryFile(filename) as offer:
+            offer_data = offer.to_dict()
+            span["items"] = offer.item_count
+        for item in offer_data["items"]:
+            _backfill_total(item)
+        return offer_data
     
-    def setup_company_tab(self, parent):
-        # Nagłówek
-        header = ttk.Label(parent, text="Stałe Dane Firmy", font=("Arial", 16, "bold"))
-        header.pack(pady=10)
-        
-        # Ramka z polami
-        form_frame = ttk.LabelFrame(parent, text="Informacje o firmie", padding=15)
-        form_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
-        
-        # Pola formularza
-        fields = [
-            ("Nazwa firmy:", "name"),
-            ("Adres:", "address"),
-            ("Miasto:", "city"),
-            ("Kod pocztowy:", "postal_code"),
-            ("NIP:", "nip"),
-            ("Telefon:", "phone"),
-            ("Email:", "email"),
-            ("Numer konta bankowego:", "bank_account")
-        ]
-        
-        self.company_entries = {}
-        for i, (label, key) in enumerate(fields):
-            row_frame = ttk.Frame(form_frame)
-            row_frame.pack(fill=tk.X, pady=5)
-            
-            ttk.Label(row_frame, text=label, width=20).pack(side=tk.LEFT)
-            entry = ttk.Entry(row_frame, width=50)
-            entry.pack(side=tk.LEFT, padx=10, fill=tk.X, expand=True)
-            self.company_entries[key] = entry
-        
-        # Przyciski
-        button_frame = ttk.Frame(parent)
-        button_frame.pack(pady=10)
-        
-        ttk.Button(button_frame, text="Zapisz Dane Firmy", 
-                  command=self.save_company_data).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Wczytaj Dane Firmy", 
-                  command=self.load_company_data).pack(side=tk.LEFT, padx=5)
+    with tracer.span("offer.load_json") as span, open(filename, "r", encoding="utf-8") as f:
+        offer_data = json.load(f)
+        span["bytes"] = f.tell()
+    return normalize_offer_data(offer_data)
+
+
+def normalize_offer_data(offer_data):
+    """
+    Naprawia kodowanie oferty wczytanej z JSON (plik lub żądanie usługi
+    renderowania) i uzupełnia brakujące wartości pozycji.
+    """
+    # Napraw kodowanie danych (pomijane dla plików zapisanych z markerem)
+    offer_data = load_normalized(offer_data)
     
-    def setup_recipients_tab(self, parent):
-        # Nagłówek
-        header = ttk.Label(parent, text="Zarządzanie Odbiorcami", font=("Arial", 16, "bold"))
-        header.pack(pady=10)
-        
-        # Lista odbiorców
-        list_frame = ttk.LabelFrame(parent, text="Lista Odbiorców", padding=10)
-        list_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
-        
-        # Treeview dla listy
-        columns = ("Nazwa", "Adres", "Miasto", "NIP")
-        self.recipients_tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=10)
-        
-        for col in columns:
-            self.recipients_tree.heading(col, text=col)
-            self.recipients_tree.column(col, width=150)
-        
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.recipients_tree.yview)
-        self.recipients_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.recipients_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # Formularz dodawania/edycji
-        form_frame = ttk.LabelFrame(parent, text="Dodaj/Edytuj Odbiorcę", padding=15)
-        form_frame.pack(fill=tk.X, padx=20, pady=10)
-        
-        self.recipient_entries = {}
-        fields = [
-            ("Nazwa:", "name"),
-            ("Adres:", "address"),
-            ("Miasto:", "city"),
-            ("Kod pocztowy:", "postal_code"),
-            ("NIP:", "nip"),
-            ("Telefon:", "phone"),
-            ("Email:", "email")
-        ]
-        
-        for i, (label, key) in enumerate(fields):
-            row_frame = ttk.Frame(form_frame)
-            row_frame.pack(fill=tk.X, pady=3)
-            
-            ttk.Label(row_frame, text=label, width=15).pack(side=tk.LEFT)
-            entry = ttk.Entry(row_frame, width=40)
-            entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
-            self.recipient_entries[key] = entry
-        
-        # Przyciski
-        button_frame = ttk.Frame(parent)
-        button_frame.pack(pady=10)
-        
-        ttk.Button(button_frame, text="Dodaj Odbiorcę", 
-                  command=self.add_recipient).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Edytuj Odbiorcę", 
-                  command=self.edit_recipient).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Usuń Odbiorcę", 
-                  command=self.delete_recipient).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Wyczyść Formularz", 
-                  command=self.clear_recipient_form).pack(side=tk.LEFT, padx=5)
-        
-        self.recipients_tree.bind("<Double-1>", self.on_recipient_select)
-        self.refresh_recipients_list()
+    if not isinstance(offer_data, dict):
+        raise ValueError("Nieprawidłowy format pliku JSON!")
     
-    def setup_offer_tab(self, parent):
-        # Wybór odbiorcy
-        recipient_frame = ttk.LabelFrame(parent, text="Wybór Odbiorcy", padding=10)
+    # Upewnij się, że każda pozycja ma obliczoną wartość total
+    for item in offer_data.get("items") or []:
+        _backfill_total(item)
+    
+    return offer_data
+
+
+def _backfill_total(item):
+    # Upewnij się, że pozycja ma obliczoną wartość total
+    if "total" not in item or item["total"] == 0:
+        quantity = item.get("quantity", 0)
+        unit_price = item.get("unit_price", 0)
+        item["total"] = quantity * unit_price
+    return item
+
+
+class _JsonReader:
+    """
+    Przyrostowy odczyt JSON z pliku: kolejne wartości dekodowane są przez
+    raw_decode z bufora, który jest doczytywany w miarę potrzeby.
+    """
+    
+    def __init__(self, f, chunk_size=65536):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+    
+    def _fill(self):
+        if self.eof:
+            return False
+        # Duże wartości doczytywane są coraz większymi porcjami
+        data = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+    
+    def peek(self):
+        """
+        Zwraca następny znak poza białymi znakami ("" na końcu pliku).
+        """
+        while True:
+            buf = self.buf
+            pos = self.pos
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+    
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Nieprawidłowy format pliku JSON!")
+        self.pos += 1
+    
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                # Wartość jest pełna, jeśli za nią jest separator - liczba
+                # urwana na końcu bufora może mieć dalszy ciąg w pliku
+                if self.eof or (end < len(self.buf) and self.buf[end] in " \t\r\n,:]}"):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+    
+    def array(self):
+        """
+        Generator kolejnych elementów tablicy JSON.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError("Nieprawidłowy format pliku JSON!")
+
+
+def _read_offer_fields(reader, header, first):
+    """
+    Czyta pola obiektu oferty do header aż do końca obiektu (zwraca None)
+    albo do listy "items" zapisanej po odbiorcy - wtedy zwraca generator
+    jej elementów, a obiekt jest czytany dalej po wyczerpaniu generatora.
+    """
+    while True:
+        if reader.peek() == "}":
+            reader.pos += 1
+            return None
+        if not first:
+            reader.expect(",")
+        first = False
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError("Nieprawidłowy format pliku JSON!")
+        reader.expect(":")
+        if key == "items" and "recipient" in header and reader.peek() == "[":
+            return reader.array()
+        header[key] = reader.value()
+
+
+def stream_offer_data(filename):
+    """
+    Wczytuje ofertę JSON strumieniowo. Zwraca (nagłówek, pozycje): nagłówek to
+    słownik z polami zapisanymi przed listą "items" (firma, odbiorca, data),
+    a pozycje - generator kolejnych pozycji z naprawionym kodowaniem i uzupełnioną
+    wartością total. Pola zapisane za listą (np. "total") trafiają do nagłówka
+    po przejściu wszystkich pozycji. W pamięci nie powstaje całe drzewo pliku.
+    Pliki .offb są czytane przez mmap - nagłówek od razu, pozycje przy iteracji.
+    """
+    if is_offer_binary(filename):
+        offer = OfferBinaryFile(filename)
+        header = offer.to_dict(items=False)
+        return header, _ClosingIterator((_backfill_total(item) for item in offer), offer)
+    
+    f = open(filename, "r", encoding="utf-8")
+    try:
+        reader = _JsonReader(f)
+        reader.expect("{")
+        header = {}
+        items = _read_offer_fields(reader, header, first=True)
+    except BaseException:
+        f.close()
+        raise
+    
+    normalized = header.pop(NORMALIZED_KEY, None) is True
+    if not normalized:
+        header.update(fix_string_encoding(header))
+    
+    streaming = items is not None
+    if not streaming:
+        # Cały plik już wczytany (pozycje przed odbiorcą lub brak pozycji)
+        f.close()
+        items = header.pop("items", None) or []
+        if not isinstance(items, list):
+            raise ValueError("Nieprawidłowy format pliku JSON!")
+    
+    def iter_items():
+        try:
+            for item in items:
+                if not isinstance(item, dict):
+                    raise ValueError("Nieprawidłowy format pliku JSON!")
+                if not normalized:
+                    item = fix_string_encoding(item)
+                yield _backfill_total(item)
+            if streaming:
+                # Pola zapisane za listą pozycji
+                rest = {}
+                _read_offer_fields(reader, rest, first=False)
+                header.update(rest if normalized else fix_string_encoding(rest))
+        finally:
+            f.close()
+    
+    return header, _ClosingIterator(iter_items(), f)
+
+
+class _ClosingIterator:
+    """
+    Iterator zamykający plik źródłowy po wyczerpaniu, błędzie lub wywołaniu
+    close() - także wtedy, gdy iteracja w ogóle się nie rozpoczęła.
+    """
+    
+    def __init__(self, iterator, source):
+        self._iterator = iterator
+        self._source = source
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+    
+    def close(self):
+        close = getattr(self._iterator, "close", None)
+        if close is not None:
+            close()
+        self._source.close()
+
+
+# Binarny format ofert: nagłówek stałej długości, metadane JSON (data, firma,
+# odbiorca), tabela pozycji ze stałym rozmiarem rekordu i tablica napisów.
+# Liczbę pozycji i sumę można odczytać bez dotykania tabeli pozycji.
+OFFB_EXTENSION = ".offb"
+OFFB_MAGIC = b"OFFB"
+OFFB_VERSION = 1
+
+# magic, wersja, flagi, liczba pozycji, suma, metadane (offset, rozmiar),
+# tabela pozycji (offset), tablica napisów (offset, rozmiar)
+_OFFB_HEADER = struct.Struct("<4sHHIdIIIII")
+# nazwa (offset, długość), dodatkowe pola JSON (offset, długość),
+# ilość, cena jednostkowa, wartość, flagi pozycji
+_OFFB_ITEM = struct.Struct("<IIIIdddB7x")
+
+# Flaga nagłówka: suma pochodzi z pola "total" oferty
+_OFFB_HAS_TOTAL = 0x01
+# Flagi pozycji: liczby całkowite w JSON (przywracane jako int) oraz pozycja
+# spoza schematu zapisana w całości jako JSON
+_OFFB_INT_QUANTITY = 0x01
+_OFFB_INT_PRICE = 0x02
+_OFFB_INT_TOTAL = 0x04
+_OFFB_RAW = 0x08
+
+_OFFB_ITEM_FIELDS = (
+    ("quantity", _OFFB_INT_QUANTITY),
+    ("unit_price", _OFFB_INT_PRICE),
+    ("total", _OFFB_INT_TOTAL),
+)
+
+
+def is_offer_binary(filename):
+    return str(filename).lower().endswith(OFFB_EXTENSION)
+
+
+def _offb_number(value, int_flag):
+    # Zwraca (liczba, flaga) albo None, gdy wartości nie da się bezstratnie
+    # zapisać jako double
+    if isinstance(value, float):
+        return value, 0
+    if isinstance(value, int) and not isinstance(value, bool) and abs(value) <= 2 ** 53:
+        return float(value), int_flag
+    return None
+
+
+def write_offer_binary(filename, offer_data):
+    """
+    Zapisuje ofertę (słownik w schemacie JSON z save_offer_json, z naprawionym
+    kodowaniem) w formacie .offb. Konwersja jest bezstratna - pola spoza
+    schematu trafiają do metadanych lub dodatkowego JSON pozycji.
+    """
+    items = offer_data.get("items")
+    if items is None:
+        items = []
+    if not isinstance(items, list):
+        raise ValueError("Nieprawidłowy format pliku JSON!")
+    
+    meta = {key: value for key, value in offer_data.items()
+            if key not in ("items", NORMALIZED_KEY)}
+    flags = 0
+    total = _offb_number(meta.get("total"), 0)
+    if total is not None:
+        total = total[0]
+        if isinstance(meta["total"], float):
+            flags |= _OFFB_HAS_TOTAL
+            del meta["total"]
+    
+    strings = bytearray()
+    records = bytearray()
+    item_totals = []
+    
+    def add_string(text):
+        data = text.encode("utf-8")
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+    
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("Nieprawidłowy format pliku JSON!")
+        name = item.get("name")
+        numbers = [_offb_number(item.get(key), int_flag) for key, int_flag in _OFFB_ITEM_FIELDS]
+        if isinstance(name, str) and None not in numbers:
+            item_flags = 0
+            for _, int_flag in numbers:
+                item_flags |= int_flag
+            values = [value for value, _ in numbers]
+            extra = {key: value for key, value in item.items()
+                     if key not in OfferItem.FIELDS}
+            name_ref = add_string(name)
+            extra_ref = add_string(json.dumps(extra, ensure_ascii=False)) if extra else (0, 0)
+        else:
+            # Pozycja spoza schematu (np. bez ceny) - zapisana w całości
+            item_flags = _OFFB_RAW
+            values = [0.0, 0.0, numbers[2][0] if numbers[2] else 0.0]
+            name_ref = (0, 0)
+            extra_ref = add_string(json.dumps(item, ensure_ascii=False))
+        records += _OFFB_ITEM.pack(*name_ref, *extra_ref, *values, item_flags)
+        item_totals.append(values[2])
+    
+    if total is None:
+        total = math.fsum(item_totals)
+    meta_data = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    meta_offset = _OFFB_HEADER.size
+    items_offset = meta_offset + len(meta_data)
+    strings_offset = items_offset + len(records)
+    header = _OFFB_HEADER.pack(OFFB_MAGIC, OFFB_VERSION, flags, len(items), total,
+                               meta_offset, len(meta_data), items_offset,
+                               strings_offset, len(strings))
+    
+    # Zapis atomowy - przerwany zapis nie może uszkodzić pliku oferty
+    tmp_file = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(header)
+        f.write(meta_data)
+        f.write(records)
+        f.write(strings)
+    os.replace(tmp_file, filename)
+
+
+class OfferBinaryFile:
+    """
+    Oferta w formacie .offb otwarta przez mmap. Przy otwarciu czytany jest
+    tylko nagłówek i metadane (data, firma, odbiorca, liczba pozycji, suma);
+    pozycje są dekodowane dopiero przy dostępie (iteracja, indeks).
+    """
+    
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Pustego pliku nie da się zmapować
+                raise ValueError("Nieprawidłowy format pliku oferty!") from None
+        try:
+            self._read_header()
+        except BaseException:
+            self._map.close()
+            raise
+    
+    def _read_header(self):
+        size = len(self._map)
+        if size < _OFFB_HEADER.size:
+            raise ValueError("Nieprawidłowy format pliku oferty!")
+        (magic, version, self.flags, self.item_count, self.total, meta_offset, meta_size,
+         self._items_offset, self._strings_offset, strings_size) = _OFFB_HEADER.unpack_from(self._map)
+        if magic != OFFB_MAGIC:
+            raise ValueError("Nieprawidłowy format pliku oferty!")
+        if version > OFFB_VERSION:
+            raise ValueError(f"Nieobsługiwana wersja pliku oferty: {version}")
+        if (meta_offset + meta_size > size
+                or self._items_offset + self.item_count * _OFFB_ITEM.size > size
+                or self._strings_offset + strings_size > size):
+            raise ValueError("Nieprawidłowy format pliku oferty!")
+        self.header = json.loads(self._map[meta_offset:meta_offset + meta_size])
+        if not isinstance(self.header, dict):
+            raise ValueError("Nieprawidłowy format pliku oferty!")
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def close(self):
+        self._map.close()
+    
+    @property
+    def date(self):
+        return self.header.get("date")
+    
+    @property
+    def recipient(self):
+        return self.header.get("recipient") or {}
+    
+    def __len__(self):
+        return self.item_count
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.item_count
+        if not 0 <= index < self.item_count:
+            raise IndexError(index)
+        return self._item(index)
+    
+    def __iter__(self):
+        for index in range(self.item_count):
+            yield self._item(index)
+    
+    def _string(self, offset, size):
+        start = self._strings_offset + offset
+        return self._map[start:start + size].decode("utf-8")
+    
+    def _item(self, index):
+        (name_offset, name_size, extra_offset, extra_size,
+         quantity, unit_price, total, flags) = _OFFB_ITEM.unpack_from(
+            self._map, self._items_offset + index * _OFFB_ITEM.size)
+        extra = json.loads(self._string(extra_offset, extra_size)) if extra_size else None
+        if flags & _OFFB_RAW:
+            return extra
+        item = {
+            "name": self._string(name_offset, name_size),
+            "quantity": int(quantity) if flags & _OFFB_INT_QUANTITY else quantity,
+            "unit_price": int(unit_price) if flags & _OFFB_INT_PRICE else unit_price,
+            "total": int(total) if flags & _OFFB_INT_TOTAL else total
+        }
+        if extra:
+            item.update(extra)
+        return item
+    
+    def to_dict(self, items=True):
+        """
+        Zwraca ofertę w schemacie JSON (items=False - bez listy pozycji).
+        """
+        offer_data = dict(self.header)
+        if items:
+            offer_data["items"] = list(self)
+        if self.flags & _OFFB_HAS_TOTAL:
+            offer_data["total"] = self.total
+        return offer_data
+
+
+def read_offer_summary(filename):
+    """
+    Zwraca (data, nazwa odbiorcy, liczba pozycji, suma) oferty. Z plików .offb
+    czytany jest tylko nagłówek.
+    """
+    if is_offer_binary(filename):
+        with OfferBinaryFile(filename) as offer:
+            return (offer.date or "", offer.recipient.get("name", ""),
+                    offer.item_count, offer.total)
+    offer_data = load_offer_data(filename)
+    items = offer_data.get("items") or []
+    total = offer_data.get("total")
+    if not isinstance(total, (int, float)):
+        total = math.fsum(item.get("total", 0) for item in items)
+    return (offer_data.get("date", ""), (offer_data.get("recipient") or {}).get("name", ""),
+            len(items), total)
+
+
+def parse_offer_date(offer_data):
+    """
+    Zwraca datę oferty zapisaną w pliku (YYYY-MM-DD) lub bieżącą datę.
+    """
+    try:
+        return datetime.strptime(offer_data.get("date", ""), "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return datetime.now()
+
+
+# Wersja układu oferty - zmieniać przy każdej zmianie wyglądu dokumentu
+TEMPLATE_VERSION = 1
+
+# Od tej liczby pozycji oferta jest renderowana w trybie dużych ofert
+LARGE_OFFER_ITEMS = 500
+
+# Domyślny szablon oferty. Własny szablon (plik JSON) może nadpisać dowolne klucze,
+# słowniki są łączone z wartościami domyślnymi.
+DEFAULT_TEMPLATE = {
+    "title": "OFERTA",
+    "validity_days": 30,
+    "currency": "PLN",
+    "margins_mm": {"left": 20, "right": 20, "top": 20, "bottom": 20},
+    "spacing_mm": {"after_title": 10, "after_dates": 5, "after_parties": 8, "column_gap": 10},
+    "font_sizes": {"title": 24, "heading": 14, "normal": 10, "cell": 10, "header": 11},
+    "colors": {
+        "title": "#1a1a1a",
+        "heading": "#2c3e50",
+        "header_background": "#34495e",
+        "header_text": "whitesmoke",
+        "cell_text": "black",
+        "row_background": "white",
+        "row_background_alt": "#f8f9fa",
+        "total_background": "#ecf0f1",
+        "grid": "#bdc3c7",
+        "rule": "#34495e"
+    },
+    "company_heading": "SPRZEDAWCA:",
+    "company_fields": [
+        ["name", "Nazwa:"],
+        ["address", "Adres:"],
+        ["city", "Miasto:"],
+        ["postal_code", "Kod pocztowy:"],
+        ["nip", "NIP:"],
+        ["phone", "Telefon:"],
+        ["email", "Email:"],
+        ["bank_account", "Konto bankowe:"]
+    ],
+    "recipient_heading": "ODBIORCA:",
+    "recipient_fields": [
+        ["name", "Nazwa:"],
+        ["address", "Adres:"],
+        ["city", "Miasto:"],
+        ["postal_code", "Kod pocztowy:"],
+        ["nip", "NIP:"],
+        ["phone", "Telefon:"],
+        ["email", "Email:"]
+    ],
+    "items_heading": "POZYCJE OFERTY:",
+    "item_headers": ["Lp", "Nazwa", "Ilosc", "Cena jedn.", "Wartosc"],
+    "item_column_widths_mm": [15, 80, 25, 30, 30],
+    "total_label": "SUMA:",
+    # Nagłówek firmowy (włączany w danych firmy): minimalna wysokość, największa
+    # szerokość logo i odstęp od logo oraz od treści strony
+    "letterhead_mm": {"height": 20, "logo_width": 40, "gap": 6}
+}
+
+
+def load_template_settings(path):
+    """
+    Wczytuje szablon oferty z pliku JSON i łączy go z szablonem domyślnym.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        custom = json.load(f)
+    if not isinstance(custom, dict):
+        raise ValueError("Nieprawidłowy format pliku szablonu!")
+    
+    settings = json.loads(json.dumps(DEFAULT_TEMPLATE))
+    for key, value in fix_string_encoding(custom).items():
+        if isinstance(settings.get(key), dict) and isinstance(value, dict):
+            settings[key].update(value)
+        else:
+            settings[key] = value
+    if len(settings["item_headers"]) != 5 or len(settings["item_column_widths_mm"]) != 5:
+        raise ValueError("Szablon musi definiować 5 kolumn tabeli pozycji!")
+    return settings
+
+
+class OfferTemplate:
+    """
+    Skompilowany układ oferty: style, szerokości kolumn, style tabel i listy pól.
+    Kompilowany raz (dla zarejestrowanych fontów) i używany przy każdym renderowaniu.
+    """
+    
+    def __init__(self, settings=None, source=None):
+        self.settings = settings or DEFAULT_TEMPLATE
+        self.source = source
+        self.title = self.settings["title"]
+        self.validity_days = self.settings["validity_days"]
+        self.currency = self.settings["currency"]
+        self.company_heading = self.settings["company_heading"]
+        self.recipient_heading = self.settings["recipient_heading"]
+        self.items_heading = self.settings["items_heading"]
+        self.total_label = self.settings["total_label"]
+        self.company_fields = [tuple(field) for field in self.settings["company_fields"]]
+        self.recipient_fields = [tuple(field) for field in self.settings["recipient_fields"]]
+        self.item_headers = list(self.settings["item_headers"])
+        self._compiled_fonts = None
+    
+    def compile(self):
+        """
+        Buduje obiekty reportlab dla bieżących fontów (tylko przy pierwszym użyciu).
+        """
+        load_reportlab()
+        fonts = get_unicode_fonts()
+        if self._compiled_fonts == fonts:
+            return self
+        font_name, font_bold = fonts
+        
+        margins = self.settings["margins_mm"]
+        spacing = self.settings["spacing_mm"]
+        sizes = self.settings["font_sizes"]
+        palette = {key: colors.toColor(value) for key, value in self.settings["colors"].items()}
+        
+        self.page_margins = {
+            "leftMargin": margins["left"]*mm,
+            "rightMargin": margins["right"]*mm,
+            "topMargin": margins["top"]*mm,
+            "bottomMargin": margins["bottom"]*mm
+        }
+        self.after_title = spacing["after_title"]*mm
+        self.after_dates = spacing["after_dates"]*mm
+        self.after_parties = spacing["after_parties"]*mm
+        letterhead = self.settings["letterhead_mm"]
+        self.letterhead_height = letterhead["height"]*mm
+        self.letterhead_logo_width = letterhead["logo_width"]*mm
+        self.letterhead_gap = letterhead["gap"]*mm
+        self.rule_color = palette["rule"]
+        
+        # Style z fontami obsługującymi polskie znaki
+        styles = getSampleStyleSheet()
+        
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontName=font_bold,
+            fontSize=sizes["title"],
+            textColor=palette["title"],
+            spaceAfter=30,
+            alignment=TA_CENTER
+        )
+        
+        self.heading_style = ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontName=font_bold,
+            fontSize=sizes["heading"],
+            textColor=palette["heading"],
+            spaceAfter=12,
+            spaceBefore=12
+        )
+        
+        self.normal_style = ParagraphStyle(
+            'CustomNormal',
+            parent=styles['Normal'],
+            fontName=font_name,
+            fontSize=sizes["normal"]
+        )
+        
+        self.letterhead_name_style = ParagraphStyle(
+            'LetterheadName',
+            parent=self.normal_style,
+            fontName=font_bold,
+            fontSize=sizes["heading"],
+            leading=sizes["heading"] + 4,
+            textColor=palette["heading"]
+        )
+        
+        # Style dla komórek tabeli
+        self.cell_style = ParagraphStyle(
+            'TableCell',
+            parent=self.normal_style,
+            fontName=font_name,
+            fontSize=sizes["cell"],
+            leading=sizes["cell"] + 2,
+            textColor=palette["cell_text"]
+        )
+        
+        self.cell_style_bold = ParagraphStyle(
+            'TableCellBold',
+            parent=self.normal_style,
+            fontName=font_bold,
+            fontSize=sizes["cell"],
+            leading=sizes["cell"] + 2,
+            textColor=palette["cell_text"]
+        )
+        
+        # Styl dla nagłówka tabeli (biały tekst)
+        self.header_cell_style = ParagraphStyle(
+            'TableHeader',
+            parent=self.normal_style,
+            fontName=font_bold,
+            fontSize=sizes["header"],
+            leading=sizes["header"] + 2,
+            textColor=palette["header_text"]
+        )
+        
+        # Dwie kolumny (sprzedawca po lewej, odbiorca po prawej)
+        page_width = A4[0] - (margins["left"] + margins["right"])*mm
+        self.page_width = page_width
+        col_width = (page_width - spacing["column_gap"]*mm) / 2
+        self.party_col_widths = [col_width, col_width]
+        half_gap = spacing["column_gap"]*mm / 2
+        self.party_table_style = TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LEFTPADDING', (0, 0), (0, -1), 0),
+            ('RIGHTPADDING', (0, 0), (0, -1), half_gap),
+            ('LEFTPADDING', (1, 0), (1, -1), half_gap),
+            ('RIGHTPADDING', (1, 0), (1, -1), 0),
+            ('TOPPADDING', (0, 0), (-1, -1), 2),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ])
+        
+        self.item_col_widths = [width*mm for width in self.settings["item_column_widths_mm"]]
+        self.items_table_style = TableStyle([
+            # Nagłówek
+            ('BACKGROUND', (0, 0), (-1, 0), palette["header_background"]),
+            ('TEXTCOLOR', (0, 0), (-1, 0), palette["header_text"]),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            # Uwaga: FONTNAME i FONTSIZE są ignorowane gdy używamy Paragraph,
+            # fonty są określone w ParagraphStyle
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('TOPPADDING', (0, 0), (-1, 0), 12),
+            
+            # Wiersze danych
+            ('VALIGN', (0, 1), (-1, -2), 'MIDDLE'),
+            ('BOTTOMPADDING', (0, 1), (-1, -2), 8),
+            ('TOPPADDING', (0, 1), (-1, -2), 8),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -2),
+             [palette["row_background"], palette["row_background_alt"]]),
+            
+            # Wiersz sumy
+            ('VALIGN', (0, -1), (-1, -1), 'MIDDLE'),
+            ('BACKGROUND', (0, -1), (-1, -1), palette["total_background"]),
+            ('BOTTOMPADDING', (0, -1), (-1, -1), 10),
+            ('TOPPADDING', (0, -1), (-1, -1), 10),
+            
+            # Obramowanie
+            ('GRID', (0, 0), (-1, -1), 1, palette["grid"]),
+            ('LINEBELOW', (0, 0), (-1, 0), 2, palette["rule"]),
+            ('LINEABOVE', (0, -1), (-1, -1), 2, palette["rule"]),
+        ])
+        
+        # Tryb dużych ofert: komórki bez zawijania jako zwykłe teksty, więc font
+        # i kolor wierszy danych muszą być ustawione w stylu tabeli. Tło wierszy
+        # (ROWBACKGROUNDS) jest dodawane osobno dla każdej strony.
+        self.large_row_backgrounds = [palette["row_background"], palette["row_background_alt"]]
+        header_commands = [
+            ('BACKGROUND', (0, 0), (-1, 0), palette["header_background"]),
+            ('TEXTCOLOR', (0, 0), (-1, 0), palette["header_text"]),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('TOPPADDING', (0, 0), (-1, 0), 12),
+            ('FONTNAME', (0, 1), (-1, -1), font_name),
+            ('FONTSIZE', (0, 1), (-1, -1), sizes["cell"]),
+            ('LEADING', (0, 1), (-1, -1), sizes["cell"] + 2),
+            ('TEXTCOLOR', (0, 1), (-1, -1), palette["cell_text"]),
+            ('GRID', (0, 0), (-1, -1), 1, palette["grid"]),
+            ('LINEBELOW', (0, 0), (-1, 0), 2, palette["rule"]),
+        ]
+        self.large_page_style = TableStyle(header_commands + [
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+            ('TOPPADDING', (0, 1), (-1, -1), 8),
+        ])
+        self.large_last_page_style = TableStyle(header_commands + [
+            ('BOTTOMPADDING', (0, 1), (-1, -2), 8),
+            ('TOPPADDING', (0, 1), (-1, -2), 8),
+            ('BACKGROUND', (0, -1), (-1, -1), palette["total_background"]),
+            ('BOTTOMPADDING', (0, -1), (-1, -1), 10),
+            ('TOPPADDING', (0, -1), (-1, -1), 10),
+            ('LINEABOVE', (0, -1), (-1, -1), 2, palette["rule"]),
+        ])
+        # Wysokości wierszy liczone z góry (wiersz = treść + marginesy z ww. stylów)
+        self.row_text_height = sizes["cell"] + 2
+        self.row_padding = 16
+        self.total_padding = 20
+        # Szerokości tekstu w komórkach bez domyślnych marginesów (2 x 6 pt)
+        self.item_text_widths = [width - 12 for width in self.item_col_widths]
+        
+        # Elementy wspólne dla wszystkich ofert
+        # Nagłówek tabeli - użyj Paragraph dla lepszej obsługi Unicode
+        self.items_header_row = [Paragraph(text, self.header_cell_style)
+                                 for text in self.item_headers]
+        self.title_cell = CachedParagraph(self.title, self.title_style)
+        self.empty_cell = Paragraph('', self.normal_style)
+        self.empty_table_cell = Paragraph('', self.cell_style)
+        self.total_label_cell = Paragraph(f'<b>{self.total_label}</b>', self.cell_style_bold)
+        self.company_heading_cell = Paragraph(f"<b>{self.company_heading}</b>", self.heading_style)
+        self.recipient_heading_cell = Paragraph(f"<b>{self.recipient_heading}</b>", self.heading_style)
+        self.items_heading_cell = Paragraph(f"<b>{self.items_heading}</b>", self.heading_style)
+        self.items_header_height = max(
+            cell.wrap(width, A4[1])[1]
+            for cell, width in zip(self.items_header_row, self.item_text_widths)) + 24
+        
+        self._compiled_fonts = fonts
+        return self
+
+
+_template_cache = {}
+_default_template_path = os.environ.get("OFFER_TEMPLATE") or None
+
+
+def set_default_template(path):
+    """
+    Ustawia plik szablonu używany domyślnie (None - szablon wbudowany).
+    """
+    global _default_template_path
+    if path:
+        # Sprawdź szablon od razu, żeby błąd był zgłoszony przy wyborze pliku
+        get_offer_template(path)
+    _default_template_path = path or None
+
+
+def get_offer_template(path=None):
+    """
+    Zwraca szablon oferty z pamięci podręcznej procesu (wczytuje przy pierwszym użyciu
+    lub po zmianie pliku szablonu).
+    """
+    path = path or _default_template_path
+    if not path:
+        key = None
+    else:
+        path = os.path.abspath(path)
+        key = (path, os.path.getmtime(path))
+    template = _template_cache.get(key)
+    if template is None:
+        settings = load_template_settings(path) if path else None
+        template = _template_cache[key] = OfferTemplate(settings, path)
+    return template
+
+
+def init_render_worker(font_dirs=(), template_path=None, warm=True):
+    """
+    Konfiguruje fonty i szablon w procesie renderującym. Z warm=True od razu
+    rejestruje fonty i kompiluje szablon, żeby pierwsza oferta nie płaciła za start.
+    """
+    configure_fonts(font_dirs)
+    set_default_template(template_path)
+    if warm and load_reportlab():
+        get_offer_template().compile()
+
+
+# Szerokość kolumny nazwy w ofercie TXT (dłuższe nazwy są zawijane)
+TXT_NAME_WIDTH = 40
+
+# Liczba wierszy TXT zapisywanych jednym wywołaniem write()
+TXT_CHUNK_LINES = 2048
+
+
+def iter_offer_txt(company_data, recipient, items, offer_date=None, template=None,
+                   progress=None):
+    """
+    Generator wierszy oferty w formacie tekstowym (każdy zakończony znakiem nowej
+    linii). progress(ułamek) jest wywoływane co PROGRESS_STEP pozycji (wyjątek
+    z progress przerywa generowanie).
+    """
+    if offer_date is None:
+        offer_date = datetime.now()
+    if template is None:
+        template = get_offer_template()
+    currency = template.currency
+    
+    # Nagłówek
+    yield "=" * 80 + "\n"
+    yield f"{template.title}\n"
+    yield "=" * 80 + "\n\n"
+    
+    # Data
+    valid_until = offer_date + timedelta(days=template.validity_days)
+    yield f"Data: {offer_date.strftime('%d.%m.%Y')}\n"
+    yield f"Oferta ważna do: {valid_until.strftime('%d.%m.%Y')}\n\n"
+    
+    # Dane firmy
+    yield f"{template.company_heading}\n"
+    yield "-" * 80 + "\n"
+    for key, label in template.company_fields:
+        if company_data.get(key):
+            yield f"{label} {company_data[key]}\n"
+    yield "\n"
+    
+    # Dane odbiorcy
+    yield f"{template.recipient_heading}\n"
+    yield "-" * 80 + "\n"
+    for key, label in template.recipient_fields:
+        if recipient.get(key):
+            yield f"{label} {recipient[key]}\n"
+    yield "\n"
+    
+    # Pozycje oferty
+    yield f"{template.items_heading}\n"
+    yield "-" * 80 + "\n"
+    yield f"{'Lp':<5} {'Nazwa':<{TXT_NAME_WIDTH}} {'Ilość':>10} {'Cena':>12} {'Wartość':>12}\n"
+    yield "-" * 80 + "\n"
+    
+    total = 0
+    count = len(items)
+    for i, item in enumerate(items, 1):
+        name = item['name']
+        # Długie nazwy zawijane są w kolumnie nazwy (kolejne wiersze bez liczb)
+        lines = [name]
+        if len(name) > TXT_NAME_WIDTH:
+            lines = textwrap.wrap(name, TXT_NAME_WIDTH) or [""]
+        yield (f"{i:<5} {lines[0]:<{TXT_NAME_WIDTH}} {item['quantity']:>10.2f} "
+               f"{item['unit_price']:>12.2f} {currency} {item['total']:>12.2f} {currency}\n")
+        for line in lines[1:]:
+            yield f"{'':<5} {line}\n"
+        total += item['total']
+        if progress and i % PROGRESS_STEP == 0:
+            progress(i / count)
+    
+    yield "-" * 80 + "\n"
+    yield f"{template.total_label:<57} {total:>12.2f} {currency}\n"
+    yield "=" * 80 + "\n"
+
+
+def write_lines(sink, lines, chunk_lines=TXT_CHUNK_LINES):
+    """
+    Zapisuje wiersze do dowolnego obiektu plikowego (plik, stdout, StringIO)
+    paczkami po chunk_lines wierszy. Zwraca liczbę zapisanych wierszy.
+    """
+    lines = iter(lines)
+    written = 0
+    while True:
+        chunk = list(itertools.islice(lines, chunk_lines))
+        if not chunk:
+            return written
+        sink.write("".join(chunk))
+        written += len(chunk)
+
+
+def write_offer_txt(filename, company_data, recipient, items, offer_date=None, template=None,
+                    progress=None):
+    """
+    Zapisuje ofertę w formacie tekstowym (patrz iter_offer_txt).
+    """
+    with tracer.span("txt.write", items=len(items)) as span, \
+            open(filename, "w", encoding="utf-8") as f:
+        write_lines(f, iter_offer_txt(company_data, recipient, items, offer_date, template,
+                                      progress))
+        span["bytes"] = f.tell()
+
+
+class _CachedWrap:
+    """
+    Paragraph zapamiętujący wynik łamania wierszy dla każdej szerokości.
+    Komórka tabeli pozycji jest łamana raz, a nie przy każdym liczeniu
+    wysokości, podziale i rysowaniu tabeli - ani w każdym kolejnym dokumencie
+    z tą samą tabelą (OfferItemsBlock). Klasa CachedParagraph (z bazą
+    Paragraph) powstaje w load_reportlab.
+    """
+    
+    _WRAP_STATE = ("width", "height", "_wrapWidths", "blPara")
+    
+    def wrap(self, availWidth, availHeight):
+        cache = self.__dict__.setdefault("_wrap_cache", {})
+        cached = cache.get(availWidth)
+        if cached is None:
+            size = super().wrap(availWidth, availHeight)
+            state = {key: self.__dict__[key] for key in self._WRAP_STATE if key in self.__dict__}
+            cache[availWidth] = size, state
+            return size
+        size, state = cached
+        self.__dict__.update(state)
+        return size
+
+
+class _PagedItemsTable:
+    """
+    Tabela pozycji dużej oferty dzielona na strony z powtarzanym nagłówkiem.
+    Wysokości wierszy są liczone raz; przy podziale powstaje tylko tabela bieżącej
+    strony (Table.split przelicza wszystkie pozostałe wiersze przy każdej stronie).
+    Klasa PagedItemsTable (z bazą Flowable) powstaje w load_reportlab.
+    """
+    
+    def __init__(self, layout, rows, heights, total_row, total_height, start=0, offsets=None,
+                 progress=None):
+        super().__init__()
+        self.layout = layout
+        # progress(ułamek) - postęp układania stron (od 0.5 do 1.0)
+        self.progress = progress
+        self.rows = rows
+        self.heights = heights
+        self.total_row = total_row
+        self.total_height = total_height
+        self.start = start
+        self.offsets = offsets if offsets is not None else [0] + list(accumulate(heights))
+        self.width = sum(layout.item_col_widths)
+        # Wyrównanie jak w Table (tabela pozycji jest szersza niż ramka strony)
+        self.hAlign = 'CENTER'
+    
+    def wrap(self, availWidth, availHeight):
+        rows_height = self.offsets[-1] - self.offsets[self.start]
+        self.height = self.layout.items_header_height + rows_height + self.total_height
+        return self.width, self.height
+    
+    def split(self, availWidth, availHeight):
+        end = len(self.rows)
+        room = availHeight - self.layout.items_header_height
+        stop = bisect.bisect_right(self.offsets, self.offsets[self.start] + room,
+                                   self.start, end + 1) - 1
+        if stop >= end:
+            # Wiersze się mieszczą, ale suma nie - ostatnia pozycja idzie z sumą dalej
+            stop = end - 1
+        if stop <= self.start:
+            return []
+        if self.progress:
+            self.progress(0.5 + 0.5 * stop / end)
+        return [self._page_table(self.start, stop, last=False),
+                PagedItemsTable(self.layout, self.rows, self.heights, self.total_row,
+                                self.total_height, stop, self.offsets, self.progress)]
+    
+    def draw(self):
+        table = self._page_table(self.start, len(self.rows), last=True)
+        table.wrapOn(self.canv, self.width, self.height)
+        table.drawOn(self.canv, 0, 0)
+    
+    def _page_table(self, start, stop, last):
+        layout = self.layout
+        data = [layout.items_header_row] + self.rows[start:stop]
+        heights = [layout.items_header_height] + self.heights[start:stop]
+        if last:
+            data.append(self.total_row)
+            heights.append(self.total_height)
+        table = Table(data, colWidths=layout.item_col_widths, rowHeights=heights)
+        table.setStyle(layout.large_last_page_style if last else layout.large_page_style)
+        # Naprzemienne tło kontynuowane między stronami
+        backgrounds = layout.large_row_backgrounds
+        if start % 2:
+            backgrounds = backgrounds[::-1]
+        table.setStyle([('ROWBACKGROUNDS', (0, 1), (-1, -2 if last else -1), backgrounds)])
+        return table
+
+
+def _large_offer_rows(items, layout, progress=None):
+    """
+    Wiersze tabeli pozycji dla dużych ofert: zwykłe teksty, a Paragraph tylko tam,
+    gdzie tekst trzeba zawinąć lub zawiera znaczniki. Zwraca (wiersze, wysokości, suma).
+    """
+    cell_style = layout.cell_style
+    currency = layout.currency
+    font_name = cell_style.fontName
+    font_size = cell_style.fontSize
+    text_widths = layout.item_text_widths
+    plain_height = layout.row_text_height
+    padding = layout.row_padding
+    string_width = pdfmetrics.stringWidth
+    
+    rows = []
+    heights = []
+    total = 0
+    for i, item in enumerate(items, 1):
+        row = [
+            str(i),
+            item['name'],
+            f"{item['quantity']:.2f}",
+            f"{item['unit_price']:.2f} {currency}",
+            f"{item['total']:.2f} {currency}"
+        ]
+        height = plain_height
+        for col in range(1, 5):
+            text = row[col]
+            if ('<' in text or '&' in text
+                    or string_width(text, font_name, font_size) > text_widths[col]):
+                cell = row[col] = CachedParagraph(text, cell_style)
+                height = max(height, cell.wrap(text_widths[col], A4[1])[1])
+        rows.append(row)
+        heights.append(height + padding)
+        total += item['total']
+        if progress and i % PROGRESS_STEP == 0:
+            progress(0.5 * i / len(items))
+    return rows, heights, total
+
+
+class OfferItemsBlock:
+    """
+    Tabela pozycji oferty zbudowana raz (komórki Paragraph, wysokości wierszy,
+    suma) do użycia w wielu dokumentach - np. ta sama lista pozycji dla wielu
+    odbiorców. flowable() zwraca nową tabelę dla kolejnego dokumentu.
+    """
+    
+    def __init__(self, layout, items, large=None, progress=None):
+        cell_style = layout.cell_style
+        currency = layout.currency
+        self.layout = layout
+        self.item_count = len(items)
+        if large is None:
+            large = len(items) >= LARGE_OFFER_ITEMS
+        self.large = large
+        
+        if large:
+            self.rows, self.heights, total = _large_offer_rows(items, layout, progress)
+            self.offsets = [0] + list(accumulate(self.heights))
+        else:
+            rows = [layout.items_header_row]
+            total = 0
+            for i, item in enumerate(items, 1):
+                # Użyj Paragraph dla nazwy (może zawierać polskie znaki)
+                # Dla pozostałych pól też użyj Paragraph dla spójności
+                rows.append([
+                    CachedParagraph(str(i), cell_style),
+                    CachedParagraph(item['name'], cell_style),  # To jest kluczowe - nazwa może mieć polskie znaki
+                    CachedParagraph(f"{item['quantity']:.2f}", cell_style),
+                    CachedParagraph(f"{item['unit_price']:.2f} {currency}", cell_style),
+                    CachedParagraph(f"{item['total']:.2f} {currency}", cell_style)
+                ])
+                total += item['total']
+            self.rows = rows
+        self.total = total
+        
+        # Wiersz sumy
+        empty = layout.empty_table_cell
+        self.total_row = [
+            empty,
+            empty,
+            empty,
+            layout.total_label_cell,
+            CachedParagraph(f'<b>{total:.2f} {currency}</b>', layout.cell_style_bold)
+        ]
+        if large:
+            total_height = max(cell.wrap(width, A4[1])[1]
+                               for cell, width in zip(self.total_row[3:], layout.item_text_widths[3:]))
+            self.total_height = total_height + layout.total_padding
+    
+    def flowable(self, progress=None):
+        layout = self.layout
+        if self.large:
+            return PagedItemsTable(layout, self.rows, self.heights, self.total_row,
+                                   self.total_height, offsets=self.offsets, progress=progress)
+        table = Table(self.rows + [self.total_row], colWidths=layout.item_col_widths)
+        table.setStyle(layout.items_table_style)
+        return table
+
+
+# Nazwa obiektu formularza PDF z nagłówkiem firmowym
+LETTERHEAD_FORM = "Letterhead"
+
+# Liczba przygotowanych nagłówków firmowych trzymanych w pamięci procesu
+LETTERHEAD_CACHE_SIZE = 8
+
+# Rozdzielczość logo w nagłówku - większe obrazy są raz zmniejszane, bo obraz
+# jest kodowany od nowa w każdym pliku PDF
+LETTERHEAD_LOGO_DPI = 300
+
+
+def letterhead_logo_signature(company_data):
+    """
+    Zwraca [ścieżka, czas modyfikacji, rozmiar] pliku logo nagłówka firmowego
+    (None, gdy nagłówek jest wyłączony lub nie ma logo) - podmiana pliku logo
+    zmienia wynik renderowania.
+    """
+    logo = company_data.get("logo") if company_data.get("letterhead") else None
+    if not logo:
+        return None
+    path = os.path.abspath(logo)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        # Błąd zgłosi dopiero wczytanie logo przy renderowaniu
+        return [path, None, None]
+    return [path, stat.st_mtime, stat.st_size]
+
+
+class Letterhead:
+    """
+    Dane sprzedawcy przygotowane raz dla firmy i układu: komórki kolumny
+    SPRZEDAWCA oraz - gdy company_data["letterhead"] jest włączone - nagłówek
+    firmowy (logo, nazwa i dane firmy) nad treścią każdej strony. Nagłówek jest
+    rysowany raz na dokument jako obiekt formularza PDF i wstawiany na kolejnych
+    stronach przez doForm.
+    """
+    
+    def __init__(self, layout, company_data):
+        self.layout = layout
+        self.company_cells = [layout.company_heading_cell]
+        for key, label in layout.company_fields:
+            value = company_data.get(key, "")
+            if value:
+                self.company_cells.append(CachedParagraph(f"<b>{label}</b> {value}", layout.normal_style))
+        self.enabled = bool(company_data.get("letterhead"))
+        self.height = 0
+        if self.enabled:
+            self._prepare(company_data)
+    
+    def _prepare(self, company_data):
+        layout = self.layout
+        self.logo = None
+        self.text_x = 0
+        logo_height = 0
+        logo = company_data.get("logo")
+        if logo:
+            try:
+                image_width, image_height = ImageReader(logo).getSize()
+                scale = min(layout.letterhead_logo_width / image_width,
+                            layout.letterhead_height / image_height)
+                self.logo_size = (image_width * scale, image_height * scale)
+                self.logo = ImageReader(self._scaled_logo(logo))
+            except Exception as e:
+                raise ValueError(f"Nie można wczytać logo: {logo}") from e
+            logo_height = self.logo_size[1]
+            self.text_x = self.logo_size[0] + layout.letterhead_gap
+        
+        # Nazwa firmy, a pod nią adres i dane kontaktowe
+        labels = dict(layout.company_fields)
+        city = " ".join(company_data.get(key, "") for key in ("postal_code", "city")).strip()
+        lines = [line for line in (company_data.get("address", ""), city) if line]
+        contact = [f"{labels.get(key, '')} {company_data[key]}".strip()
+                   for key in ("nip", "phone", "email") if company_data.get(key)]
+        if contact:
+            lines.append(" | ".join(contact))
+        self.name_cell = CachedParagraph(company_data.get("name", ""), layout.letterhead_name_style)
+        self.details_cell = CachedParagraph("<br/>".join(lines), layout.normal_style)
+        
+        text_width = layout.page_width - self.text_x
+        self.name_height = self.name_cell.wrap(text_width, A4[1])[1]
+        self.details_height = self.details_cell.wrap(text_width, A4[1])[1]
+        self.height = max(layout.letterhead_height, logo_height,
+                          self.name_height + self.details_height)
+    
+    def _scaled_logo(self, logo):
+        # Obraz zmniejszony do LETTERHEAD_LOGO_DPI przy wymiarach w nagłówku
+        # (bez Pillow - oryginalny plik)
+        try:
+            from PIL import Image
+        except ImportError:
+            return logo
+        image = Image.open(logo)
+        image.load()
+        image.thumbnail([round(size / 72 * LETTERHEAD_LOGO_DPI) for size in self.logo_size])
+        return image
+    
+    def page_margins(self):
+        """
+        Marginesy strony z miejscem na nagłówek firmowy.
+        """
+        margins = dict(self.layout.page_margins)
+        if self.enabled:
+            margins["topMargin"] += self.height + self.layout.letterhead_gap
+        return margins
+    
+    def draw(self, canvas, doc):
+        """
+        Wstawia nagłówek na stronę (funkcja stron SimpleDocTemplate.build).
+        Formularz jest rysowany przy pierwszej stronie dokumentu.
+        """
+        if not canvas.hasForm(LETTERHEAD_FORM):
+            canvas.beginForm(LETTERHEAD_FORM)
+            self._draw_form(canvas)
+            canvas.endForm()
+        canvas.doForm(LETTERHEAD_FORM)
+    
+    def _draw_form(self, canvas):
+        layout = self.layout
+        left = layout.page_margins["leftMargin"]
+        top = A4[1] - layout.page_margins["topMargin"]
+        if self.logo is not None:
+            width, height = self.logo_size
+            canvas.drawImage(self.logo, left, top - height, width, height, mask="auto")
+        text_left = left + self.text_x
+        self.name_cell.drawOn(canvas, text_left, top - self.name_height)
+        self.details_cell.drawOn(canvas, text_left, top - self.name_height - self.details_height)
+        canvas.setStrokeColor(layout.rule_color)
+        canvas.setLineWidth(1)
+        canvas.line(left, top - self.height, left + layout.page_width, top - self.height)
+
+
+_letterhead_cache = collections.OrderedDict()
+_letterhead_lock = threading.Lock()
+
+
+def get_letterhead(layout, company_data):
+    """
+    Zwraca przygotowany nagłówek firmowy z pamięci podręcznej procesu (kluczem
+    są dane firmy, plik logo i skompilowany układ).
+    """
+    key = (layout, layout._compiled_fonts,
+           json.dumps(dict(company_data), sort_keys=True, ensure_ascii=False, default=str),
+           json.dumps(letterhead_logo_signature(company_data)))
+    with _letterhead_lock:
+        letterhead = _letterhead_cache.get(key)
+        if letterhead is not None:
+            _letterhead_cache.move_to_end(key)
+            return letterhead
+    with tracer.span("pdf.letterhead"):
+        letterhead = Letterhead(layout, company_data)
+    with _letterhead_lock:
+        _letterhead_cache[key] = letterhead
+        while len(_letterhead_cache) > LETTERHEAD_CACHE_SIZE:
+            _letterhead_cache.popitem(last=False)
+    return letterhead
+
+
+def clear_letterheads():
+    """
+    Usuwa przygotowane nagłówki firmowe (po zmianie danych firmy).
+    """
+    with _letterhead_lock:
+        _letterhead_cache.clear()
+
+
+def build_offer_pdf(filename, company_data, recipient, items, offer_date=None, template=None,
+                    large=None, progress=None, items_block=None):
+    """
+    Generuje ofertę PDF. Wspólny układ dla interfejsu i trybu wsadowego.
+    Dla dużych ofert (large=None - od LARGE_OFFER_ITEMS pozycji) tabela pozycji
+    dzieli się na strony z powtarzanym nagłówkiem. progress(ułamek) zgłasza
+    postęp (wyjątek z progress przerywa generowanie przed zapisem pliku).
+    items_block - gotowa tabela pozycji (OfferItemsBlock) zamiast budowania
+    jej z items, np. przy korespondencji seryjnej.
+    """
+    if not load_reportlab():
+        raise RuntimeError("Biblioteka reportlab nie jest zainstalowana!")
+    if offer_date is None:
+        offer_date = datetime.now()
+    # Style i tabele są kompilowane raz na proces
+    layout = (template or get_offer_template()).compile()
+    normal_style = layout.normal_style
+    # Dane sprzedawcy i nagłówek firmowy są przygotowywane raz dla firmy
+    letterhead = get_letterhead(layout, company_data)
+    
+    # Utwórz dokument PDF. W trybie invariant identyfikator dokumentu jest skrótem
+    # metadanych (tytuł, sprzedawca, odbiorca i data oferty), a data utworzenia
+    # pochodzi z oferty - ta sama oferta daje zawsze identyczny plik (RenderCache)
+    doc = SimpleDocTemplate(
+        filename, pagesize=A4, invariant=1, title=layout.title,
+        author=str(company_data.get("name", "")),
+        subject=f"{recipient.get('name', '')} {offer_date.strftime('%Y-%m-%d')}",
+        **letterhead.page_margins())
+    creation_date = offer_date.strftime("D:%Y%m%d000000+00'00'")
+    
+    def set_creation_date(canvas, doc):
+        canvas.setDateFormatter(lambda *timestamp: creation_date)
+        if letterhead.enabled:
+            letterhead.draw(canvas, doc)
+    
+    page_callbacks = {"onFirstPage": set_creation_date}
+    if letterhead.enabled:
+        page_callbacks["onLaterPages"] = letterhead.draw
+    
+    # Kontener na elementy
+    story_span = tracer.span("pdf.story", items=len(items))
+    story = []
+    
+    # Tytuł
+    story.append(layout.title_cell)
+    story.append(Spacer(1, layout.after_title))
+    
+    # Data
+    valid_until = offer_date + timedelta(days=layout.validity_days)
+    date_text = f"Data: {offer_date.strftime('%d.%m.%Y')}"
+    valid_until_text = f"Oferta wazna do: {valid_until.strftime('%d.%m.%Y')}"
+    story.append(Paragraph(date_text, normal_style))
+    story.append(Paragraph(valid_until_text, normal_style))
+    story.append(Spacer(1, layout.after_dates))
+    
+    # Dane sprzedawcy jako tekst
+    company_text_parts = letterhead.company_cells
+    
+    # Przygotuj dane odbiorcy jako tekst
+    recipient_text_parts = [layout.recipient_heading_cell]
+    for key, label in layout.recipient_fields:
+        value = recipient.get(key, "")
+        if value:
+            recipient_text_parts.append(Paragraph(f"<b>{label}</b> {value}", normal_style))
+    
+    # Utwórz tabelę z dwiema kolumnami (sprzedawca po lewej, odbiorca po prawej)
+    max_rows = max(len(company_text_parts), len(recipient_text_parts))
+    side_by_side_data = []
+    for i in range(max_rows):
+        left_cell = company_text_parts[i] if i < len(company_text_parts) else layout.empty_cell
+        right_cell = recipient_text_parts[i] if i < len(recipient_text_parts) else layout.empty_cell
+        side_by_side_data.append([left_cell, right_cell])
+    
+    side_by_side_table = Table(side_by_side_data, colWidths=layout.party_col_widths)
+    side_by_side_table.setStyle(layout.party_table_style)
+    story.append(side_by_side_table)
+    
+    story.append(Spacer(1, layout.after_parties))
+    
+    # Pozycje oferty
+    story.append(layout.items_heading_cell)
+    if items_block is None:
+        items_block = OfferItemsBlock(layout, items, large, progress)
+    story.append(items_block.flowable(progress))
+    story_span.end()
+    if progress:
+        progress(0.5)
+    
+    # Generuj PDF
+    with tracer.span("pdf.build", items=len(items)) as span:
+        doc.build(story, **page_callbacks)
+        span["bytes"] = os.path.getsize(filename)
+
+
+# Co ile pozycji renderery zgłaszają postęp (i sprawdzają anulowanie)
+PROGRESS_STEP = 256
+
+
+class RenderCancelled(Exception):
+    """
+    Renderowanie przerwane na żądanie użytkownika.
+    """
+
+
+OfferSnapshot = collections.namedtuple(
+    "OfferSnapshot", ["company", "recipient", "items", "offer_date", "template"])
+
+
+def snapshot_offer(company_data, recipient, items, offer_date=None, template=None):
+    """
+    Zwraca niezmienną kopię danych oferty do renderowania w tle - dalsza edycja
+    oferty w interfejsie nie wpływa na generowany plik.
+    """
+    return OfferSnapshot(
+        types.MappingProxyType(dict(company_data)),
+        types.MappingProxyType(dict(recipient)),
+        tuple(types.MappingProxyType(dict(item.to_dict() if isinstance(item, OfferItem) else item))
+              for item in items),
+        offer_date or datetime.now(),
+        template or get_offer_template())
+
+
+def offer_snapshot_from_data(offer_data, template=None):
+    """
+    Tworzy migawkę oferty z danych wczytanych przez load_offer_data.
+    Zgłasza ValueError, jeśli brakuje odbiorcy lub pozycji.
+    """
+    recipient = offer_data.get("recipient")
+    if not recipient:
+        raise ValueError("Plik nie zawiera danych odbiorcy!")
+    items = offer_data.get("items")
+    if not items:
+        raise ValueError("Plik nie zawiera pozycji oferty!")
+    return snapshot_offer(offer_data.get("company") or {}, recipient, items,
+                          parse_offer_date(offer_data), template)
+
+
+RENDER_CACHE_DIR = os.path.join(user_cache_dir(), "render_cache")
+
+# Domyślny limit rozmiaru pamięci podręcznej wygenerowanych plików
+RENDER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class RenderCache:
+    """
+    Pamięć podręczna wygenerowanych plików na dysku, adresowana skrótem treści
+    oferty, szablonu i fontów. Identyczne renderowanie jest obsługiwane kopią
+    pliku. Po przekroczeniu limitu rozmiaru usuwane są najdawniej używane pliki
+    (trafienie odświeża czas modyfikacji pliku).
+    """
+    
+    def __init__(self, directory=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Przybliżony rozmiar (liczony przy pierwszym zapisie, potem zwiększany)
+        self._size = None
+    
+    def key(self, snapshot, kind, shared_key=None):
+        """
+        Zwraca skrót SHA-256 wszystkiego, od czego zależy wynik renderowania:
+        skrótu części wspólnej (shared_key) i danych odbiorcy.
+        """
+        if shared_key is None:
+            shared_key = self.shared_key(snapshot, kind)
+        recipient = json.dumps(dict(snapshot.recipient), sort_keys=True, ensure_ascii=False,
+                               default=str)
+        return hashlib.sha256(f"{shared_key}{recipient}".encode("utf-8")).hexdigest()
+    
+    def shared_key(self, snapshot, kind):
+        """
+        Zwraca skrót wszystkiego poza odbiorcą (firma, pozycje, szablon, fonty) -
+        przy korespondencji seryjnej liczony raz dla wszystkich odbiorców.
+        """
+        payload = {
+            "kind": kind,
+            "template_version": TEMPLATE_VERSION,
+            "template": snapshot.template.settings,
+            "date": snapshot.offer_date.strftime("%Y-%m-%d"),
+            "company": dict(snapshot.company),
+            "items": [dict(item) for item in snapshot.items],
+        }
+        if kind == "pdf":
+            load_reportlab()
+            payload["reportlab"] = REPORTLAB_VERSION
+            logo = letterhead_logo_signature(snapshot.company)
+            if logo:
+                payload["logo_file"] = logo
+            payload["fonts"] = get_unicode_fonts()
+            payload["font_files"] = {
+                font: [path, os.path.getmtime(path), os.path.getsize(path)]
+                for font, path in sorted(font_registry.resolved_files().items())}
+        else:
+            payload["txt_name_width"] = TXT_NAME_WIDTH
+        data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+    
+    def _path(self, key, kind):
+        return os.path.join(self.directory, key[:2], f"{key}.{kind}")
+    
+    def fetch(self, key, kind, filename):
+        """
+        Kopiuje plik z pamięci podręcznej do filename. Zwraca False przy braku.
+        """
+        path = self._path(key, kind)
+        try:
+            shutil.copyfile(path, filename)
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+    
+    def store(self, key, kind, filename):
+        """
+        Zapisuje kopię wygenerowanego pliku i w razie potrzeby zwalnia miejsce.
+        """
+        path = self._path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(filename, tmp_file)
+        os.replace(tmp_file, path)
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+    
+    def _entries(self):
+        entries = []
+        try:
+            subdirs = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return entries
+        for subdir in subdirs:
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+    
+    def evict(self, max_bytes=None):
+        """
+        Usuwa najdawniej używane pliki, aż rozmiar spadnie do 90% limitu.
+        Zwraca liczbę usuniętych plików.
+        """
+        limit = (self.max_bytes if max_bytes is None else max_bytes) * 0.9
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for _, entry_size, path in entries:
+            if size <= limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            removed += 1
+        self._size = size
+        return removed
+
+
+def _render_cache_from_env():
+    directory = os.environ.get("OFFER_RENDER_CACHE", RENDER_CACHE_DIR)
+    if directory.lower() in ("", "0", "off", "none"):
+        return None
+    try:
+        max_bytes = int(float(os.environ["OFFER_RENDER_CACHE_MB"]) * 1024 * 1024)
+    except (KeyError, ValueError):
+        max_bytes = RENDER_CACHE_MAX_BYTES
+    return RenderCache(directory, max_bytes)
+
+
+# Wspólna pamięć podręczna renderowania (OFFER_RENDER_CACHE=off wyłącza)
+render_cache = _render_cache_from_env()
+
+
+def render_offer(snapshot, filename, kind, progress=None, cache=None, items_block=None,
+                 shared_key=None):
+    """
+    Renderuje migawkę oferty do pliku PDF (kind="pdf") lub TXT (kind="txt").
+    Wynik jest brany z pamięci podręcznej (cache=None - render_cache,
+    False - bez pamięci podręcznej), jeśli identyczna oferta była już
+    renderowana. Zwraca True, gdy plik został skopiowany z pamięci podręcznej.
+    items_block - gotowa tabela pozycji PDF (jak w build_offer_pdf),
+    shared_key - gotowy RenderCache.shared_key migawki.
+    """
+    if cache is None:
+        cache = render_cache
+    # Anulowanie jest sprawdzane przed skopiowaniem pliku z pamięci podręcznej;
+    # skopiowany plik jest gotowy, więc trafienie nie wywołuje już progress
+    if progress:
+        progress(0.0)
+    with tracer.span("render.cache_lookup") as span:
+        key = cache.key(snapshot, kind, shared_key) if cache else None
+        hit = bool(key) and cache.fetch(key, kind, filename)
+        span["hit"] = hit
+    if hit:
+        return True
+    
+    if kind == "pdf":
+        build_offer_pdf(filename, snapshot.company, snapshot.recipient, snapshot.items,
+                        snapshot.offer_date, snapshot.template, progress=progress,
+                        items_block=items_block)
+    else:
+        write_offer_txt(filename, snapshot.company, snapshot.recipient, snapshot.items,
+                        snapshot.offer_date, snapshot.template, progress=progress)
+    
+    if key:
+        try:
+            cache.store(key, kind, filename)
+        except OSError:
+            # Pamięć podręczna jest tylko optymalizacją
+            pass
+    return False
+
+
+class RenderJob:
+    def __init__(self, job_id, kind, filename, snapshot):
+        self.id = job_id
+        self.kind = kind
+        self.filename = filename
+        self.snapshot = snapshot
+        self.cancelled = threading.Event()
+
+
+class RenderQueue:
+    """
+    Kolejka renderowania ofert w wątku roboczym, żeby główna pętla Tk nigdy nie
+    była blokowana. Zadania wykonywane są po kolei; zdarzenia ("start",
+    "progress", "done", "cancelled", "error") trafiają do kolejki odczytywanej
+    w wątku Tk przez poll() - wątek roboczy nie dotyka widżetów.
+    """
+    
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.pending = []
+        self.current = None
+        self._ids = itertools.count(1)
+        self._thread = None
+    
+    def submit(self, kind, filename, snapshot):
+        job = RenderJob(next(self._ids), kind, filename, snapshot)
+        self.pending.append(job)
+        self.jobs.put(job)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="offer-render", daemon=True)
+            self._thread.start()
+        return job
+    
+    def busy(self):
+        return bool(self.pending)
+    
+    def cancel(self, job=None):
+        """
+        Anuluje podane zadanie (domyślnie bieżące). Zadanie z kolejki zostanie pominięte.
+        """
+        job = job or self.current or (self.pending[0] if self.pending else None)
+        if job is not None:
+            job.cancelled.set()
+    
+    def poll(self):
+        """
+        Zwraca zdarzenia zgłoszone od ostatniego wywołania (wywoływać z wątku Tk).
+        """
+        events = []
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            kind, job = event[0], event[1]
+            if kind == "start":
+                self.current = job
+            elif kind in ("done", "cancelled", "error"):
+                if job in self.pending:
+                    self.pending.remove(job)
+                if self.current is job:
+                    self.current = None
+            events.append(event)
+        return events
+    
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job.cancelled.is_set():
+                self.events.put(("cancelled", job))
+                continue
+            self.events.put(("start", job))
+            last = [-1]
+            
+            def progress(fraction, job=job, last=last):
+                if job.cancelled.is_set():
+                    raise RenderCancelled()
+                percent = int(fraction * 100)
+                if percent != last[0]:
+                    last[0] = percent
+                    self.events.put(("progress", job, percent))
+            
+            try:
+                render_offer(job.snapshot, job.filename, job.kind, progress)
+                self.events.put(("done", job))
+            except RenderCancelled:
+                # Nie zostawiaj niedokończonego pliku
+                if job.kind == "txt" and os.path.exists(job.filename):
+                    os.remove(job.filename)
+                self.events.put(("cancelled", job))
+            except Exception as e:
+                self.events.put(("error", job, str(e)))
+
+
+class OfferItem:
+    """
+    Pozycja oferty. Rekord ze __slots__ zamiast słownika - przy dziesiątkach
+    tysięcy pozycji zajmuje kilka razy mniej pamięci. Obsługuje odczyt
+    item["name"] / item.get(...), więc renderery przyjmują go jak słownik.
+    """
+    
+    __slots__ = ("key", "name", "quantity", "unit_price", "total")
+    
+    FIELDS = ("name", "quantity", "unit_price", "total")
+    
+    def __init__(self, key, name, quantity, unit_price, total=None):
+        self.key = key
+        self.name = name
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.total = quantity * unit_price if total is None else total
+    
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+    
+    def __contains__(self, field):
+        return field in self.FIELDS
+    
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self.FIELDS else default
+    
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "quantity": self.quantity,
+            "unit_price": self.unit_price,
+            "total": self.total
+        }
+
+
+class OfferItemStore:
+    """
+    Pozycje oferty w kolejności wyświetlania, ze stałymi kluczami wierszy
+    ("row1", "row2", ...) i sumą aktualizowaną w O(1) przy dodaniu, edycji
+    i usunięciu. Operacje zbiorcze (zmiana cen, sortowanie) przeliczają sumę
+    dokładnie przez math.fsum.
+    """
+    
+    def __init__(self, items=()):
+        self._items = []
+        self._by_key = {}
+        self._keys = itertools.count(1)
+        self.total = 0.0
+        self.extend(items)
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def __iter__(self):
+        return iter(self._items)
+    
+    def __getitem__(self, index):
+        return self._items[index]
+    
+    def keys(self):
+        return [item.key for item in self._items]
+    
+    def get(self, key):
+        return self._by_key.get(key)
+    
+    def index(self, key):
+        return self._items.index(self._by_key[key])
+    
+    def _new_item(self, name, quantity, unit_price, total=None):
+        item = OfferItem(f"row{next(self._keys)}", name, quantity, unit_price, total)
+        self._by_key[item.key] = item
+        return item
+    
+    def _recalculate(self):
+        self.total = math.fsum(item.total for item in self._items)
+    
+    def add(self, name, quantity, unit_price, total=None):
+        """
+        Dodaje pozycję na końcu listy i zwraca jej klucz.
+        """
+        item = self._new_item(name, quantity, unit_price, total)
+        self._items.append(item)
+        self.total += item.total
+        return item.key
+    
+    def add_many(self, rows):
+        """
+        Dodaje pozycje z krotek (nazwa, ilość, cena) i zwraca listę ich kluczy.
+        """
+        items = [self._new_item(name, quantity, unit_price)
+                 for name, quantity, unit_price in rows]
+        self._items.extend(items)
+        self.total += math.fsum(item.total for item in items)
+        return [item.key for item in items]
+    
+    def extend(self, items):
+        """
+        Dodaje pozycje ze słowników (np. wczytanych z pliku oferty) i zwraca
+        listę ich kluczy.
+        """
+        items = [self._new_item(data.get("name", ""), data.get("quantity", 0),
+                                data.get("unit_price", 0), data.get("total"))
+                 for data in items]
+        self._items.extend(items)
+        self.total += math.fsum(item.total for item in items)
+        return [item.key for item in items]
+    
+    def update(self, key, name, quantity, unit_price):
+        item = self._by_key[key]
+        self.total -= item.total
+        item.name = name
+        item.quantity = quantity
+        item.unit_price = unit_price
+        item.total = quantity * unit_price
+        self.total += item.total
+    
+    def remove(self, key):
+        item = self._by_key.pop(key)
+        self._items.remove(item)
+        if self._items:
+            self.total -= item.total
+        else:
+            # Bez pozycji suma jest dokładnie zerem (bez błędów zaokrągleń)
+            self.total = 0.0
+    
+    def clear(self):
+        self._items = []
+        self._by_key = {}
+        self.total = 0.0
+    
+    def move(self, key, step):
+        """
+        Przesuwa pozycję o step miejsc (ujemny - w górę). Zwraca nowy indeks.
+        """
+        index = self.index(key)
+        new_index = max(0, min(index + step, len(self._items) - 1))
+        if new_index != index:
+            self._items.insert(new_index, self._items.pop(index))
+        return new_index
+    
+    def sort(self, field, reverse=False):
+        if field == "name":
+            sort_key = lambda item: item.name.lower()
+        else:
+            sort_key = lambda item: getattr(item, field)
+        self._items.sort(key=sort_key, reverse=reverse)
+    
+    def change_prices(self, keys, percent):
+        """
+        Zmienia cenę jednostkową wskazanych pozycji o podany procent.
+        """
+        factor = 1 + percent / 100
+        for key in keys:
+            item = self._by_key[key]
+            item.unit_price = round(item.unit_price * factor, 2)
+            item.total = item.quantity * item.unit_price
+        self._recalculate()
+    
+    def to_list(self):
+        return [item.to_dict() for item in self._items]
+
+
+def parse_decimal(text):
+    """
+    Zamienia tekst liczby (z przecinkiem lub kropką dziesiętną, ze spacjami
+    między tysiącami) na float. Pusty tekst oznacza 0.
+    """
+    text = text.strip().replace("\xa0", "").replace(" ", "")
+    return float(text.replace(",", ".")) if text else 0
+
+
+def _item_delimiter(line):
+    # Tabulator (arkusz, schowek), średnik (polski CSV) albo przecinek
+    if "\t" in line:
+        return "\t"
+    if ";" in line:
+        return ";"
+    return ","
+
+
+def iter_item_rows(lines):
+    """
+    Strumieniowo czyta pozycje z wierszy CSV/TSV: nazwa, ilość, cena jednostkowa
+    (kolejne kolumny są pomijane). Zwraca krotki (nr_wiersza, pozycja, błąd),
+    gdzie pozycja to (nazwa, ilość, cena) albo None dla błędnego wiersza.
+    Pierwszy wiersz z nienumeryczną ilością i ceną traktowany jest jako nagłówek.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    reader = csv.reader(itertools.chain([first], lines), delimiter=_item_delimiter(first))
+    
+    for row in reader:
+        line_no = reader.line_num
+        if not any(cell.strip() for cell in row):
+            continue
+        
+        name = normalize_encoding(row[0].strip())
+        quantity_str = row[1] if len(row) > 1 else ""
+        price_str = row[2] if len(row) > 2 else ""
+        try:
+            quantity = parse_decimal(quantity_str)
+            price = parse_decimal(price_str)
+        except ValueError:
+            if line_no == 1:
+                continue
+            yield line_no, None, f"nieprawidłowa ilość lub cena ({quantity_str!r}, {price_str!r})"
+            continue
+        
+        if not name:
+            yield line_no, None, "brak nazwy pozycji"
+            continue
+        yield line_no, (name, quantity, price), None
+
+
+def read_item_file(filename, encodings=("utf-8-sig", "cp1250")):
+    """
+    Wczytuje pozycje z pliku CSV/TSV. Zwraca (pozycje, błędy), gdzie błędy
+    to lista (nr_wiersza, opis). Pliki spoza UTF-8 (np. eksport z Excela)
+    są czytane ponownie jako Windows-1250.
+    """
+    for encoding in encodings:
+        items, errors = [], []
+        try:
+            with open(filename, "r", encoding=encoding, newline="") as f:
+                for line_no, item, error in iter_item_rows(f):
+                    if item is None:
+                        errors.append((line_no, error))
+                    else:
+                        items.append(item)
+            return items, errors
+        except UnicodeDecodeError:
+            if encoding == encodings[-1]:
+                raise
+    return [], []
+
+
+def read_item_text(text):
+    """
+    Wczytuje pozycje z tekstu (np. wklejonego ze schowka). Zwraca (pozycje, błędy).
+    """
+    items, errors = [], []
+    for line_no, item, error in iter_item_rows(text.splitlines()):
+        if item is None:
+            errors.append((line_no, error))
+        else:
+            items.append(item)
+    return items, errors
+
+
+CATALOG_FILE = "catalog.json"
+
+
+class ProductCatalog:
+    """
+    Katalog produktów (nazwa -> ostatnia cena jednostkowa) z indeksem prefiksowym:
+    posortowaną listą nazw w postaci casefold, przeszukiwaną przez bisect.
+    Podpowiedzi dla prefiksu kosztują O(log n + limit), a dodanie produktu
+    wstawia tylko jeden wpis do indeksu.
+    """
+    
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self._prices = {}
+        self._index = []
+    
+    def __len__(self):
+        return len(self._prices)
+    
+    def __contains__(self, name):
+        return name in self._prices
+    
+    def price(self, name):
+        return self._prices.get(name)
+    
+    def add(self, name, unit_price):
+        """
+        Dodaje produkt lub aktualizuje jego cenę. Zwraca True, jeśli coś się zmieniło.
+        """
+        name = name.strip()
+        if not name:
+            return False
+        if name not in self._prices:
+            bisect.insort(self._index, (name.casefold(), name))
+        elif self._prices[name] == unit_price:
+            return False
+        self._prices[name] = unit_price
+        return True
+    
+    def add_items(self, items):
+        """
+        Dodaje pozycje oferty do katalogu. Zwraca liczbę zmienionych produktów.
+        """
+        return sum(self.add(item["name"], item["unit_price"]) for item in items)
+    
+    def suggest(self, prefix, limit=10):
+        """
+        Zwraca do limit nazw produktów zaczynających się od prefix (bez względu na wielkość liter).
+        """
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self._index, (prefix,))
+        names = []
+        for folded, name in self._index[start:start + limit]:
+            if not folded.startswith(prefix):
+                break
+            names.append(name)
+        return names
+    
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = load_normalized(json.load(f))
+        self._prices = {product["name"]: product["unit_price"] for product in data["products"]}
+        self._index = sorted((name.casefold(), name) for name in self._prices)
+    
+    def save(self):
+        data = mark_normalized({
+            "version": 1,
+            "products": [{"name": name, "unit_price": price}
+                         for name, price in self._prices.items()]
+        })
+        # Zapis atomowy - przerwany zapis nie może uszkodzić katalogu
+        tmp_file = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.path)
+
+
+def normalize_nip(nip):
+    """
+    Zwraca NIP bez separatorów (same cyfry) - klucz indeksu odbiorców.
+    """
+    return "".join(c for c in str(nip or "") if c.isdigit())
+
+
+_POLISH_FOLD = str.maketrans("ąćęłńóśźż", "acelnoszz")
+_WORD_RE = re.compile(r"\w+")
+
+
+def search_tokens(text):
+    """
+    Dzieli tekst na słowa do wyszukiwania: małe litery, bez polskich znaków.
+    """
+    text = str(text or "").casefold()
+    if not text.isascii():
+        text = text.translate(_POLISH_FOLD)
+    return _WORD_RE.findall(text)
+
+
+class RecipientRepository:
+    """
+    Odbiorcy ze stałymi identyfikatorami (pole "id") oraz indeksami po id, nazwie
+    i NIP, aktualizowanymi przy każdej zmianie. Wyszukiwanie jest O(1) niezależnie
+    od liczby odbiorców, a odbiorcy o tej samej nazwie pozostają rozróżnialni.
+    
+    Wyszukiwanie tekstowe (search) korzysta z indeksu słów z nazwy, miasta,
+    kodu pocztowego i NIP: posortowanej listy słów przeszukiwanej przez bisect
+    po prefiksie i list odbiorców dla każdego słowa.
+    """
+    
+    SEARCH_FIELDS = ("name", "city", "postal_code", "nip")
+    
+    def __init__(self, recipients=()):
+        self._by_id = {}
+        self._by_name = {}
+        self._by_nip = {}
+        self._seq = {}
+        self._next_seq = itertools.count()
+        # Indeks wyszukiwania: słowo -> id odbiorców, słowa każdego odbiorcy
+        # oraz posortowana lista słów (budowana przy pierwszym wyszukiwaniu)
+        self._by_token = {}
+        self._tokens_of = {}
+        self._sorted_tokens = None
+        # Liczba odbiorców, którym nadano nowe id (np. przy wczytaniu starego pliku)
+        self.assigned_ids = 0
+        for recipient in recipients:
+            self.add(recipient)
+        self._sorted_tokens = sorted(self._by_token)
+    
+    def __len__(self):
+        return len(self._by_id)
+    
+    def __iter__(self):
+        return iter(self._by_id.values())
+    
+    def __contains__(self, recipient_id):
+        return recipient_id in self._by_id
+    
+    def ids(self):
+        return list(self._by_id)
+    
+    def get(self, recipient_id):
+        return self._by_id.get(recipient_id)
+    
+    def first(self):
+        return next(iter(self._by_id.values()), None)
+    
+    def find_by_name(self, name):
+        """
+        Zwraca listę odbiorców o podanej nazwie (w kolejności dodania).
+        """
+        return [self._by_id[i] for i in self._by_name.get(name, ())]
+    
+    def find_by_nip(self, nip):
+        key = normalize_nip(nip)
+        if not key:
+            return []
+        return [self._by_id[i] for i in self._by_nip.get(key, ())]
+    
+    def add(self, recipient):
+        """
+        Dodaje odbiorcę; nadaje nowe id, jeśli go nie ma lub jest już zajęte.
+        Zwraca id odbiorcy.
+        """
+        recipient_id = recipient.get("id")
+        if not recipient_id or recipient_id in self._by_id:
+            recipient_id = recipient["id"] = uuid.uuid4().hex
+            self.assigned_ids += 1
+        self._by_id[recipient_id] = recipient
+        self._seq[recipient_id] = next(self._next_seq)
+        self._index(recipient_id, recipient)
+        return recipient_id
+    
+    def extend(self, recipients):
+        """
+        Dodaje wielu odbiorców (np. porcję wczytywanej listy) i zwraca ich id.
+        Posortowana lista słów jest odbudowywana przy najbliższym wyszukiwaniu.
+        """
+        self._sorted_tokens = None
+        return [self.add(recipient) for recipient in recipients]
+    
+    def update(self, recipient_id, fields):
+        """
+        Aktualizuje pola odbiorcy (poza id) i jego wpisy w indeksach.
+        """
+        recipient = self._by_id[recipient_id]
+        self._unindex(recipient_id, recipient)
+        for key, value in fields.items():
+            if key != "id":
+                recipient[key] = value
+        self._index(recipient_id, recipient)
+        return recipient
+    
+    def remove(self, recipient_id):
+        recipient = self._by_id.pop(recipient_id)
+        del self._seq[recipient_id]
+        self._unindex(recipient_id, recipient)
+        return recipient
+    
+    def to_list(self):
+        return list(self._by_id.values())
+    
+    def search(self, query, limit=None):
+        """
+        Zwraca id odbiorców (w kolejności dodania), dla których każde słowo
+        zapytania jest początkiem słowa z nazwy, miasta, kodu pocztowego lub NIP.
+        Wielkość liter i polskie znaki nie mają znaczenia. Puste zapytanie
+        zwraca wszystkich odbiorców.
+        """
+        terms = sorted(set(search_tokens(query)), key=len, reverse=True)
+        if not terms:
+            return list(itertools.islice(self._by_id, limit))
+        
+        # Najdłuższe słowo wybiera kandydatów z indeksu. Kolejne słowa zawężają
+        # kandydatów przez przecięcie z indeksem albo - gdy słowo pasuje do
+        # większej liczby wpisów niż sprawdzenie kandydatów - bezpośrednio
+        matches = self._prefix_ids(terms[0])
+        tokens_of = self._tokens_of
+        for term in terms[1:]:
+            if not matches:
+                break
+            budget = len(matches) * 4
+            if self._prefix_size(term, budget) < budget:
+                matches = matches.intersection(self._prefix_ids(term))
+            else:
+                matches = {i for i in matches
+                           if any(token.startswith(term) for token in tokens_of[i])}
+        
+        if len(matches) == len(self._by_id):
+            ids = list(self._by_id)
+        elif len(matches) * 8 < len(self._by_id):
+            ids = sorted(matches, key=self._seq.__getitem__)
+        else:
+            ids = [i for i in self._by_id if i in matches]
+        return ids[:limit] if limit is not None else ids
+    
+    def _prefix_tokens(self, prefix):
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._by_token)
+        tokens = self._sorted_tokens
+        for i in range(bisect.bisect_left(tokens, prefix), len(tokens)):
+            token = tokens[i]
+            if not token.startswith(prefix):
+                break
+            yield token
+    
+    def _prefix_ids(self, prefix):
+        ids = set()
+        for token in self._prefix_tokens(prefix):
+            ids.update(self._by_token[token])
+        return ids
+    
+    def _prefix_size(self, prefix, limit):
+        # Liczba wpisów indeksu dla prefiksu (liczenie kończy się po przekroczeniu limitu)
+        size = 0
+        for token in self._prefix_tokens(prefix):
+            size += len(self._by_token[token])
+            if size >= limit:
+                break
+        return size
+    
+    def _search_tokens(self, recipient):
+        get = recipient.get
+        tokens = set(search_tokens(" ".join(str(get(field) or "") for field in self.SEARCH_FIELDS)))
+        # Kod pocztowy i NIP można wpisać również bez separatorów
+        for field in ("postal_code", "nip"):
+            value = str(get(field) or "")
+            if value and not value.isalnum():
+                tokens.add("".join(search_tokens(value)))
+        tokens.discard("")
+        return tuple(tokens)
+    
+    def _index(self, recipient_id, recipient):
+        # Słowniki z wartościami None służą jako zbiory zachowujące kolejność
+        self._by_name.setdefault(recipient.get("name", ""), {})[recipient_id] = None
+        nip = normalize_nip(recipient.get("nip"))
+        if nip:
+            self._by_nip.setdefault(nip, {})[recipient_id] = None
+        
+        tokens = self._tokens_of[recipient_id] = self._search_tokens(recipient)
+        by_token = self._by_token
+        for token in tokens:
+            ids = by_token.get(token)
+            if ids is None:
+                by_token[token] = {recipient_id: None}
+                if self._sorted_tokens is not None:
+                    bisect.insort(self._sorted_tokens, token)
+            else:
+                ids[recipient_id] = None
+    
+    def _unindex(self, recipient_id, recipient):
+        for index, key in ((self._by_name, recipient.get("name", "")),
+                           (self._by_nip, normalize_nip(recipient.get("nip")))):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(recipient_id, None)
+                if not ids:
+                    del index[key]
+        
+        for token in self._tokens_of.pop(recipient_id, ()):
+            ids = self._by_token[token]
+            ids.pop(recipient_id, None)
+            if not ids:
+                del self._by_token[token]
+                if self._sorted_tokens is not None:
+                    del self._sorted_tokens[bisect.bisect_left(self._sorted_tokens, token)]
+
+
+RECIPIENTS_FILE = "recipients.json"
+COMPANY_FILE = "company_data.json"
+RECIPIENTS_FORMAT_VERSION = 2
+
+# Pola odbiorcy zapisywane w osobnych kolumnach bazy SQLite
+RECIPIENT_COLUMNS = ("name", "address", "city", "postal_code", "nip", "phone", "email")
+
+
+class JsonStore:
+    """
+    Zapis odbiorców i danych firmy w plikach JSON (domyślny). Każda zmiana
+    odbiorcy zapisuje cały plik recipients.json.
+    
+    Pliki zapisywane są z markerem naprawionego kodowania, więc przy wczytaniu
+    pomijana jest naprawa znaków. Lista odbiorców zapisywana jest w kopercie
+    {"version": 2, "normalized": true, "recipients": [...]}; starsze pliki
+    (sama lista) są nadal wczytywane.
+    """
+    
+    def __init__(self, recipients_file=RECIPIENTS_FILE, company_file=COMPANY_FILE):
+        self.recipients_file = recipients_file
+        self.company_file = company_file
+    
+    def reopen(self):
+        """
+        Zwraca magazyn do użycia w innym wątku (dla plików JSON - ten sam).
+        """
+        return self
+    
+    def close(self):
+        pass
+    
+    def load_recipients(self):
+        """
+        Zwraca listę odbiorców (z naprawionym kodowaniem) lub None,
+        jeśli nic nie zapisano.
+        """
+        if not os.path.exists(self.recipients_file):
+            return None
+        with tracer.span("recipients.load_json") as span, \
+                open(self.recipients_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            span["bytes"] = f.tell()
+        
+        if isinstance(data, dict) and "recipients" in data:
+            if data.get(NORMALIZED_KEY) is True:
+                return data["recipients"]
+            data = data["recipients"]
+        return fix_string_encoding(data)
+    
+    def save_recipients(self, recipients):
+        data = mark_normalized({"version": RECIPIENTS_FORMAT_VERSION,
+                                "recipients": list(recipients)})
+        with tracer.span("recipients.save_json", recipients=len(data["recipients"])) as span, \
+                open(self.recipients_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            span["bytes"] = f.tell()
+    
+    def save_recipient(self, recipients, recipient_id):
+        self.save_recipients(recipients)
+    
+    def delete_recipient(self, recipients, recipient_id):
+        self.save_recipients(recipients)
+    
+    def load_company(self):
+        """
+        Zwraca dane firmy (z naprawionym kodowaniem) lub None,
+        jeśli nic nie zapisano.
+        """
+        if not os.path.exists(self.company_file):
+            return None
+        with open(self.company_file, "r", encoding="utf-8") as f:
+            return load_normalized(json.load(f))
+    
+    def save_company(self, company_data):
+        with open(self.company_file, "w", encoding="utf-8") as f:
+            json.dump(mark_normalized(company_data), f, ensure_ascii=False, indent=2)
+
+
+class SQLiteStore:
+    """
+    Zapis odbiorców i danych firmy w bazie SQLite (tryb WAL). Zmiana odbiorcy
+    zapisuje tylko jeden wiersz w osobnej transakcji. Do bazy trafiają tylko
+    dane z naprawionym kodowaniem, więc wczytane wiersze nie są naprawiane.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS recipients ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "id TEXT NOT NULL UNIQUE, "
+                + ", ".join(f"{column} TEXT NOT NULL DEFAULT ''" for column in RECIPIENT_COLUMNS)
+                + ", extra TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS recipients_nip ON recipients (nip)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS company (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    
+    def reopen(self):
+        """
+        Zwraca magazyn z nowym połączeniem do tej samej bazy - połączenia
+        SQLite nie mogą być współdzielone między wątkami.
+        """
+        return SQLiteStore(self.path)
+    
+    def close(self):
+        self.conn.close()
+    
+    def _recipient_row(self, recipient):
+        extra = {key: value for key, value in recipient.items()
+                 if key != "id" and key not in RECIPIENT_COLUMNS}
+        return ((recipient["id"],)
+                + tuple(str(recipient.get(column) or "") for column in RECIPIENT_COLUMNS)
+                + (json.dumps(extra, ensure_ascii=False) if extra else None,))
+    
+    def _upsert(self, rows):
+        columns = ", ".join(RECIPIENT_COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}"
+                            for column in RECIPIENT_COLUMNS + ("extra",))
+        placeholders = ", ".join("?" * (len(RECIPIENT_COLUMNS) + 2))
+        self.conn.executemany(
+            f"INSERT INTO recipients (id, {columns}, extra) VALUES ({placeholders}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates}", rows)
+    
+    def load_recipients(self):
+        columns = ", ".join(RECIPIENT_COLUMNS)
+        recipients = []
+        for row in self.conn.execute(f"SELECT id, {columns}, extra FROM recipients ORDER BY seq"):
+            recipient = dict(zip(RECIPIENT_COLUMNS, row[1:-1]))
+            if row[-1]:
+                recipient.update(json.loads(row[-1]))
+            recipient["id"] = row[0]
+            recipients.append(recipient)
+        return recipients
+    
+    def save_recipients(self, recipients):
+        """
+        Zapisuje wszystkich odbiorców w jednej transakcji (usuwa nieobecnych).
+        """
+        recipients = list(recipients)
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_ids (id TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM keep_ids")
+            self.conn.executemany("INSERT OR IGNORE INTO keep_ids VALUES (?)",
+                                  ((r["id"],) for r in recipients))
+            self.conn.execute("DELETE FROM recipients WHERE id NOT IN (SELECT id FROM keep_ids)")
+            self._upsert(self._recipient_row(r) for r in recipients)
+    
+    def save_recipient(self, recipients, recipient_id):
+        with self.conn:
+            self._upsert([self._recipient_row(recipients.get(recipient_id))])
+    
+    def delete_recipient(self, recipients, recipient_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM recipients WHERE id = ?", (recipient_id,))
+    
+    def load_company(self):
+        rows = self.conn.execute("SELECT key, value FROM company").fetchall()
+        return dict(rows) if rows else None
+    
+    def save_company(self, company_data):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO company (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                ((key, str(value)) for key, value in company_data.items()))
+    
+    def import_json(self, recipients_file=RECIPIENTS_FILE, company_file=COMPANY_FILE):
+        """
+        Importuje odbiorców i dane firmy z plików JSON (odbiorcy z tym samym id
+        są nadpisywani). Zwraca liczbę zaimportowanych odbiorców.
+        """
+        source = JsonStore(recipients_file, company_file)
+        recipients = RecipientRepository(source.load_recipients() or [])
+        company_data = source.load_company()
+        with self.conn:
+            self._upsert(self._recipient_row(r) for r in recipients)
+        if company_data:
+            self.save_company(company_data)
+        return len(recipients)
+    
+    def export_json(self, recipients_file=RECIPIENTS_FILE, company_file=COMPANY_FILE):
+        """
+        Eksportuje bazę do plików JSON w dotychczasowym formacie.
+        Zwraca liczbę wyeksportowanych odbiorców.
+        """
+        target = JsonStore(recipients_file, company_file)
+        recipients = self.load_recipients()
+        target.save_recipients(recipients)
+        company_data = self.load_company()
+        if company_data is not None:
+            target.save_company(company_data)
+        return len(recipients)
+
+
+def open_store(db_path=None):
+    """
+    Zwraca magazyn danych: SQLite, jeśli podano ścieżkę bazy (lub OFFER_DB),
+    w przeciwnym razie pliki JSON.
+    """
+    db_path = db_path or os.environ.get("OFFER_DB")
+    if db_path:
+        return SQLiteStore(db_path)
+    return JsonStore()
+
+
+def db_main(argv=None):
+    """
+    Import i eksport danych między plikami JSON a bazą SQLite.
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py db",
+        description="Import/eksport odbiorców i danych firmy (JSON <-> SQLite).")
+    parser.add_argument("action", choices=["import", "export"],
+                        help="import - z plików JSON do bazy, export - z bazy do plików JSON")
+    parser.add_argument("--db", default=os.environ.get("OFFER_DB") or "offers.db",
+                        help="plik bazy SQLite (domyślnie OFFER_DB lub offers.db)")
+    parser.add_argument("--recipients", default=RECIPIENTS_FILE,
+                        help="plik JSON z odbiorcami")
+    parser.add_argument("--company", default=COMPANY_FILE,
+                        help="plik JSON z danymi firmy")
+    args = parser.parse_args(argv)
+    
+    store = SQLiteStore(args.db)
+    try:
+        if args.action == "import":
+            count = store.import_json(args.recipients, args.company)
+            print(f"Zaimportowano {count} odbiorców do bazy {args.db}")
+        else:
+            count = store.export_json(args.recipients, args.company)
+            print(f"Wyeksportowano {count} odbiorców do pliku {args.recipients}")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Błąd: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+ARCHIVE_FILE = "offer_archive.db"
+
+# Maksymalna liczba ofert na liście wyników wyszukiwania w archiwum
+ARCHIVE_SEARCH_LIMIT = 500
+
+# Liczba wpisów zapisywanych w jednej transakcji podczas indeksowania
+ARCHIVE_INDEX_BATCH = 500
+
+ARCHIVE_COLUMNS = ("path", "source", "kind", "date", "recipient_id", "recipient_name",
+                   "nip", "total", "item_count", "mtime", "size")
+
+
+def archive_entry(offer_data, path, source=None):
+    """
+    Zwraca wpis archiwum dla oferty zapisanej (lub wygenerowanej) do pliku path.
+    source to plik oferty JSON/.offb, z którego można ją ponownie otworzyć.
+    """
+    recipient = offer_data.get("recipient") or {}
+    items = [item for item in offer_data.get("items") or [] if isinstance(item, dict)]
+    total = offer_data.get("total")
+    if not isinstance(total, (int, float)) or isinstance(total, bool):
+        total = math.fsum(float(item.get("total") or 0) for item in items)
+    # Do indeksu trafiają tylko unikalne słowa (bez polskich znaków)
+    names = dict.fromkeys(token for item in items
+                          for token in search_tokens(item.get("name")))
+    nip = normalize_nip(recipient.get("nip"))
+    return {
+        "path": path,
+        "source": source,
+        "kind": os.path.splitext(path)[1].lstrip(".").lower(),
+        "date": str(offer_data.get("date") or ""),
+        "recipient_id": recipient.get("id"),
+        "recipient_name": str(recipient.get("name") or ""),
+        "nip": nip,
+        "total": float(total),
+        "item_count": len(items),
+        "mtime": None,
+        "size": None,
+        "names": " ".join(names),
+        "recipient_text": " ".join(search_tokens(
+            f"{recipient.get('name', '')} {recipient.get('city', '')} {nip}")),
+    }
+
+
+def archive_entry_from_file(filename):
+    """
+    Wczytuje plik oferty i zwraca (plik, wpis archiwum, komunikat błędu).
+    Uruchamiane w procesach roboczych indeksowania.
+    """
+    try:
+        stat = os.stat(filename)
+        entry = archive_entry(load_offer_data(filename), filename, filename)
+        entry["mtime"] = stat.st_mtime
+        entry["size"] = stat.st_size
+        return filename, entry, ""
+    except Exception as e:
+        return filename, None, str(e)
+
+
+def offer_data_from_snapshot(snapshot):
+    """
+    Zwraca dane oferty w schemacie zapisywanym przez save_offer_json.
+    """
+    items = [dict(item) for item in snapshot.items]
+    return {
+        "date": snapshot.offer_date.strftime("%Y-%m-%d"),
+        "company": dict(snapshot.company),
+        "recipient": dict(snapshot.recipient),
+        "items": items,
+        "total": math.fsum(item.get("total", 0) for item in items)
+    }
+
+
+class OfferArchive:
+    """
+    Archiwum zapisanych i wygenerowanych ofert w bazie SQLite: data, odbiorca
+    (id, nazwa, NIP), suma, liczba pozycji i ścieżki plików. Nazwy pozycji
+    i dane odbiorcy mają indeks pełnotekstowy FTS5 (bez FTS5 - zwykła tabela
+    przeszukiwana przez LIKE).
+    """
+    
+    def __init__(self, path=ARCHIVE_FILE):
+        self.path = path
+        # Kopie ofert wygenerowanych bez zapisanego pliku JSON (do ponownego otwarcia)
+        self.files_dir = os.path.splitext(path)[0]
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS offers ("
+                "id INTEGER PRIMARY KEY, "
+                "path TEXT NOT NULL UNIQUE, "
+                "source TEXT, "
+                "kind TEXT NOT NULL DEFAULT '', "
+                "date TEXT NOT NULL DEFAULT '', "
+                "recipient_id TEXT, "
+                "recipient_name TEXT NOT NULL DEFAULT '', "
+                "nip TEXT NOT NULL DEFAULT '', "
+                "total REAL NOT NULL DEFAULT 0, "
+                "item_count INTEGER NOT NULL DEFAULT 0, "
+                "mtime REAL, "
+                "size INTEGER, "
+                "archived_at TEXT NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS offers_nip ON offers (nip, date)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS offers_date ON offers (date)")
+            try:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS offers_text USING fts5(names, recipient)")
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite bez modułu FTS5
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS offers_text ("
+                    "rowid INTEGER PRIMARY KEY, names TEXT, recipient TEXT)")
+                self.fts = False
+    
+    def close(self):
+        self.conn.close()
+    
+    def add(self, entries):
+        """
+        Dodaje lub aktualizuje (według ścieżki pliku) wpisy w jednej transakcji.
+        Zwraca liczbę zapisanych wpisów.
+        """
+        columns = ", ".join(ARCHIVE_COLUMNS)
+        placeholders = ", ".join("?" * (len(ARCHIVE_COLUMNS) + 1))
+        updates = ", ".join(f"{column} = excluded.{column}"
+                            for column in ARCHIVE_COLUMNS[1:] + ("archived_at",))
+        archived_at = datetime.now().isoformat(timespec="seconds")
+        count = 0
+        with self.conn:
+            for entry in entries:
+                self.conn.execute(
+                    f"INSERT INTO offers ({columns}, archived_at) VALUES ({placeholders}) "
+                    f"ON CONFLICT(path) DO UPDATE SET {updates}",
+                    tuple(entry[column] for column in ARCHIVE_COLUMNS) + (archived_at,))
+                (offer_id,) = self.conn.execute(
+                    "SELECT id FROM offers WHERE path = ?", (entry["path"],)).fetchone()
+                self.conn.execute("DELETE FROM offers_text WHERE rowid = ?", (offer_id,))
+                self.conn.execute(
+                    "INSERT INTO offers_text (rowid, names, recipient) VALUES (?, ?, ?)",
+                    (offer_id, entry["names"], entry["recipient_text"]))
+                count += 1
+        return count
+    
+    def remove(self, path):
+        with self.conn:
+            row = self.conn.execute("SELECT id FROM offers WHERE path = ?", (path,)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM offers_text WHERE rowid = ?", row)
+                self.conn.execute("DELETE FROM offers WHERE id = ?", row)
+    
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM offers").fetchone()[0]
+    
+    def known_files(self):
+        """
+        Zwraca {ścieżka: (mtime, rozmiar)} zindeksowanych plików.
+        """
+        return {path: (mtime, size) for path, mtime, size in self.conn.execute(
+            "SELECT path, mtime, size FROM offers WHERE mtime IS NOT NULL")}
+    
+    def store_copy(self, offer_data):
+        """
+        Zapisuje kopię oferty (.offb) w katalogu archiwum i zwraca jej ścieżkę.
+        """
+        os.makedirs(self.files_dir, exist_ok=True)
+        filename = os.path.join(
+            self.files_dir,
+            f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}{OFFB_EXTENSION}")
+        write_offer_binary(filename, offer_data)
+        return filename
+    
+    def search(self, query="", nip=None, date_from=None, date_to=None,
+               limit=ARCHIVE_SEARCH_LIMIT):
+        """
+        Zwraca wpisy (najnowsze najpierw), których nazwy pozycji lub dane odbiorcy
+        zawierają słowa zaczynające się od słów zapytania. Zapytanie będące
+        numerem NIP (z separatorami lub bez) filtruje po NIP odbiorcy.
+        Daty w formacie YYYY-MM-DD (zakres obustronnie domknięty).
+        """
+        query = str(query or "")
+        digits = normalize_nip(query)
+        if len(digits) == 10 and not re.search(r"[^\d\s-]", query):
+            nip = nip or digits
+            query = ""
+        
+        conditions = []
+        params = []
+        tokens = search_tokens(query)
+        if tokens and self.fts:
+            conditions.append("id IN (SELECT rowid FROM offers_text WHERE offers_text MATCH ?)")
+            params.append(" ".join(f'"{token}"*' for token in tokens))
+        for token in tokens if not self.fts else ():
+            conditions.append("id IN (SELECT rowid FROM offers_text "
+                              "WHERE ' ' || names || ' ' || recipient LIKE ?)")
+            params.append(f"% {token}%")
+        if nip:
+            conditions.append("nip = ?")
+            params.append(normalize_nip(nip))
+        if date_from:
+            conditions.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("date <= ?")
+            params.append(date_to)
+        
+        columns = ("id",) + ARCHIVE_COLUMNS[:-2]
+        sql = f"SELECT {', '.join(columns)} FROM offers"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY date DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return [dict(zip(columns, row)) for row in self.conn.execute(sql, params)]
+    
+    def index_files(self, files, workers=1, progress=None, start_method=None):
+        """
+        Indeksuje pliki ofert (JSON/.offb), pomijając pliki niezmienione od
+        ostatniego indeksowania. Pliki są wczytywane równolegle w procesach
+        roboczych, a wpisy zapisywane porcjami po ARCHIVE_INDEX_BATCH.
+        progress(gotowe, wszystkie) jest wywoływane po każdym pliku, a start_method
+        wybiera sposób uruchamiania procesów (np. "spawn" z wątku interfejsu).
+        Zwraca (zindeksowane, pominięte, [(plik, błąd), ...]).
+        """
+        known = self.known_files()
+        errors = []
+        pending = []
+        for filename in files:
+            try:
+                stat = os.stat(filename)
+            except OSError as e:
+                errors.append((filename, str(e)))
+                continue
+            if known.get(filename) != (stat.st_mtime, stat.st_size):
+                pending.append(filename)
+        skipped = len(files) - len(pending) - len(errors)
+        
+        workers = max(1, min(workers, len(pending)))
+        if workers == 1:
+            results = map(archive_entry_from_file, pending)
+            executor = None
+        else:
+            # Moduły procesów roboczych są importowane dopiero tutaj (szybszy start)
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            mp_context = multiprocessing.get_context(start_method) if start_method else None
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+            chunksize = max(1, min(16, len(pending) // (workers * 4)))
+            results = executor.map(archive_entry_from_file, pending, chunksize=chunksize)
+        
+        indexed = 0
+        batch = []
+        try:
+            for done, (filename, entry, error) in enumerate(results, 1):
+                if entry is None:
+                    errors.append((filename, error))
+                else:
+                    batch.append(entry)
+                    if len(batch) >= ARCHIVE_INDEX_BATCH:
+                        indexed += self.add(batch)
+                        batch = []
+                if progress:
+                    progress(done, len(pending))
+            indexed += self.add(batch)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        return indexed, skipped, errors
+
+
+def open_archive(path=None):
+    """
+    Otwiera archiwum ofert (plik z OFFER_ARCHIVE lub domyślny ARCHIVE_FILE).
+    """
+    return OfferArchive(path or os.environ.get("OFFER_ARCHIVE") or ARCHIVE_FILE)
+
+
+def archive_main(argv=None):
+    """
+    Indeksowanie folderów z ofertami i wyszukiwanie w archiwum ofert.
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py archive",
+        description="Archiwum ofert: indeksowanie plików i wyszukiwanie.")
+    parser.add_argument("--db", default=os.environ.get("OFFER_ARCHIVE") or ARCHIVE_FILE,
+                        help=f"plik bazy archiwum (domyślnie OFFER_ARCHIVE lub {ARCHIVE_FILE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="zindeksuj pliki ofert (JSON/.offb)")
+    index.add_argument("inputs", nargs="+",
+                       help="katalogi, wzorce glob lub pliki ofert")
+    index.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                       help="liczba procesów roboczych")
+    search = commands.add_parser("search", help="wyszukaj oferty w archiwum")
+    search.add_argument("query", nargs="*",
+                        help="słowa z nazw pozycji lub odbiorcy albo NIP")
+    search.add_argument("--nip", help="tylko oferty dla odbiorcy o tym NIP")
+    search.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD",
+                        help="oferty od tej daty")
+    search.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD",
+                        help="oferty do tej daty")
+    search.add_argument("--limit", type=int, default=ARCHIVE_SEARCH_LIMIT,
+                        help="maksymalna liczba wyników")
+    args = parser.parse_args(argv)
+    
+    try:
+        archive = OfferArchive(args.db)
+    except sqlite3.Error as e:
+        print(f"Błąd: nie udało się otworzyć archiwum: {e}", file=sys.stderr)
+        return 1
+    try:
+        if args.command == "index":
+            files = collect_offer_files(args.inputs)
+            if not files:
+                print("Nie znaleziono plików ofert.", file=sys.stderr)
+                return 1
+            start = time.perf_counter()
+            indexed, skipped, errors = archive.index_files(files, args.workers)
+            for filename, error in errors:
+                print(f"BŁĄD  {filename}: {error}", file=sys.stderr)
+            print(f"Zindeksowano {indexed} plików w {time.perf_counter() - start:.2f} s "
+                  f"(bez zmian: {skipped}, błędów: {len(errors)}), "
+                  f"ofert w archiwum: {len(archive)}")
+            return 1 if errors else 0
+        
+        results = archive.search(" ".join(args.query), args.nip, args.date_from, args.date_to, args.limit)
+        for entry in results:
+            print(f"{entry['date']:<10}  {entry['recipient_name'][:40]:<40}  {entry['nip']:<10}  "
+                  f"{entry['item_count']:>7}  {entry['total']:>14.2f}  {entry['path']}")
+        print(f"Znaleziono ofert: {len(results)}, suma: "
+              f"{math.fsum(entry['total'] for entry in results):.2f} PLN")
+        return 0
+    except sqlite3.Error as e:
+        print(f"Błąd: {e}", file=sys.stderr)
+        return 1
+    finally:
+        archive.close()
+
+
+# Od tej liczby wierszy Treeview działa w trybie wirtualnym
+VIRTUAL_TREE_ROWS = 2000
+
+# Maksymalna liczba odbiorców na rozwijanej liście wyboru (resztę zawęża filtr)
+RECIPIENT_COMBO_LIMIT = 500
+
+# Liczba odbiorców dodawanych do listy w jednym kroku wczytywania w tle
+RECIPIENT_LOAD_BATCH = 2000
+
+# Liczba pozycji dodawanych do listy w jednym kroku wczytywania oferty
+ITEM_LOAD_BATCH = 2000
+
+
+class TreeRows:
+    """
+    Synchronizuje wiersze Treeview z listą danych według stałych identyfikatorów:
+    dodaje, aktualizuje i usuwa tylko zmienione wiersze zamiast budować listę od nowa.
+    Od VIRTUAL_TREE_ROWS wierszy przechodzi w tryb wirtualny - w Treeview istnieją
+    tylko widoczne wiersze, a przewijanie obsługuje własny pasek przewijania.
+    
+    row_values(key, index) zwraca wartości kolumn dla wiersza na pozycji index.
+    Przy positional=True wartości zależą od pozycji (np. kolumna Lp), więc po
+    wstawieniu lub usunięciu odświeżane są również kolejne wiersze.
+    """
+    
+    def __init__(self, tree, scrollbar, row_values, positional=False,
+                 virtual_rows=VIRTUAL_TREE_ROWS):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row_values = row_values
+        self.positional = positional
+        self.virtual_rows = virtual_rows
+        self.keys = []
+        self.virtual = False
+        self.offset = 0
+        self.slots = []
+        self.selected = None
+        
+        tree.bind("<<TreeviewSelect>>", self._on_select, add="+")
+        tree.bind("<Configure>", self._on_configure, add="+")
+        tree.bind("<Up>", lambda event: self._on_key(-1), add="+")
+        tree.bind("<Down>", lambda event: self._on_key(1), add="+")
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tree.bind(sequence, self._on_wheel, add="+")
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def reset(self, keys):
+        """
+        Wczytuje pełną listę wierszy (start, wczytanie pliku, filtrowanie).
+        """
+        self.keys = list(keys)
+        if self.selected not in self.keys:
+            self.selected = None
+        self._rebuild()
+    
+    def insert(self, key, index=None):
+        if index is None:
+            index = len(self.keys)
+        self.keys.insert(index, key)
+        if self._mode_changed():
+            return
+        if self.virtual:
+            self._render()
+        else:
+            self.tree.insert("", index, iid=key, values=self.row_values(key, index))
+            self._refresh_from(index + 1)
+    
+    def extend(self, keys):
+        """
+        Dodaje wiele wierszy na końcu listy jedną operacją.
+        """
+        start = len(self.keys)
+        self.keys.extend(keys)
+        if self._mode_changed():
+            return
+        if self.virtual:
+            self._render()
+        else:
+            row_values = self.row_values
+            insert = self.tree.insert
+            with tracer.span("tree.extend", rows=len(self.keys) - start):
+                for i in range(start, len(self.keys)):
+                    key = self.keys[i]
+                    insert("", tk.END, iid=key, values=row_values(key, i))
+    
+    def update(self, key):
+        try:
+            index = self.keys.index(key)
+        except ValueError:
+            # Wiersz ukryty (np. przez filtr) - nie ma czego odświeżać
+            return
+        if self.virtual:
+            slot = index - self.offset
+            if 0 <= slot < len(self.slots):
+                self.tree.item(self.slots[slot], values=self.row_values(key, index))
+        else:
+            self.tree.item(key, values=self.row_values(key, index))
+    
+    def remove(self, key):
+        try:
+            index = self.keys.index(key)
+        except ValueError:
+            return
+        del self.keys[index]
+        if self.selected == key:
+            self.selected = None
+        if self._mode_changed():
+            return
+        if self.virtual:
+            self._render()
+        else:
+            self.tree.delete(key)
+            self._refresh_from(index)
+    
+    def index(self, key):
+        return self.keys.index(key)
+    
+    def selected_key(self):
+        """
+        Zwraca identyfikator zaznaczonego wiersza (również gdy jest poza widokiem).
+        """
+        return self.selected
+    
+    def selected_keys(self):
+        """
+        Zwraca identyfikatory wszystkich zaznaczonych wierszy.
+        """
+        selection = self.tree.selection()
+        if not self.virtual:
+            return list(selection)
+        keys = [self.keys[self.offset + self.slots.index(iid)]
+                for iid in selection if iid in self.slots]
+        if self.selected is not None and self.selected not in keys:
+            keys.append(self.selected)
+        return keys
+    
+    def select(self, key):
+        self.selected = key
+        if self.virtual:
+            index = self.keys.index(key)
+            if not self.offset <= index < self.offset + len(self.slots):
+                self.offset = index
+            self._render()
+        else:
+            self.tree.selection_set(key)
+            self.tree.see(key)
+    
+    def _refresh_from(self, index):
+        if self.positional:
+            for i in range(index, len(self.keys)):
+                key = self.keys[i]
+                self.tree.item(key, values=self.row_values(key, i))
+    
+    def _mode_changed(self):
+        if (len(self.keys) >= self.virtual_rows) != self.virtual:
+            self._rebuild()
+            return True
+        return False
+    
+    def _rebuild(self):
+        with tracer.span("tree.rebuild", rows=len(self.keys)):
+            children = self.tree.get_children()
+            if children:
+                self.tree.delete(*children)
+            self.slots = []
+            self.virtual = len(self.keys) >= self.virtual_rows
+            if self.virtual:
+                # Przewijanie obsługujemy sami - Treeview zawiera tylko widoczne wiersze
+                self.scrollbar.configure(command=self._on_scroll)
+                self.tree.configure(yscrollcommand="")
+                self._render()
+            else:
+                self.scrollbar.configure(command=self.tree.yview)
+                self.tree.configure(yscrollcommand=self.scrollbar.set)
+                row_values = self.row_values
+                insert = self.tree.insert
+                for i, key in enumerate(self.keys):
+                    insert("", tk.END, iid=key, values=row_values(key, i))
+                if self.selected is not None:
+                    self.tree.selection_set(self.selected)
+    
+    def _visible_rows(self):
+        if self.slots:
+            bbox = self.tree.bbox(self.slots[0])
+            if bbox:
+                header, row_height = bbox[1], bbox[3]
+                return max(1, (self.tree.winfo_height() - header) // max(1, row_height))
+        return int(self.tree.cget("height"))
+    
+    def _render(self):
+        total = len(self.keys)
+        visible = self._visible_rows()
+        self.offset = max(0, min(self.offset, total - visible))
+        count = min(visible, total - self.offset)
+        
+        # Dopasuj liczbę wierszy-slotów do widocznego obszaru
+        while len(self.slots) < count:
+            self.slots.append(self.tree.insert("", tk.END, iid=f"__slot{len(self.slots)}"))
+        while len(self.slots) > count:
+            self.tree.delete(self.slots.pop())
+        
+        selected_slot = None
+        for slot, iid in enumerate(self.slots):
+            index = self.offset + slot
+            key = self.keys[index]
+            self.tree.item(iid, values=self.row_values(key, index))
+            if key == self.selected:
+                selected_slot = iid
+        if selected_slot is not None:
+            if self.tree.selection() != (selected_slot,):
+                self.tree.selection_set(selected_slot)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+        
+        if total:
+            self.scrollbar.set(self.offset / total, (self.offset + count) / total)
+        else:
+            self.scrollbar.set(0, 1)
+    
+    def _scroll_to(self, offset):
+        self.offset = offset
+        self._render()
+    
+    def _on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self.keys)))
+        else:
+            step = len(self.slots) if unit == "pages" else 1
+            self._scroll_to(self.offset + int(amount) * step)
+    
+    def _on_wheel(self, event):
+        if not self.virtual:
+            return None
+        if event.num == 4:
+            delta = -3
+        elif event.num == 5:
+            delta = 3
+        else:
+            delta = -3 if event.delta > 0 else 3
+        self._scroll_to(self.offset + delta)
+        return "break"
+    
+    def _on_key(self, step):
+        if not self.virtual or not self.keys:
+            return None
+        index = self.keys.index(self.selected) + step if self.selected is not None else 0
+        index = max(0, min(index, len(self.keys) - 1))
+        self.selected = self.keys[index]
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + len(self.slots):
+            self.offset = index - len(self.slots) + 1
+        self._render()
+        return "break"
+    
+    def _on_configure(self, event):
+        if self.virtual:
+            self._render()
+    
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if not self.virtual:
+            self.selected = selection[0] if selection else None
+        elif selection and selection[0] in self.slots:
+            self.selected = self.keys[self.offset + self.slots.index(selection[0])]
+
+
+class OfferCreatorApp:
+    def __init__(self, root, startup=None):
+        self.root = root
+        # Pomiar etapów startu (StartupTimer) lub None
+        self.startup = startup
+        self.root.title("Tworzenie Ofert")
+        self.root.geometry("1000x700")
+        
+        # Dane firmy (stałe)
+        self.company_data = {
+            "name": "",
+            "address": "",
+            "city": "",
+            "postal_code": "",
+            "nip": "",
+            "phone": "",
+            "email": "",
+            "bank_account": "",
+            # Nagłówek firmowy na każdej stronie PDF ("1" - włączony) i plik logo
+            "letterhead": "",
+            "logo": ""
+        }
+        
+        # Odbiorcy (zmienne) - wiersze Treeview mają identyfikatory odbiorców
+        self.recipients = RecipientRepository()
+        self.selected_recipient_id = None
+        # Wybór odbiorcy oferty (pole jest w zakładce oferty, budowanej później)
+        self.selected_recipient = tk.StringVar()
+        self._recipient_combo_dirty = True
+        self._recipient_combo_query = None
+        self._recipient_combo_ids = []
+        # Wczytywanie odbiorców w tle: zapisy zmian czekają na jego koniec
+        self._recipients_loading = False
+        self._pending_recipient_save = False
+        
+        # Magazyn danych (pliki JSON lub baza SQLite, patrz OFFER_DB)
+        self.store = open_store()
+        
+        # Pozycje oferty (klucze pozycji są identyfikatorami wierszy w Treeview)
+        self.offer_items = OfferItemStore()
+        self._item_sort = None
+        # Generator pozycji wczytywanej właśnie oferty (patrz load_offer_json)
+        self._item_loader = None
+        
+        # Katalog produktów do podpowiadania nazw i cen pozycji
+        self.catalog = ProductCatalog()
+        self._autofilled_price = None
+        
+        # Generowanie plików w tle (kolejka zadań)
+        self.render_queue = RenderQueue()
+        
+        # Archiwum zapisanych i wygenerowanych ofert (SQLite, patrz OFFER_ARCHIVE)
+        try:
+            self.archive = open_archive()
+        except sqlite3.Error:
+            self.archive = None
+        self._archive_results = {}
+        
+        # Widżety zakładek budowanych przy pierwszym wybraniu
+        self.recipient_rows = None
+        self.archive_rows = None
+        
+        self.setup_ui()
+        self.load_company_data()
+    
+    def setup_ui(self):
+        # Główny kontener z zakładkami
+        notebook = ttk.Notebook(self.root)
+        notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.notebook = notebook
+        
+        # Zakładka 1: Dane firmy
+        company_frame = ttk.Frame(notebook)
+        notebook.add(company_frame, text="Dane Firmy")
+        self.setup_company_tab(company_frame)
+        
+        # Pozostałe zakładki są budowane dopiero przy pierwszym wybraniu
+        self._lazy_tabs = {}
+        
+        # Zakładka 2: Odbiorcy
+        recipients_frame = ttk.Frame(notebook)
+        notebook.add(recipients_frame, text="Odbiorcy")
+        self._lazy_tabs[str(recipients_frame)] = (recipients_frame, self.setup_recipients_tab)
+        
+        # Zakładka 3: Tworzenie Oferty
+        offer_frame = ttk.Frame(notebook)
+        notebook.add(offer_frame, text="Tworzenie Oferty")
+        self._lazy_tabs[str(offer_frame)] = (offer_frame, self.setup_offer_tab)
+        self.offer_frame = offer_frame
+        
+        # Zakładka 4: Archiwum ofert
+        archive_frame = ttk.Frame(notebook)
+        notebook.add(archive_frame, text="Archiwum")
+        self._lazy_tabs[str(archive_frame)] = (archive_frame, self.setup_archive_tab)
+        
+        notebook.bind("<<NotebookTabChanged>>", lambda event: self.build_tab(notebook.select()))
+    
+    def build_tab(self, frame):
+        # Buduje zakładkę (ramkę lub jej nazwę Tk) przy pierwszym wybraniu
+        tab = self._lazy_tabs.pop(str(frame), None)
+        if tab is not None:
+            frame, setup = tab
+            setup(frame)
+    
+    def setup_company_tab(self, parent):
+        # Nagłówek
+        header = ttk.Label(parent, text="Stałe Dane Firmy", font=("Arial", 16, "bold"))
+        header.pack(pady=10)
+        
+        # Ramka z polami
+        form_frame = ttk.LabelFrame(parent, text="Informacje o firmie", padding=15)
+        form_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        
+        # Pola formularza
+        fields = [
+            ("Nazwa firmy:", "name"),
+            ("Adres:", "address"),
+            ("Miasto:", "city"),
+            ("Kod pocztowy:", "postal_code"),
+            ("NIP:", "nip"),
+            ("Telefon:", "phone"),
+            ("Email:", "email"),
+            ("Numer konta bankowego:", "bank_account")
+        ]
+        
+        self.company_entries = {}
+        for i, (label, key) in enumerate(fields):
+            row_frame = ttk.Frame(form_frame)
+            row_frame.pack(fill=tk.X, pady=5)
+            
+            ttk.Label(row_frame, text=label, width=20).pack(side=tk.LEFT)
+            entry = ttk.Entry(row_frame, width=50)
+            entry.pack(side=tk.LEFT, padx=10, fill=tk.X, expand=True)
+            self.company_entries[key] = entry
+        
+        # Nagłówek firmowy z opcjonalnym logo
+        row_frame = ttk.Frame(form_frame)
+        row_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(row_frame, text="Logo:", width=20).pack(side=tk.LEFT)
+        entry = ttk.Entry(row_frame, width=50)
+        entry.pack(side=tk.LEFT, padx=10, fill=tk.X, expand=True)
+        self.company_entries["logo"] = entry
+        ttk.Button(row_frame, text="Wybierz...",
+                  command=self.choose_logo).pack(side=tk.LEFT)
+        
+        self.letterhead_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(form_frame, text="Nagłówek firmowy (logo i dane firmy) na każdej stronie PDF",
+                        variable=self.letterhead_var).pack(anchor=tk.W, pady=5)
+        
+        # Przyciski
+        button_frame = ttk.Frame(parent)
+        button_frame.pack(pady=10)
+        
+        ttk.Button(button_frame, text="Zapisz Dane Firmy", 
+                  command=self.save_company_data).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Wczytaj Dane Firmy", 
+                  command=self.load_company_data).pack(side=tk.LEFT, padx=5)
+    
+    def setup_recipients_tab(self, parent):
+        # Nagłówek
+        header = ttk.Label(parent, text="Zarządzanie Odbiorcami", font=("Arial", 16, "bold"))
+        header.pack(pady=10)
+        
+        # Lista odbiorców
+        list_frame = ttk.LabelFrame(parent, text="Lista Odbiorców", padding=10)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        
+        # Wyszukiwanie (nazwa, miasto, kod pocztowy, NIP)
+        search_frame = ttk.Frame(list_frame)
+        search_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        ttk.Label(search_frame, text="Szukaj:").pack(side=tk.LEFT)
+        self.recipient_search = ttk.Entry(search_frame, width=40)
+        self.recipient_search.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        self.recipient_search.bind("<KeyRelease>", lambda event: self.refresh_recipients_list())
+        
+        # Treeview dla listy
+        columns = ("Nazwa", "Adres", "Miasto", "NIP")
+        self.recipients_tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=10)
+        
+        for col in columns:
+            self.recipients_tree.heading(col, text=col)
+            self.recipients_tree.column(col, width=150)
+        
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.recipients_tree.yview)
+        self.recipients_tree.configure(yscrollcommand=scrollbar.set)
+        
+        self.recipients_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.recipient_rows = TreeRows(self.recipients_tree, scrollbar, self.recipient_row_values)
+        
+        # Formularz dodawania/edycji
+        form_frame = ttk.LabelFrame(parent, text="Dodaj/Edytuj Odbiorcę", padding=15)
+        form_frame.pack(fill=tk.X, padx=20, pady=10)
+        
+        self.recipient_entries = {}
+        fields = [
+            ("Nazwa:", "name"),
+            ("Adres:", "address"),
+            ("Miasto:", "city"),
+            ("Kod pocztowy:", "postal_code"),
+            ("NIP:", "nip"),
+            ("Telefon:", "phone"),
+            ("Email:", "email")
+        ]
+        
+        for i, (label, key) in enumerate(fields):
+            row_frame = ttk.Frame(form_frame)
+            row_frame.pack(fill=tk.X, pady=3)
+            
+            ttk.Label(row_frame, text=label, width=15).pack(side=tk.LEFT)
+            entry = ttk.Entry(row_frame, width=40)
+            entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+            self.recipient_entries[key] = entry
+        
+        # Przyciski
+        button_frame = ttk.Frame(parent)
+        button_frame.pack(pady=10)
+        
+        ttk.Button(button_frame, text="Dodaj Odbiorcę", 
+                  command=self.add_recipient).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Edytuj Odbiorcę", 
+                  command=self.edit_recipient).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Usuń Odbiorcę", 
+                  command=self.delete_recipient).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Wyczyść Formularz", 
+                  command=self.clear_recipient_form).pack(side=tk.LEFT, padx=5)
+        
+        self.recipients_tree.bind("<Double-1>", self.on_recipient_select)
+        self.refresh_recipients_list()
+    
+    def setup_archive_tab(self, parent):
+        # Nagłówek
+        header = ttk.Label(parent, text="Archiwum Ofert", font=("Arial", 16, "bold"))
+        header.pack(pady=10)
+        
+        # Wyszukiwanie (nazwy pozycji, odbiorca, NIP) i zakres dat
+        search_frame = ttk.Frame(parent)
+        search_frame.pack(fill=tk.X, padx=20)
+        ttk.Label(search_frame, text="Szukaj:").pack(side=tk.LEFT)
+        self.archive_search = ttk.Entry(search_frame, width=40)
+        self.archive_search.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        ttk.Label(search_frame, text="Od:").pack(side=tk.LEFT, padx=(10, 0))
+        self.archive_date_from = ttk.Entry(search_frame, width=12)
+        self.archive_date_from.pack(side=tk.LEFT, padx=5)
+        ttk.Label(search_frame, text="Do:").pack(side=tk.LEFT)
+        self.archive_date_to = ttk.Entry(search_frame, width=12)
+        self.archive_date_to.pack(side=tk.LEFT, padx=5)
+        for entry in (self.archive_search, self.archive_date_from, self.archive_date_to):
+            entry.bind("<KeyRelease>", lambda event: self.refresh_archive_list())
+        
+        # Lista ofert
+        list_frame = ttk.LabelFrame(parent, text="Oferty", padding=10)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        
+        columns = ("Data", "Odbiorca", "NIP", "Pozycji", "Suma", "Plik")
+        self.archive_tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=15)
+        for col in columns:
+            self.archive_tree.heading(col, text=col)
+        self.archive_tree.column("Data", width=90)
+        self.archive_tree.column("Odbiorca", width=220)
+        self.archive_tree.column("NIP", width=100)
+        self.archive_tree.column("Pozycji", width=70)
+        self.archive_tree.column("Suma", width=100)
+        self.archive_tree.column("Plik", width=250)
+        
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.archive_tree.yview)
+        self.archive_tree.configure(yscrollcommand=scrollbar.set)
+        
+        self.archive_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.archive_rows = TreeRows(self.archive_tree, scrollbar, self.archive_row_values)
+        
+        # Przyciski
+        button_frame = ttk.Frame(parent)
+        button_frame.pack(pady=5)
+        
+        ttk.Button(button_frame, text="Otwórz Ofertę", 
+                  command=self.open_archived_offer).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Indeksuj Folder", 
+                  command=self.index_archive_folder).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Odśwież", 
+                  command=self.refresh_archive_list).pack(side=tk.LEFT, padx=5)
+        
+        self.archive_status = ttk.Label(parent, text="")
+        self.archive_status.pack(pady=(0, 10))
+        
+        self.archive_tree.bind("<Double-1>", lambda event: self.open_archived_offer())
+        self.refresh_archive_list()
+    
+    def setup_offer_tab(self, parent):
+        # Wybór odbiorcy
+        recipient_frame = ttk.LabelFrame(parent, text="Wybór Odbiorcy", padding=10)
         recipient_frame.pack(fill=tk.X, padx=20, pady=10)
         
-        ttk.Label(recipient_frame, text="Odbiorca:").pack(side=tk.LEFT, padx=5)
-        self.selected_recipient = tk.StringVar()
-        self.recipient_combo = ttk.Combobox(recipient_frame, textvariable=self.selected_recipient, 
-                                           width=50, state="readonly")
-        self.recipient_combo.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
-        self.recipient_combo.bind("<<ComboboxSelected>>", self.update_recipient_combo)
+        ttk.Label(recipient_frame, text="Odbiorca:").pack(side=tk.LEFT, padx=5)
+        # Lista wartości jest uzupełniana dopiero przy rozwinięciu (postcommand);
+        # wpisany tekst filtruje listę, Enter wybiera pierwszego pasującego odbiorcę
+        self.recipient_combo = ttk.Combobox(recipient_frame, textvariable=self.selected_recipient, 
+                                           width=50,
+                                           postcommand=self.fill_recipient_combo)
+        self.recipient_combo.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        self.recipient_combo.bind("<<ComboboxSelected>>", self.on_recipient_combo_select)
+        self.recipient_combo.bind("<KeyRelease>", self.on_recipient_combo_key)
+        self.recipient_combo.bind("<Return>", self.on_recipient_combo_return)
+        
+        # Pozycje oferty
+        items_frame = ttk.LabelFrame(parent, text="Pozycje Oferty", padding=10)
+        items_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        
+        # Treeview dla pozycji
+        columns = ("Lp", "Nazwa", "Ilosc", "Cena jednostkowa", "Wartosc")
+        self.items_tree = ttk.Treeview(items_frame, columns=columns, show="headings", height=8)
+        
+        sort_fields = {"Nazwa": "name", "Ilosc": "quantity",
+                       "Cena jednostkowa": "unit_price", "Wartosc": "total"}
+        for col in columns:
+            if col in sort_fields:
+                self.items_tree.heading(col, text=col,
+                                        command=functools.partial(self.sort_items, sort_fields[col]))
+            else:
+                self.items_tree.heading(col, text=col)
+            if col == "Lp":
+                self.items_tree.column(col, width=50)
+            elif col == "Nazwa":
+                self.items_tree.column(col, width=300)
+            else:
+                self.items_tree.column(col, width=120)
+        
+        scrollbar_items = ttk.Scrollbar(items_frame, orient=tk.VERTICAL, 
+                                       command=self.items_tree.yview)
+        self.items_tree.configure(yscrollcommand=scrollbar_items.set)
+        
+        self.items_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar_items.pack(side=tk.RIGHT, fill=tk.Y)
+        self.item_rows = TreeRows(self.items_tree, scrollbar_items, self.item_row_values,
+                                  positional=True)
+        
+        # Formularz pozycji
+        item_form_frame = ttk.LabelFrame(parent, text="Dodaj/Edytuj Pozycję", padding=15)
+        item_form_frame.pack(fill=tk.X, padx=20, pady=10)
+        
+        self.item_entries = {}
+        item_fields = [
+            ("Nazwa pozycji:", "name"),
+            ("Ilosc:", "quantity"),
+            ("Cena jednostkowa:", "unit_price")
+        ]
+        
+        for label, key in item_fields:
+            row_frame = ttk.Frame(item_form_frame)
+            row_frame.pack(fill=tk.X, pady=3)
+            
+            ttk.Label(row_frame, text=label, width=20).pack(side=tk.LEFT)
+            if key == "name":
+                # Nazwa z podpowiedziami z katalogu produktów
+                entry = ttk.Combobox(row_frame, width=38)
+                entry.bind("<KeyRelease>", self.on_item_name_key)
+                entry.bind("<<ComboboxSelected>>", lambda event: self.fill_catalog_price())
+                entry.bind("<FocusOut>", lambda event: self.fill_catalog_price())
+            else:
+                entry = ttk.Entry(row_frame, width=40)
+            entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+            self.item_entries[key] = entry
+        
+        # Przyciski pozycji
+        item_button_frame = ttk.Frame(parent)
+        item_button_frame.pack(pady=5)
+        
+        ttk.Button(item_button_frame, text="Dodaj Pozycję", 
+                  command=self.add_item).pack(side=tk.LEFT, padx=5)
+        ttk.Button(item_button_frame, text="Edytuj Pozycję", 
+                  command=self.edit_item).pack(side=tk.LEFT, padx=5)
+        ttk.Button(item_button_frame, text="Usuń Pozycję", 
+                  command=self.delete_item).pack(side=tk.LEFT, padx=5)
+        ttk.Button(item_button_frame, text="Wyczyść Formularz", 
+                  command=self.clear_item_form).pack(side=tk.LEFT, padx=5)
+        ttk.Button(item_button_frame, text="W Górę", 
+                  command=lambda: self.move_item(-1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(item_button_frame, text="W Dół", 
+                  command=lambda: self.move_item(1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(item_button_frame, text="Zmień Ceny (%)", 
+                  command=self.change_item_prices).pack(side=tk.LEFT, padx=5)
+        ttk.Button(item_button_frame, text="Importuj CSV/TSV", 
+                  command=self.import_items_file).pack(side=tk.LEFT, padx=5)
+        ttk.Button(item_button_frame, text="Wklej ze Schowka", 
+                  command=self.paste_items).pack(side=tk.LEFT, padx=5)
+        
+        # Suma
+        total_frame = ttk.Frame(parent)
+        total_frame.pack(fill=tk.X, padx=20, pady=10)
+        
+        self.total_label = ttk.Label(total_frame, text="Suma: 0.00 PLN", 
+                                    font=("Arial", 12, "bold"))
+        self.total_label.pack(side=tk.RIGHT)
+        
+        # Przyciski oferty
+        offer_button_frame = ttk.Frame(parent)
+        offer_button_frame.pack(pady=10)
+        
+        ttk.Button(offer_button_frame, text="Generuj Ofertę (TXT)", 
+                  command=self.generate_offer_txt).pack(side=tk.LEFT, padx=5)
+        ttk.Button(offer_button_frame, text="Generuj Ofertę (PDF)", 
+                  command=self.generate_offer_pdf).pack(side=tk.LEFT, padx=5)
+        ttk.Button(offer_button_frame, text="Korespondencja Seryjna (PDF)", 
+                  command=self.generate_merge_pdfs).pack(side=tk.LEFT, padx=5)
+        ttk.Button(offer_button_frame, text="Wczytaj Ofertę (JSON)", 
+                  command=self.load_offer_json).pack(side=tk.LEFT, padx=5)
+        ttk.Button(offer_button_frame, text="Zapisz Ofertę (JSON)", 
+                  command=self.save_offer_json).pack(side=tk.LEFT, padx=5)
+        ttk.Button(offer_button_frame, text="Wyczyść Ofertę", 
+                  command=self.clear_offer).pack(side=tk.LEFT, padx=5)
+        ttk.Button(offer_button_frame, text="Wczytaj Szablon", 
+                  command=self.load_template).pack(side=tk.LEFT, padx=5)
+        
+        # Postęp generowania w tle
+        render_frame = ttk.Frame(parent)
+        render_frame.pack(fill=tk.X, padx=20, pady=(0, 10))
+        
+        self.render_status = ttk.Label(render_frame, text="")
+        self.render_status.pack(side=tk.LEFT)
+        self.render_cancel_button = ttk.Button(render_frame, text="Anuluj", 
+                                               command=self.cancel_render, state="disabled")
+        self.render_cancel_button.pack(side=tk.RIGHT, padx=5)
+        self.render_progress = ttk.Progressbar(render_frame, maximum=100, length=200)
+        self.render_progress.pack(side=tk.RIGHT, padx=5)
+        
+        self.items_tree.bind("<Double-1>", self.on_item_select)
+        self.items_tree.bind("<<Paste>>", lambda event: self.paste_items())
+        self.load_catalog()
+        self.update_recipient_combo()
+    
+    def save_company_data(self):
+        for key, entry in self.company_entries.items():
+            value = entry.get()
+            # Normalizuj kodowanie przed zapisaniem
+            self.company_data[key] = normalize_encoding(value)
+        self.company_data["letterhead"] = "1" if self.letterhead_var.get() else ""
+        # Przygotowany nagłówek firmowy jest nieaktualny
+        clear_letterheads()
+        
+        # Zapisz do pliku JSON (lub bazy)
+        try:
+            self.store.save_company(self.company_data)
+            messagebox.showinfo("Sukces", "Dane firmy zostały zapisane!")
+        except Exception as e:
+            messagebox.showerror("Błąd", f"Nie udało się zapisać danych: {str(e)}")
+    
+    def load_company_data(self):
+        # Wczytaj z pliku JSON (lub bazy)
+        try:
+            company_data = self.store.load_company()
+        except Exception as e:
+            messagebox.showerror("Błąd", f"Nie udało się wczytać danych: {str(e)}")
+            return
+        
+        if company_data is not None:
+            try:
+                self.company_data = company_data
+                
+                for key, entry in self.company_entries.items():
+                    entry.delete(0, tk.END)
+                    value = self.company_data.get(key, "")
+                    entry.insert(0, value)
+                self.letterhead_var.set(bool(self.company_data.get("letterhead")))
+            except Exception as e:
+                messagebox.showerror("Błąd", f"Nie udało się wczytać danych: {str(e)}")
+        else:
+            # Wypełnij puste wartości
+            for key, entry in self.company_entries.items():
+                entry.delete(0, tk.END)
+                entry.insert(0, self.company_data.get(key, ""))
+            self.letterhead_var.set(bool(self.company_data.get("letterhead")))
+    
+    def choose_logo(self):
+        filename = filedialog.askopenfilename(
+            filetypes=[("Obrazy", "*.png *.jpg *.jpeg *.gif *.bmp"), ("Wszystkie pliki", "*.*")]
+        )
+        
+        if not filename:
+            return
         
-        # Pozycje oferty
-        items_frame = ttk.LabelFrame(parent, text="Pozycje Oferty", padding=10)
-        items_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        self.company_entries["logo"].delete(0, tk.END)
+        self.company_entries["logo"].insert(0, filename)
+    
+    def add_recipient(self):
+        recipient = {}
+        for key, entry in self.recipient_entries.items():
+            value = entry.get()
+            # Normalizuj kodowanie wszystkich wartości
+            recipient[key] = normalize_encoding(value)
         
-        # Treeview dla pozycji
-        columns = ("Lp", "Nazwa", "Ilosc", "Cena jednostkowa", "Wartosc")
-        self.items_tree = ttk.Treeview(items_frame, columns=columns, show="headings", height=8)
+        if not recipient.get("name"):
+            messagebox.showwarning("Uwaga", "Nazwa odbiorcy jest wymagana!")
+            return
         
-        for col in columns:
-            self.items_tree.heading(col, text=col)
-            if col == "Lp":
-                self.items_tree.column(col, width=50)
-            elif col == "Nazwa":
-                self.items_tree.column(col, width=300)
-            else:
-                self.items_tree.column(col, width=120)
+        recipient_id = self.recipients.add(recipient)
+        self.save_recipient(recipient_id)
+        self.recipient_rows.insert(recipient_id)
+        self.clear_recipient_form()
+        self.update_recipient_combo()
+        messagebox.showinfo("Sukces", "Odbiorca został dodany!")
+    
+    def edit_recipient(self):
+        recipient_id = self.recipient_rows.selected_key()
+        if recipient_id is None:
+            messagebox.showwarning("Uwaga", "Wybierz odbiorcę do edycji!")
+            return
         
-        scrollbar_items = ttk.Scrollbar(items_frame, orient=tk.VERTICAL, 
-                                       command=self.items_tree.yview)
-        self.items_tree.configure(yscrollcommand=scrollbar_items.set)
+        # Zaktualizuj dane z normalizacją kodowania
+        fields = {key: normalize_encoding(entry.get())
+                  for key, entry in self.recipient_entries.items()}
+        self.recipients.update(recipient_id, fields)
         
-        self.items_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar_items.pack(side=tk.RIGHT, fill=tk.Y)
+        self.save_recipient(recipient_id)
+        self.recipient_rows.update(recipient_id)
+        if recipient_id == self.selected_recipient_id:
+            self.select_recipient(recipient_id)
+        self.clear_recipient_form()
+        self.update_recipient_combo()
+        messagebox.showinfo("Sukces", "Odbiorca został zaktualizowany!")
+    
+    def delete_recipient(self):
+        recipient_id = self.recipient_rows.selected_key()
+        if recipient_id is None:
+            messagebox.showwarning("Uwaga", "Wybierz odbiorcę do usunięcia!")
+            return
         
-        # Formularz pozycji
-        item_form_frame = ttk.LabelFrame(parent, text="Dodaj/Edytuj Pozycję", padding=15)
-        item_form_frame.pack(fill=tk.X, padx=20, pady=10)
+        if messagebox.askyesno("Potwierdzenie", "Czy na pewno chcesz usunąć tego odbiorcę?"):
+            self.recipients.remove(recipient_id)
+            self.save_recipient(recipient_id, deleted=True)
+            self.recipient_rows.remove(recipient_id)
+            if recipient_id == self.selected_recipient_id:
+                self.select_recipient(None)
+            self.clear_recipient_form()
+            self.update_recipient_combo()
+    
+    def clear_recipient_form(self):
+        for entry in self.recipient_entries.values():
+            entry.delete(0, tk.END)
+    
+    def on_recipient_select(self, event):
+        recipient_id = self.recipient_rows.selected_key()
+        if recipient_id is not None:
+            # Wypełnij formularz
+            recipient = self.recipients.get(recipient_id)
+            for key, entry in self.recipient_entries.items():
+                entry.delete(0, tk.END)
+                entry.insert(0, recipient.get(key, ""))
+    
+    def recipient_row_values(self, recipient_id, index):
+        recipient = self.recipients.get(recipient_id)
+        return (
+            recipient.get("name", ""),
+            recipient.get("address", ""),
+            recipient.get("city", ""),
+            recipient.get("nip", "")
+        )
+    
+    def refresh_recipients_list(self):
+        # Pełne przeładowanie listy (np. po wczytaniu pliku lub zmianie filtra)
+        if self.recipient_rows is None:
+            # Zakładka odbiorców nie jest jeszcze zbudowana
+            return
+        self.recipient_rows.reset(self.recipients.search(self.recipient_search.get()))
+    
+    def save_recipients(self):
+        if self._recipients_loading:
+            self._pending_recipient_save = True
+            return
+        try:
+            with tracer.span("recipients.save", recipients=len(self.recipients)):
+                self.store.save_recipients(self.recipients)
+        except Exception as e:
+            messagebox.showerror("Błąd", f"Nie udało się zapisać odbiorców: {str(e)}")
+    
+    def save_recipient(self, recipient_id, deleted=False):
+        # Zapisz tylko zmienionego odbiorcę (w magazynie JSON - cały plik)
+        if self._recipients_loading:
+            # Zapis częściowo wczytanej listy nadpisałby resztę odbiorców -
+            # wszystko zostanie zapisane po wczytaniu
+            self._pending_recipient_save = True
+            return
+        try:
+            with tracer.span("recipients.save_one", deleted=deleted):
+                if deleted:
+                    self.store.delete_recipient(self.recipients, recipient_id)
+                else:
+                    self.store.save_recipient(self.recipients, recipient_id)
+        except Exception as e:
+            messagebox.showerror("Błąd", f"Nie udało się zapisać odbiorców: {str(e)}")
+    
+    def load_recipients(self):
+        # Plik (lub baza) jest czytany w osobnym wątku przez osobne połączenie
+        # z magazynem, a lista wypełnia się porcjami - okno działa od razu
+        results = queue.Queue()
+        store = self.store.reopen()
+        
+        def run():
+            try:
+                # Kodowanie naprawia magazyn danych przy wczytaniu
+                with tracer.span("recipients.load") as span:
+                    recipients = store.load_recipients()
+                    span["recipients"] = len(recipients or ())
+                results.put(("done", recipients))
+            except Exception as e:
+                results.put(("error", e))
+            finally:
+                store.close()
+        
+        self._recipients_loading = True
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(20, self.poll_recipient_load, results)
+    
+    def poll_recipient_load(self, results):
+        try:
+            kind, result = results.get_nowait()
+        except queue.Empty:
+            self.root.after(20, self.poll_recipient_load, results)
+            return
+        
+        if kind == "error":
+            self.finish_recipient_load()
+            messagebox.showerror("Błąd", f"Nie udało się wczytać odbiorców: {str(result)}")
+        elif result is None:
+            self.finish_recipient_load()
+        else:
+            self.add_loaded_recipients(result, 0)
+    
+    def add_loaded_recipients(self, recipients, start):
+        try:
+            ids = self.recipients.extend(recipients[start:start + RECIPIENT_LOAD_BATCH])
+            if self.recipient_rows is not None and not self.recipient_search.get():
+                self.recipient_rows.extend(ids)
+            self.update_recipient_combo()
+        except Exception as e:
+            self.finish_recipient_load()
+            messagebox.showerror("Błąd", f"Nie udało się wczytać odbiorców: {str(e)}")
+            return
+        
+        start += RECIPIENT_LOAD_BATCH
+        if start < len(recipients):
+            self.root.after(1, self.add_loaded_recipients, recipients, start)
+        else:
+            self.finish_recipient_load()
+    
+    def finish_recipient_load(self):
+        self._recipients_loading = False
+        # Zapisz identyfikatory nadane odbiorcom ze starszego pliku i zmiany
+        # wprowadzone w trakcie wczytywania
+        if self.recipients.assigned_ids or self._pending_recipient_save:
+            self._pending_recipient_save = False
+            self.save_recipients()
+        if self.recipient_rows is not None and self.recipient_search.get():
+            self.refresh_recipients_list()
+        self.update_recipient_combo()
+        if self.startup is not None:
+            self.startup.mark("odbiorcy wczytani")
+    
+    def update_recipient_combo(self, event=None):
+        # Lista zostanie przebudowana przy najbliższym rozwinięciu
+        self._recipient_combo_dirty = True
+        if self.selected_recipient_id is None and len(self.recipients):
+            self.select_recipient(self.recipients.first()["id"])
+    
+    def recipient_combo_query(self):
+        # Tekst wybranego odbiorcy nie jest filtrem - pokaż wtedy całą listę
+        text = self.selected_recipient.get()
+        selected = self.get_selected_recipient_data()
+        if selected is not None and text == self.recipient_label(selected):
+            return ""
+        return text
+    
+    def fill_recipient_combo(self):
+        query = self.recipient_combo_query()
+        if self._recipient_combo_dirty or query != self._recipient_combo_query:
+            self._recipient_combo_ids = self.recipients.search(query, RECIPIENT_COMBO_LIMIT)
+            self.recipient_combo['values'] = [self.recipient_label(self.recipients.get(i))
+                                              for i in self._recipient_combo_ids]
+            self._recipient_combo_query = query
+            self._recipient_combo_dirty = False
+    
+    def on_recipient_combo_key(self, event):
+        if event.keysym not in ("Return", "Escape", "Up", "Down", "Tab"):
+            self.fill_recipient_combo()
+    
+    def on_recipient_combo_return(self, event):
+        self.fill_recipient_combo()
+        if self._recipient_combo_ids:
+            self.select_recipient(self._recipient_combo_ids[0])
+    
+    def recipient_label(self, recipient):
+        """
+        Nazwa odbiorcy na liście wyboru; powtarzające się nazwy są uzupełniane
+        o NIP lub miasto, żeby każda pozycja listy była jednoznaczna.
+        """
+        name = recipient.get("name", "")
+        if len(self.recipients.find_by_name(name)) < 2:
+            return name
+        if recipient.get("nip"):
+            return f"{name} (NIP: {recipient['nip']})"
+        if recipient.get("city"):
+            return f"{name} ({recipient['city']}, {recipient['id'][:6]})"
+        return f"{name} ({recipient['id'][:6]})"
+    
+    def select_recipient(self, recipient_id):
+        recipient = self.recipients.get(recipient_id) if recipient_id else None
+        self.selected_recipient_id = recipient["id"] if recipient else None
+        self.selected_recipient.set(self.recipient_label(recipient) if recipient else "")
+    
+    def on_recipient_combo_select(self, event=None):
+        index = self.recipient_combo.current()
+        if 0 <= index < len(self._recipient_combo_ids):
+            self.select_recipient(self._recipient_combo_ids[index])
+    
+    def add_item(self):
+        name = self.item_entries["name"].get()
+        quantity_str = self.item_entries["quantity"].get()
+        price_str = self.item_entries["unit_price"].get()
+        
+        if not name:
+            messagebox.showwarning("Uwaga", "Nazwa pozycji jest wymagana!")
+            return
+        
+        try:
+            quantity = parse_decimal(quantity_str)
+            price = parse_decimal(price_str)
+            
+            # Normalizuj kodowanie nazwy
+            name = normalize_encoding(name)
+            
+            row_id = self.offer_items.add(name, quantity, price)
+            self.item_rows.insert(row_id)
+            self.clear_item_form()
+            self.update_total()
+        except ValueError:
+            messagebox.showerror("Błąd", "Nieprawidłowa wartość ilości lub ceny!")
+    
+    def edit_item(self):
+        row_id = self.item_rows.selected_key()
+        if row_id is None:
+            messagebox.showwarning("Uwaga", "Wybierz pozycję do edycji!")
+            return
+        
+        name = self.item_entries["name"].get()
+        quantity_str = self.item_entries["quantity"].get()
+        price_str = self.item_entries["unit_price"].get()
+        
+        try:
+            quantity = parse_decimal(quantity_str)
+            price = parse_decimal(price_str)
+            
+            # Normalizuj kodowanie nazwy
+            name = normalize_encoding(name)
+            
+            self.offer_items.update(row_id, name, quantity, price)
+            self.item_rows.update(row_id)
+            self.clear_item_form()
+            self.update_total()
+        except (ValueError, KeyError):
+            messagebox.showerror("Błąd", "Nieprawidłowa wartość lub pozycja!")
+    
+    def delete_item(self):
+        row_id = self.item_rows.selected_key()
+        if row_id is None:
+            messagebox.showwarning("Uwaga", "Wybierz pozycję do usunięcia!")
+            return
+        
+        try:
+            self.offer_items.remove(row_id)
+            self.item_rows.remove(row_id)
+            self.clear_item_form()
+            self.update_total()
+        except KeyError:
+            messagebox.showerror("Błąd", "Nie można usunąć pozycji!")
+    
+    def clear_item_form(self):
+        for entry in self.item_entries.values():
+            entry.delete(0, tk.END)
+        self._autofilled_price = None
+    
+    def on_item_select(self, event):
+        row_id = self.item_rows.selected_key()
+        if row_id is not None:
+            item = self.offer_items.get(row_id)
+            if item is not None:
+                self.item_entries["name"].delete(0, tk.END)
+                self.item_entries["name"].insert(0, item.name)
+                self.item_entries["quantity"].delete(0, tk.END)
+                self.item_entries["quantity"].insert(0, str(item.quantity))
+                self.item_entries["unit_price"].delete(0, tk.END)
+                self.item_entries["unit_price"].insert(0, str(item.unit_price))
+    
+    def load_catalog(self):
+        try:
+            self.catalog.load()
+        except Exception as e:
+            messagebox.showerror("Błąd", f"Nie udało się wczytać katalogu produktów: {str(e)}")
+    
+    def update_catalog(self, items):
+        # Zapisz katalog tylko, gdy pojawiły się nowe produkty lub ceny
+        try:
+            if self.catalog.add_items(items):
+                self.catalog.save()
+        except Exception as e:
+            messagebox.showerror("Błąd", f"Nie udało się zapisać katalogu produktów: {str(e)}")
+    
+    def on_item_name_key(self, event):
+        entry = self.item_entries["name"]
+        typed = entry.get()
+        suggestions = self.catalog.suggest(typed)
+        entry["values"] = suggestions
+        
+        # Uzupełnij nazwę w polu (dopisana część jest zaznaczona, więc dalsze
+        # pisanie ją zastępuje); nie uzupełniaj przy kasowaniu i nawigacji
+        if (suggestions and event.keysym not in ("BackSpace", "Delete", "Left", "Right")
+                and len(event.char) == 1 and suggestions[0].casefold().startswith(typed.casefold())):
+            completion = suggestions[0]
+            entry.delete(0, tk.END)
+            entry.insert(0, completion)
+            entry.icursor(len(typed))
+            entry.select_range(len(typed), tk.END)
+        self.fill_catalog_price()
+    
+    def fill_catalog_price(self):
+        # Wpisz cenę z katalogu, jeśli pole ceny jest puste lub wypełnione automatycznie
+        price = self.catalog.price(self.item_entries["name"].get().strip())
+        price_entry = self.item_entries["unit_price"]
+        current = price_entry.get()
+        if price is None or (current and current != self._autofilled_price):
+            return
+        self._autofilled_price = f"{price:.2f}"
+        price_entry.delete(0, tk.END)
+        price_entry.insert(0, self._autofilled_price)
+    
+    def import_items_file(self):
+        filename = filedialog.askopenfilename(
+            filetypes=[("Pliki CSV/TSV", "*.csv *.tsv *.txt"), ("Wszystkie pliki", "*.*")]
+        )
+        
+        if not filename:
+            return
+        
+        try:
+            items, errors = read_item_file(filename)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            messagebox.showerror("Błąd", f"Nie udało się wczytać pliku: {str(e)}")
+            return
+        
+        self.add_items(items, errors)
+    
+    def paste_items(self):
+        try:
+            text = self.root.clipboard_get()
+        except tk.TclError:
+            messagebox.showwarning("Uwaga", "Schowek jest pusty!")
+            return
+        
+        try:
+            items, errors = read_item_text(text)
+        except csv.Error as e:
+            messagebox.showerror("Błąd", f"Nie udało się odczytać schowka: {str(e)}")
+            return
+        
+        self.add_items(items, errors)
+    
+    def add_items(self, items, errors=()):
+        # Wszystkie pozycje trafiają do listy i Treeview jedną operacją
+        if items:
+            self.item_rows.extend(self.offer_items.add_many(items))
+            self.update_total()
+        
+        message = f"Zaimportowano pozycji: {len(items)}"
+        if errors:
+            details = "\n".join(f"Wiersz {line_no}: {error}" for line_no, error in errors[:10])
+            if len(errors) > 10:
+                details += f"\n... oraz {len(errors) - 10} innych"
+            messagebox.showwarning("Uwaga", f"{message}\nPominięto błędne wiersze: {len(errors)}\n\n{details}")
+        else:
+            messagebox.showinfo("Sukces", message)
+    
+    def move_item(self, step):
+        row_id = self.item_rows.selected_key()
+        if row_id is None:
+            messagebox.showwarning("Uwaga", "Wybierz pozycję do przesunięcia!")
+            return
+        
+        index = self.item_rows.index(row_id)
+        new_index = self.offer_items.move(row_id, step)
+        if new_index != index:
+            self.item_rows.remove(row_id)
+            self.item_rows.insert(row_id, new_index)
+            self.item_rows.select(row_id)
+    
+    def sort_items(self, field):
+        # Ponowne kliknięcie tej samej kolumny odwraca kolejność
+        reverse = self._item_sort == (field, False)
+        self.offer_items.sort(field, reverse)
+        self._item_sort = (field, reverse)
+        self.refresh_items_list()
+    
+    def change_item_prices(self):
+        if not self.offer_items:
+            messagebox.showwarning("Uwaga", "Dodaj pozycje do oferty!")
+            return
+        
+        # Zmiana dotyczy zaznaczonych pozycji, a bez zaznaczenia - wszystkich
+        keys = self.item_rows.selected_keys() or self.offer_items.keys()
+        percent = simpledialog.askfloat(
+            "Zmień Ceny",
+            f"Zmiana ceny jednostkowej w % dla pozycji: {len(keys)}\n"
+            "(np. 10 - podwyżka, -5 - obniżka)",
+            parent=self.root)
+        if percent is None:
+            return
+        
+        self.offer_items.change_prices(keys, percent)
+        if len(keys) < len(self.offer_items) // 10:
+            for key in keys:
+                self.item_rows.update(key)
+        else:
+            self.refresh_items_list()
+        self.update_total()
+    
+    def item_row_values(self, row_id, index):
+        item = self.offer_items.get(row_id)
+        return (
+            index + 1,
+            item.name,
+            f"{item.quantity:.2f}",
+            f"{item.unit_price:.2f} PLN",
+            f"{item.total:.2f} PLN"
+        )
+    
+    def refresh_items_list(self):
+        # Pełne przeładowanie listy (np. po wczytaniu oferty)
+        self.item_rows.reset(self.offer_items.keys())
+    
+    def update_total(self):
+        self.total_label.config(text=f"Suma: {self.offer_items.total:.2f} PLN")
+    
+    def clear_offer(self):
+        self.cancel_item_load()
+        self.offer_items.clear()
+        self.refresh_items_list()
+        self.clear_item_form()
+        self.update_total()
+        self.select_recipient(None)
+    
+    def get_selected_recipient_data(self):
+        return self.recipients.get(self.selected_recipient_id)
+    
+    def generate_offer_txt(self):
+        if not self.offer_items:
+            messagebox.showwarning("Uwaga", "Dodaj pozycje do oferty!")
+            return
+        
+        recipient = self.get_selected_recipient_data()
+        if not recipient:
+            messagebox.showwarning("Uwaga", "Wybierz odbiorcę oferty!")
+            return
+        
+        # Wybierz miejsce zapisu
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=[("Pliki tekstowe", "*.txt"), ("Wszystkie pliki", "*.*")],
+            initialfile=f"Oferta_{recipient.get('name', '')}_{datetime.now().strftime('%Y%m%d')}.txt"
+        )
+        
+        if not filename:
+            return
+        
+        self.queue_render("txt", filename, recipient)
+    
+    def generate_offer_pdf(self):
+        if not REPORTLAB_AVAILABLE:
+            messagebox.showerror("Błąd", 
+                "Biblioteka reportlab nie jest zainstalowana!\n\n"
+                "Zainstaluj ją poleceniem:\npip install reportlab")
+            return
         
-        self.item_entries = {}
-        item_fields = [
-            ("Nazwa pozycji:", "name"),
-            ("Ilosc:", "quantity"),
-            ("Cena jednostkowa:", "unit_price")
-        ]
+        if not self.offer_items:
+            messagebox.showwarning("Uwaga", "Dodaj pozycje do oferty!")
+            return
         
-        for label, key in item_fields:
-            row_frame = ttk.Frame(item_form_frame)
-            row_frame.pack(fill=tk.X, pady=3)
-            
-            ttk.Label(row_frame, text=label, width=20).pack(side=tk.LEFT)
-            entry = ttk.Entry(row_frame, width=40)
-            entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
-            self.item_entries[key] = entry
+        recipient = self.get_selected_recipient_data()
+        if not recipient:
+            messagebox.showwarning("Uwaga", "Wybierz odbiorcę oferty!")
+            return
         
-        # Przyciski pozycji
-        item_button_frame = ttk.Frame(parent)
-        item_button_frame.pack(pady=5)
+        # Wybierz miejsce zapisu
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            filetypes=[("Pliki PDF", "*.pdf"), ("Wszystkie pliki", "*.*")],
+            initialfile=f"Oferta_{recipient.get('name', '')}_{datetime.now().strftime('%Y%m%d')}.pdf"
+        )
         
-        ttk.Button(item_button_frame, text="Dodaj Pozycję", 
-                  command=self.add_item).pack(side=tk.LEFT, padx=5)
-        ttk.Button(item_button_frame, text="Edytuj Pozycję", 
-                  command=self.edit_item).pack(side=tk.LEFT, padx=5)
-        ttk.Button(item_button_frame, text="Usuń Pozycję", 
-                  command=self.delete_item).pack(side=tk.LEFT, padx=5)
-        ttk.Button(item_button_frame, text="Wyczyść Formularz", 
-                  command=self.clear_item_form).pack(side=tk.LEFT, padx=5)
+        if not filename:
+            return
         
-        # Suma
-        total_frame = ttk.Frame(parent)
-        total_frame.pack(fill=tk.X, padx=20, pady=10)
+        self.queue_render("pdf", filename, recipient)
+    
+    def generate_merge_pdfs(self):
+        # Ta sama oferta dla odbiorców zaznaczonych w zakładce Odbiorcy
+        if not REPORTLAB_AVAILABLE:
+            messagebox.showerror("Błąd", 
+                "Biblioteka reportlab nie jest zainstalowana!\n\n"
+                "Zainstaluj ją poleceniem:\npip install reportlab")
+            return
         
-        self.total_label = ttk.Label(total_frame, text="Suma: 0.00 PLN", 
-                                    font=("Arial", 12, "bold"))
-        self.total_label.pack(side=tk.RIGHT)
+        if not self.offer_items:
+            messagebox.showwarning("Uwaga", "Dodaj pozycje do oferty!")
+            return
         
-        # Przyciski oferty
-        offer_button_frame = ttk.Frame(parent)
-        offer_button_frame.pack(pady=10)
+        ids = self.recipient_rows.selected_keys() if self.recipient_rows is not None else []
+        if not ids:
+            if not len(self.recipients):
+                messagebox.showwarning("Uwaga", "Brak odbiorców!")
+                return
+            if not messagebox.askyesno("Korespondencja seryjna",
+                    "Nie zaznaczono odbiorców w zakładce Odbiorcy.\n"
+                    f"Wygenerować oferty dla wszystkich odbiorców ({len(self.recipients)})?"):
+                return
+            ids = self.recipients.ids()
         
-        ttk.Button(offer_button_frame, text="Generuj Ofertę (TXT)", 
-                  command=self.generate_offer_txt).pack(side=tk.LEFT, padx=5)
-        ttk.Button(offer_button_frame, text="Generuj Ofertę (PDF)", 
-                  command=self.generate_offer_pdf).pack(side=tk.LEFT, padx=5)
-        ttk.Button(offer_button_frame, text="Wczytaj Ofertę (JSON)", 
-                  command=self.load_offer_json).pack(side=tk.LEFT, padx=5)
-        ttk.Button(offer_button_frame, text="Zapisz Ofertę (JSON)", 
-                  command=self.save_offer_json).pack(side=tk.LEFT, padx=5)
-        ttk.Button(offer_button_frame, text="Wyczyść Ofertę", 
-                  command=self.clear_offer).pack(side=tk.LEFT, padx=5)
+        directory = filedialog.askdirectory()
+        if not directory:
+            return
         
-        self.items_tree.bind("<Double-1>", self.on_item_select)
-        self.update_recipient_combo()
-    
-    def save_company_data(self):
-        for key, entry in self.company_entries.items():
-            value = entry.get()
-            # Normalizuj kodowanie przed zapisaniem
-            self.company_data[key] = normalize_encoding(value)
+        # Pliki powstają w tle (procesy robocze) z kopii danych oferty
+        recipients = [dict(self.recipients.get(recipient_id)) for recipient_id in ids]
+        company_data = dict(self.company_data)
+        items = self.offer_items.to_list()
+        offer_date = datetime.now()
+        archive = self.archive
+        results = queue.Queue()
         
-        # Zapisz do pliku JSON
-        try:
-            with open("company_data.json", "w", encoding="utf-8") as f:
-                json.dump(self.company_data, f, ensure_ascii=False, indent=2)
-            messagebox.showinfo("Sukces", "Dane firmy zostały zapisane!")
-        except Exception as e:
-            messagebox.showerror("Błąd", f"Nie udało się zapisać danych: {str(e)}")
-    
-    def load_company_data(self):
-        # Wczytaj z pliku JSON
-        if os.path.exists("company_data.json"):
+        def run():
             try:
-                with open("company_data.json", "r", encoding="utf-8") as f:
-                    self.company_data = json.load(f)
-                
-                # Napraw kodowanie danych
-                self.company_data = fix_string_encoding(self.company_data)
-                
-                for key, entry in self.company_entries.items():
-                    entry.delete(0, tk.END)
-                    value = self.company_data.get(key, "")
-                    entry.insert(0, value)
+                outcomes = merge_offer_pdfs(
+                    company_data, recipients, items, directory, offer_date,
+                    workers=os.cpu_count() or 1,
+                    progress=lambda done, total: results.put(("progress", (done, total))),
+                    start_method="spawn")
             except Exception as e:
-                messagebox.showerror("Błąd", f"Nie udało się wczytać danych: {str(e)}")
-        else:
-            # Wypełnij puste wartości
-            for key, entry in self.company_entries.items():
-                entry.delete(0, tk.END)
-                entry.insert(0, self.company_data.get(key, ""))
+                results.put(("error", e))
+                return
+            # Kopie ofert do archiwum są zapisywane w tle; wpisy dodaje poll_merge
+            # (połączenie z bazą archiwum należy do wątku interfejsu)
+            entries = []
+            if archive is not None:
+                base = {"date": offer_date.strftime("%Y-%m-%d"), "company": company_data,
+                        "items": items}
+                try:
+                    for (filename, error), recipient in zip(outcomes, recipients):
+                        if not error:
+                            offer_data = dict(base, recipient=recipient)
+                            entries.append(archive_entry(offer_data, filename,
+                                                         archive.store_copy(offer_data)))
+                except (OSError, ValueError) as e:
+                    entries = e
+            results.put(("done", (outcomes, entries)))
+        
+        threading.Thread(target=run, daemon=True).start()
+        self.render_status.config(text=f"Korespondencja seryjna: 0/{len(recipients)}")
+        self.root.after(200, self.poll_merge, results, directory)
     
-    def add_recipient(self):
-        recipient = {}
-        for key, entry in self.recipient_entries.items():
-            value = entry.get()
-            # Normalizuj kodowanie wszystkich wartości
-            recipient[key] = normalize_encoding(value)
+    def poll_merge(self, results, directory):
+        while True:
+            try:
+                kind, result = results.get_nowait()
+            except queue.Empty:
+                self.root.after(200, self.poll_merge, results, directory)
+                return
+            if kind != "progress":
+                break
+            done, total = result
+            self.render_status.config(text=f"Korespondencja seryjna: {done}/{total}")
+            self.render_progress["value"] = 100 * done / total
         
-        if not recipient.get("name"):
-            messagebox.showwarning("Uwaga", "Nazwa odbiorcy jest wymagana!")
+        self.render_status.config(text="")
+        self.render_progress["value"] = 0
+        if kind == "error":
+            messagebox.showerror("Błąd", f"Nie udało się wygenerować ofert: {str(result)}")
             return
         
-        self.recipients.append(recipient)
-        self.save_recipients()
-        self.refresh_recipients_list()
-        self.clear_recipient_form()
-        self.update_recipient_combo()
-        messagebox.showinfo("Sukces", "Odbiorca został dodany!")
+        result, entries = result
+        self.archive_entries(entries)
+        errors = [(filename, error) for filename, error in result if error]
+        message = (f"Wygenerowano ofert: {len(result) - len(errors)}\n"
+                   f"Folder: {directory}")
+        if errors:
+            message += f"\n\nBłędów: {len(errors)}\n" + "\n".join(
+                f"{os.path.basename(filename)}: {error}" for filename, error in errors[:10])
+            messagebox.showwarning("Uwaga", message)
+        else:
+            messagebox.showinfo("Sukces", message)
     
-    def edit_recipient(self):
-        selected = self.recipients_tree.selection()
-        if not selected:
-            messagebox.showwarning("Uwaga", "Wybierz odbiorcę do edycji!")
+    def queue_render(self, kind, filename, recipient):
+        # Plik powstaje w tle z migawki danych - oferta może być dalej edytowana
+        try:
+            snapshot = snapshot_offer(self.company_data, recipient, self.offer_items)
+        except Exception as e:
+            messagebox.showerror("Błąd", f"Nie udało się przygotować oferty: {str(e)}")
             return
         
-        item = self.recipients_tree.item(selected[0])
-        recipient_name = item['values'][0]
+        polling = self.render_queue.busy()
+        self.render_queue.submit(kind, filename, snapshot)
+        self.update_render_status()
+        if not polling:
+            self.root.after(100, self.poll_render_queue)
+    
+    def cancel_render(self):
+        self.render_queue.cancel()
+    
+    def poll_render_queue(self):
+        for event in self.render_queue.poll():
+            kind, job = event[0], event[1]
+            name = os.path.basename(job.filename)
+            if kind == "progress":
+                self.render_progress["value"] = event[2]
+            elif kind == "done":
+                self.render_status.config(text=f"Zapisano: {name}")
+                self.archive_offer(job.filename, offer_data_from_snapshot(job.snapshot))
+                if job.kind == "pdf":
+                    messagebox.showinfo("Sukces", f"Oferta PDF została zapisana do pliku:\n{job.filename}")
+                else:
+                    messagebox.showinfo("Sukces", f"Oferta została zapisana do pliku:\n{job.filename}")
+            elif kind == "error":
+                self.render_status.config(text=f"Błąd: {name}")
+                if job.kind == "pdf":
+                    messagebox.showerror("Błąd", f"Nie udało się wygenerować PDF: {event[2]}")
+                else:
+                    messagebox.showerror("Błąd", f"Nie udało się zapisać oferty: {event[2]}")
+            elif kind == "cancelled":
+                self.render_status.config(text=f"Anulowano: {name}")
         
-        # Znajdź odbiorcę
-        for i, recipient in enumerate(self.recipients):
-            if recipient.get("name") == recipient_name:
-                # Zaktualizuj dane z normalizacją kodowania
-                for key, entry in self.recipient_entries.items():
-                    value = entry.get()
-                    self.recipients[i][key] = normalize_encoding(value)
-                
-                self.save_recipients()
-                self.refresh_recipients_list()
-                self.clear_recipient_form()
-                self.update_recipient_combo()
-                messagebox.showinfo("Sukces", "Odbiorca został zaktualizowany!")
-                return
+        self.update_render_status()
+        if self.render_queue.busy():
+            self.root.after(100, self.poll_render_queue)
     
-    def delete_recipient(self):
-        selected = self.recipients_tree.selection()
-        if not selected:
-            messagebox.showwarning("Uwaga", "Wybierz odbiorcę do usunięcia!")
+    def update_render_status(self):
+        render_queue = self.render_queue
+        if not render_queue.busy():
+            self.render_progress["value"] = 0
+            self.render_cancel_button.config(state="disabled")
             return
         
-        if messagebox.askyesno("Potwierdzenie", "Czy na pewno chcesz usunąć tego odbiorcę?"):
-            item = self.recipients_tree.item(selected[0])
-            recipient_name = item['values'][0]
-            
-            self.recipients = [r for r in self.recipients if r.get("name") != recipient_name]
-            self.save_recipients()
-            self.refresh_recipients_list()
-            self.clear_recipient_form()
-            self.update_recipient_combo()
+        job = render_queue.current or render_queue.pending[0]
+        waiting = len(render_queue.pending) - 1
+        text = f"Generowanie: {os.path.basename(job.filename)}"
+        if waiting:
+            text += f" (w kolejce: {waiting})"
+        if job is not render_queue.current:
+            self.render_progress["value"] = 0
+        self.render_status.config(text=text)
+        self.render_cancel_button.config(state="normal")
     
-    def clear_recipient_form(self):
-        for entry in self.recipient_entries.values():
-            entry.delete(0, tk.END)
+    def archive_row_values(self, key, index):
+        entry = self._archive_results[key]
+        return (entry["date"], entry["recipient_name"], entry["nip"], entry["item_count"],
+                f"{entry['total']:.2f}", os.path.basename(entry["path"]))
     
-    def on_recipient_select(self, event):
-        selected = self.recipients_tree.selection()
-        if selected:
-            item = self.recipients_tree.item(selected[0])
-            recipient_name = item['values'][0]
-            
-            # Znajdź i wypełnij formularz
-            for recipient in self.recipients:
-                if recipient.get("name") == recipient_name:
-                    for key, entry in self.recipient_entries.items():
-                        entry.delete(0, tk.END)
-                        entry.insert(0, recipient.get(key, ""))
-                    break
+    def refresh_archive_list(self):
+        if self.archive_rows is None:
+            # Zakładka archiwum nie jest jeszcze zbudowana
+            return
+        if self.archive is None:
+            self.archive_status.config(text="Archiwum ofert jest niedostępne.")
+            return
+        
+        try:
+            results = self.archive.search(self.archive_search.get(),
+                                          date_from=self.archive_date_from.get().strip(),
+                                          date_to=self.archive_date_to.get().strip())
+        except sqlite3.Error as e:
+            self.archive_status.config(text=f"Błąd wyszukiwania: {str(e)}")
+            return
+        
+        self._archive_results = {str(entry["id"]): entry for entry in results}
+        self.archive_rows.reset(self._archive_results)
+        if len(results) >= ARCHIVE_SEARCH_LIMIT:
+            self.archive_status.config(
+                text=f"Wyświetlono {len(results)} najnowszych ofert - zawęż wyszukiwanie.")
+        else:
+            self.archive_status.config(text=f"Znaleziono ofert: {len(results)}")
     
-    def refresh_recipients_list(self):
-        # Wyczyść listę
-        for item in self.recipients_tree.get_children():
-            self.recipients_tree.delete(item)
-        
-        # Dodaj odbiorców
-        for recipient in self.recipients:
-            self.recipients_tree.insert("", tk.END, values=(
-                recipient.get("name", ""),
-                recipient.get("address", ""),
-                recipient.get("city", ""),
-                recipient.get("nip", "")
-            ))
+    def archive_entries(self, entries):
+        # Wpisy przygotowane w tle (korespondencja seryjna) albo błąd ich przygotowania
+        if self.archive is None or not entries:
+            return
+        try:
+            if isinstance(entries, Exception):
+                raise entries
+            self.archive.add(entries)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            if self.archive_rows is not None:
+                self.archive_status.config(text=f"Nie udało się zarchiwizować ofert: {str(e)}")
+            return
+        self.refresh_archive_list()
     
-    def save_recipients(self):
+    def archive_offer(self, path, offer_data, source=None):
+        # Błąd archiwum nie może przerwać zapisu ani generowania oferty
+        if self.archive is None:
+            return
         try:
-            with open("recipients.json", "w", encoding="utf-8") as f:
-                json.dump(self.recipients, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            messagebox.showerror("Błąd", f"Nie udało się zapisać odbiorców: {str(e)}")
+            if source is None:
+                source = self.archive.store_copy(offer_data)
+            self.archive.add([archive_entry(offer_data, path, source)])
+        except (OSError, ValueError, sqlite3.Error) as e:
+            if self.archive_rows is not None:
+                self.archive_status.config(text=f"Nie udało się zarchiwizować oferty: {str(e)}")
+            return
+        self.refresh_archive_list()
     
-    def load_recipients(self):
-        if os.path.exists("recipients.json"):
+    def open_archived_offer(self):
+        keys = self.archive_rows.selected_keys()
+        if not keys:
+            messagebox.showwarning("Uwaga", "Wybierz ofertę z listy!")
+            return
+        
+        entry = self._archive_results[keys[0]]
+        source = entry["source"]
+        if not source or not os.path.exists(source):
+            messagebox.showerror("Błąd", f"Plik oferty nie istnieje:\n{source or entry['path']}")
+            return
+        
+        self.notebook.select(self.offer_frame)
+        self.open_offer_file(source)
+    
+    def index_archive_folder(self):
+        if self.archive is None:
+            messagebox.showerror("Błąd", "Archiwum ofert jest niedostępne.")
+            return
+        
+        directory = filedialog.askdirectory()
+        if not directory:
+            return
+        
+        files = collect_offer_files([directory])
+        if not files:
+            messagebox.showwarning("Uwaga", "W wybranym folderze nie ma plików ofert!")
+            return
+        
+        # Indeksowanie w osobnym wątku (własne połączenie z bazą) i procesach roboczych
+        results = queue.Queue()
+        path = self.archive.path
+        
+        def run():
             try:
-                with open("recipients.json", "r", encoding="utf-8") as f:
-                    self.recipients = json.load(f)
-                
-                # Napraw kodowanie danych
-                self.recipients = fix_string_encoding(self.recipients)
-                
-                self.refresh_recipients_list()
+                archive = OfferArchive(path)
+                try:
+                    results.put(("done", archive.index_files(
+                        files, os.cpu_count() or 1,
+                        start_method="spawn")))
+                finally:
+                    archive.close()
             except Exception as e:
-                messagebox.showerror("Błąd", f"Nie udało się wczytać odbiorców: {str(e)}")
+                results.put(("error", e))
+        
+        threading.Thread(target=run, daemon=True).start()
+        self.archive_status.config(text=f"Indeksowanie: {len(files)} plików...")
+        self.root.after(200, self.poll_archive_index, results)
     
-    def update_recipient_combo(self, event=None):
-        values = [r.get("name", "") for r in self.recipients]
-        self.recipient_combo['values'] = values
-        if values and not self.selected_recipient.get():
-            self.selected_recipient.set(values[0] if values else "")
+    def poll_archive_index(self, results):
+        try:
+            kind, result = results.get_nowait()
+        except queue.Empty:
+            self.root.after(200, self.poll_archive_index, results)
+            return
+        
+        if kind == "error":
+            self.archive_status.config(text="")
+            messagebox.showerror("Błąd", f"Nie udało się zindeksować folderu: {str(result)}")
+            return
+        
+        indexed, skipped, errors = result
+        self.refresh_archive_list()
+        messagebox.showinfo("Sukces",
+            f"Zindeksowano plików: {indexed}\n"
+            f"Bez zmian: {skipped}\n"
+            f"Błędów: {len(errors)}")
     
-    def add_item(self):
-        name = self.item_entries["name"].get()
-        quantity_str = self.item_entries["quantity"].get()
-        price_str = self.item_entries["unit_price"].get()
+    def load_template(self):
+        filename = filedialog.askopenfilename(
+            defaultextension=".json",
+            filetypes=[("Pliki JSON", "*.json"), ("Wszystkie pliki", "*.*")]
+        )
         
-        if not name:
-            messagebox.showwarning("Uwaga", "Nazwa pozycji jest wymagana!")
+        if not filename:
             return
         
         try:
-            quantity = float(quantity_str.replace(",", ".")) if quantity_str else 0
-            price = float(price_str.replace(",", ".")) if price_str else 0
-            total = quantity * price
-            
-            # Normalizuj kodowanie nazwy
-            name = normalize_encoding(name)
-            
-            item = {
-                "name": name,
-                "quantity": quantity,
-                "unit_price": price,
-                "total": total
-            }
-            
-            self.offer_items.append(item)
-            self.refresh_items_list()
-            self.clear_item_form()
-            self.update_total()
-        except ValueError:
-            messagebox.showerror("Błąd", "Nieprawidłowa wartość ilości lub ceny!")
+            set_default_template(filename)
+            messagebox.showinfo("Sukces", f"Szablon oferty został wczytany z pliku:\n{filename}")
+        except Exception as e:
+            messagebox.showerror("Błąd", f"Nie udało się wczytać szablonu: {str(e)}")
     
-    def edit_item(self):
-        selected = self.items_tree.selection()
-        if not selected:
-            messagebox.showwarning("Uwaga", "Wybierz pozycję do edycji!")
-            return
+    def load_offer_json(self):
+        # Wybierz plik do wczytania
+        filename = filedialog.askopenfilename(
+            defaultextension=".json",
+            filetypes=[("Pliki ofert", "*.json *.offb"), ("Pliki JSON", "*.json"),
+                       ("Oferty binarne", "*.offb"), ("Wszystkie pliki", "*.*")]
+        )
         
-        item_index = int(self.items_tree.item(selected[0])['values'][0]) - 1
+        if not filename:
+            return
         
-        name = self.item_entries["name"].get()
-        quantity_str = self.item_entries["quantity"].get()
-        price_str = self.item_entries["unit_price"].get()
+        self.open_offer_file(filename)
+    
+    def open_offer_file(self, filename):
+        # Wczytanie oferty z pliku (okno wyboru pliku i archiwum ofert)
+        self.build_tab(self.offer_frame)
+        try:
+            # Nagłówek oferty; pozycje są czytane strumieniowo z pliku
+            offer_data, items = stream_offer_data(filename)
+        except (json.JSONDecodeError, ValueError):
+            messagebox.showerror("Błąd", "Nieprawidłowy format pliku JSON!")
+            return
+        except Exception as e:
+            messagebox.showerror("Błąd", f"Nie udało się wczytać oferty: {str(e)}")
+            return
         
         try:
-            quantity = float(quantity_str.replace(",", ".")) if quantity_str else 0
-            price = float(price_str.replace(",", ".")) if price_str else 0
-            total = quantity * price
+            # Wczytaj dane firmy (opcjonalnie - tylko jeśli są w pliku)
+            if "company" in offer_data and offer_data["company"]:
+                company_from_file = offer_data["company"]
+                # Aktualizuj tylko puste pola w danych firmy
+                for key in self.company_data.keys():
+                    if key in company_from_file and company_from_file[key]:
+                        # Aktualizuj w słowniku
+                        self.company_data[key] = company_from_file[key]
+                        # Aktualizuj w interfejsie (jeśli istnieje pole)
+                        if key in self.company_entries:
+                            self.company_entries[key].delete(0, tk.END)
+                            self.company_entries[key].insert(0, company_from_file[key])
             
-            # Normalizuj kodowanie nazwy
-            name = normalize_encoding(name)
+            # Wczytaj odbiorcę
+            if "recipient" not in offer_data or not offer_data["recipient"]:
+                items.close()
+                messagebox.showerror("Błąd", "Plik nie zawiera danych odbiorcy!")
+                return
             
-            self.offer_items[item_index] = {
-                "name": name,
-                "quantity": quantity,
-                "unit_price": price,
-                "total": total
-            }
+            recipient = offer_data["recipient"]
+            recipient_name = recipient.get("name", "")
             
-            self.refresh_items_list()
-            self.clear_item_form()
-            self.update_total()
-        except (ValueError, IndexError):
-            messagebox.showerror("Błąd", "Nieprawidłowa wartość lub pozycja!")
-    
-    def delete_item(self):
-        selected = self.items_tree.selection()
-        if not selected:
-            messagebox.showwarning("Uwaga", "Wybierz pozycję do usunięcia!")
+            if not recipient_name:
+                items.close()
+                messagebox.showerror("Błąd", "Odbiorca w pliku nie ma nazwy!")
+                return
+            
+            # Sprawdź czy odbiorca istnieje w liście (po id, NIP, a na końcu po nazwie)
+            existing = self.recipients.get(recipient.get("id"))
+            if existing is None:
+                matches = (self.recipients.find_by_nip(recipient.get("nip"))
+                           or self.recipients.find_by_name(recipient_name))
+                existing = matches[0] if matches else None
+            
+            if existing is not None:
+                # Zaktualizuj dane istniejącego odbiorcy
+                recipient_id = existing["id"]
+                self.recipients.update(recipient_id, recipient)
+                if self.recipient_rows is not None:
+                    self.recipient_rows.update(recipient_id)
+            else:
+                # Jeśli odbiorca nie istnieje, dodaj go
+                recipient_id = self.recipients.add(dict(recipient))
+                self.save_recipient(recipient_id)
+                if self.recipient_rows is not None:
+                    self.recipient_rows.insert(recipient_id)
+            
+            # Ustaw odbiorcę w combobox
+            self.update_recipient_combo()
+            self.select_recipient(recipient_id)
+        except Exception as e:
+            items.close()
+            messagebox.showerror("Błąd", f"Nie udało się wczytać oferty: {str(e)}")
             return
         
-        item_index = int(self.items_tree.item(selected[0])['values'][0]) - 1
+        # Pozycje trafiają na listę porcjami, bez blokowania interfejsu
+        self.cancel_item_load()
+        self.offer_items = OfferItemStore()
+        self.refresh_items_list()
+        self.update_total()
+        self.clear_item_form()
+        self._item_loader = items
+        self.load_item_batch(items, filename, offer_data, recipient_name)
+    
+    def load_item_batch(self, items, filename, offer_data, recipient_name):
+        # Wczytywanie przerwane (nowa oferta, wyczyszczenie listy)
+        if self._item_loader is not items:
+            return
         
         try:
-            del self.offer_items[item_index]
+            batch = list(itertools.islice(items, ITEM_LOAD_BATCH))
+        except Exception as e:
+            self.cancel_item_load()
+            self.offer_items = OfferItemStore()
             self.refresh_items_list()
-            self.clear_item_form()
             self.update_total()
-        except IndexError:
-            messagebox.showerror("Błąd", "Nie można usunąć pozycji!")
-    
-    def clear_item_form(self):
-        for entry in self.item_entries.values():
-            entry.delete(0, tk.END)
-    
-    def on_item_select(self, event):
-        selected = self.items_tree.selection()
-        if selected:
-            item_index = int(self.items_tree.item(selected[0])['values'][0]) - 1
-            
-            try:
-                item = self.offer_items[item_index]
-                self.item_entries["name"].delete(0, tk.END)
-                self.item_entries["name"].insert(0, item["name"])
-                self.item_entries["quantity"].delete(0, tk.END)
-                self.item_entries["quantity"].insert(0, str(item["quantity"]))
-                self.item_entries["unit_price"].delete(0, tk.END)
-                self.item_entries["unit_price"].insert(0, str(item["unit_price"]))
-            except IndexError:
-                pass
-    
-    def refresh_items_list(self):
-        # Wyczyść listę
-        for item in self.items_tree.get_children():
-            self.items_tree.delete(item)
-        
-        # Dodaj pozycje
-        for i, item in enumerate(self.offer_items, 1):
-            self.items_tree.insert("", tk.END, values=(
-                i,
-                item["name"],
-                f"{item['quantity']:.2f}",
-                f"{item['unit_price']:.2f} PLN",
-                f"{item['total']:.2f} PLN"
-            ))
-    
-    def update_total(self):
-        total = sum(item["total"] for item in self.offer_items)
-        self.total_label.config(text=f"Suma: {total:.2f} PLN")
-    
-    def clear_offer(self):
-        self.offer_items = []
-        self.refresh_items_list()
-        self.clear_item_form()
-        self.update_total()
-        self.selected_recipient.set("")
+            if isinstance(e, ValueError):
+                messagebox.showerror("Błąd", "Nieprawidłowy format pliku JSON!")
+            else:
+                messagebox.showerror("Błąd", f"Nie udało się wczytać oferty: {str(e)}")
+            return
+        
+        if batch:
+            self.item_rows.extend(self.offer_items.extend(batch))
+            self.update_total()
+            self.root.after(1, self.load_item_batch, items, filename, offer_data, recipient_name)
+            return
+        
+        self._item_loader = None
+        if not self.offer_items:
+            messagebox.showwarning("Uwaga", "Plik nie zawiera pozycji oferty!")
+        else:
+            self.update_catalog(self.offer_items)
+        
+        # Wyświetl informację o dacie oferty jeśli jest dostępna
+        date_info = ""
+        if "date" in offer_data:
+            date_info = f"\nData oferty: {offer_data['date']}"
+        
+        messagebox.showinfo("Sukces", 
+            f"Oferta została wczytana z pliku:\n{filename}{date_info}\n\n"
+            f"Odbiorca: {recipient_name}\n"
+            f"Pozycji: {len(self.offer_items)}")
     
-    def get_selected_recipient_data(self):
-        recipient_name = self.selected_recipient.get()
-        for recipient in self.recipients:
-            if recipient.get("name") == recipient_name:
-                return recipient
-        return None
+    def cancel_item_load(self):
+        # Przerywa wczytywanie pozycji poprzedniej oferty i zamyka jej plik
+        if self._item_loader is not None:
+            self._item_loader.close()
+            self._item_loader = None
     
-    def generate_offer_txt(self):
+    def save_offer_json(self):
         if not self.offer_items:
             messagebox.showwarning("Uwaga", "Dodaj pozycje do oferty!")
             return
@@ -626,554 +5062,1633 @@ class OfferCreatorApp:
             messagebox.showwarning("Uwaga", "Wybierz odbiorcę oferty!")
             return
         
-        # Wybierz miejsce zapisu
         filename = filedialog.asksaveasfilename(
-            defaultextension=".txt",
-            filetypes=[("Pliki tekstowe", "*.txt"), ("Wszystkie pliki", "*.*")],
-            initialfile=f"Oferta_{recipient.get('name', '')}_{datetime.now().strftime('%Y%m%d')}.txt"
+            defaultextension=".json",
+            filetypes=[("Pliki JSON", "*.json"), ("Oferty binarne", "*.offb"),
+                       ("Wszystkie pliki", "*.*")],
+            initialfile=f"Oferta_{recipient.get('name', '')}_{datetime.now().strftime('%Y%m%d')}.json"
         )
         
         if not filename:
             return
         
+        offer_data = {
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "company": self.company_data,
+            "recipient": recipient,
+            "items": self.offer_items.to_list(),
+            "total": self.offer_items.total
+        }
+        
         try:
-            with open(filename, "w", encoding="utf-8") as f:
-                # Nagłówek
-                f.write("=" * 80 + "\n")
-                f.write("OFERTA\n")
-                f.write("=" * 80 + "\n\n")
-                
-                # Data
-                offer_date = datetime.now()
-                valid_until = offer_date + timedelta(days=30)  # +1 miesiąc (około 30 dni)
-                f.write(f"Data: {offer_date.strftime('%d.%m.%Y')}\n")
-                f.write(f"Oferta ważna do: {valid_until.strftime('%d.%m.%Y')}\n\n")
-                
-                # Dane firmy
-                f.write("SPRZEDAWCA:\n")
-                f.write("-" * 80 + "\n")
-                for key, label in [
-                    ("name", "Nazwa:"),
-                    ("address", "Adres:"),
-                    ("city", "Miasto:"),
-                    ("postal_code", "Kod pocztowy:"),
-                    ("nip", "NIP:"),
-                    ("phone", "Telefon:"),
-                    ("email", "Email:"),
-                    ("bank_account", "Konto bankowe:")
-                ]:
-                    if self.company_data.get(key):
-                        f.write(f"{label} {self.company_data[key]}\n")
-                f.write("\n")
-                
-                # Dane odbiorcy
-                f.write("ODBIORCA:\n")
-                f.write("-" * 80 + "\n")
-                for key, label in [
-                    ("name", "Nazwa:"),
-                    ("address", "Adres:"),
-                    ("city", "Miasto:"),
-                    ("postal_code", "Kod pocztowy:"),
-                    ("nip", "NIP:"),
-                    ("phone", "Telefon:"),
-                    ("email", "Email:")
-                ]:
-                    if recipient.get(key):
-                        f.write(f"{label} {recipient[key]}\n")
-                f.write("\n")
-                
-                # Pozycje oferty
-                f.write("POZYCJE OFERTY:\n")
-                f.write("-" * 80 + "\n")
-                f.write(f"{'Lp':<5} {'Nazwa':<40} {'Ilość':>10} {'Cena':>12} {'Wartość':>12}\n")
-                f.write("-" * 80 + "\n")
-                
-                total = 0
-                for i, item in enumerate(self.offer_items, 1):
-                    f.write(f"{i:<5} {item['name']:<40} {item['quantity']:>10.2f} "
-                           f"{item['unit_price']:>12.2f} PLN {item['total']:>12.2f} PLN\n")
-                    total += item['total']
-                
-                f.write("-" * 80 + "\n")
-                f.write(f"{'SUMA:':<57} {total:>12.2f} PLN\n")
-                f.write("=" * 80 + "\n")
-            
+            with tracer.span("offer.save", items=len(offer_data["items"])):
+                if is_offer_binary(filename):
+                    write_offer_binary(filename, offer_data)
+                else:
+                    with open(filename, "w", encoding="utf-8") as f:
+                        json.dump(mark_normalized(offer_data), f, ensure_ascii=False, indent=2)
             messagebox.showinfo("Sukces", f"Oferta została zapisana do pliku:\n{filename}")
         except Exception as e:
             messagebox.showerror("Błąd", f"Nie udało się zapisać oferty: {str(e)}")
-    
-    def generate_offer_pdf(self):
-        if not REPORTLAB_AVAILABLE:
-            messagebox.showerror("Błąd", 
-                "Biblioteka reportlab nie jest zainstalowana!\n\n"
-                "Zainstaluj ją poleceniem:\npip install reportlab")
-            return
-        
-        if not self.offer_items:
-            messagebox.showwarning("Uwaga", "Dodaj pozycje do oferty!")
-            return
-        
-        recipient = self.get_selected_recipient_data()
-        if not recipient:
-            messagebox.showwarning("Uwaga", "Wybierz odbiorcę oferty!")
             return
         
-        # Wybierz miejsce zapisu
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".pdf",
-            filetypes=[("Pliki PDF", "*.pdf"), ("Wszystkie pliki", "*.*")],
-            initialfile=f"Oferta_{recipient.get('name', '')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        )
-        
-        if not filename:
-            return
+        self.update_catalog(self.offer_items)
+        self.archive_offer(filename, offer_data, source=filename)
+
+
+def collect_offer_files(patterns):
+    """
+    Zwraca posortowaną listę plików ofert (JSON i .offb) z podanych katalogów,
+    wzorców glob lub pojedynczych plików.
+    """
+    files = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = (glob.glob(os.path.join(pattern, "*.json"))
+                       + glob.glob(os.path.join(pattern, "*" + OFFB_EXTENSION)))
+        else:
+            matches = glob.glob(pattern)
+        for path in sorted(matches):
+            path = os.path.abspath(path)
+            if path not in seen and os.path.isfile(path):
+                seen.add(path)
+                files.append(path)
+    return files
+
+
+def output_base_names(files):
+    """
+    Zwraca nazwy plików wynikowych (bez rozszerzenia) dla listy plików ofert.
+    Powtórzone nazwy (np. oferta.json z dwóch katalogów) dostają przyrostek
+    _2, _3... - żaden plik wynikowy nie nadpisuje innego.
+    """
+    bases = [os.path.splitext(os.path.basename(filename))[0] for filename in files]
+    used = {base.lower() for base in bases}
+    seen = set()
+    names = []
+    for base in bases:
+        name = base
+        if base.lower() in seen:
+            counter = 2
+            while f"{base}_{counter}".lower() in used:
+                counter += 1
+            name = f"{base}_{counter}"
+            used.add(name.lower())
+        seen.add(base.lower())
+        names.append(name)
+    return names
+
+
+def render_offer_file(filename, base_name=None, output_dir=".", pdf=True, txt=False, cache=None):
+    """
+    Renderuje pojedynczy plik oferty JSON do PDF (i opcjonalnie TXT) w katalogu
+    output_dir. base_name - nazwa plików wynikowych bez rozszerzenia (domyślnie
+    nazwa pliku oferty, patrz output_base_names). cache jak w render_offer
+    (False - bez pamięci podręcznej).
+    Zwraca krotkę (plik, sukces, pliki wynikowe, komunikat błędu, czas w sekundach).
+    """
+    start = time.perf_counter()
+    outputs = []
+    try:
+        snapshot = offer_snapshot_from_data(load_offer_data(filename))
         
+        if base_name is None:
+            base_name = os.path.splitext(os.path.basename(filename))[0]
+        base = os.path.join(output_dir, base_name)
+        if pdf:
+            render_offer(snapshot, base + ".pdf", "pdf", cache=cache)
+            outputs.append(base + ".pdf")
+        if txt:
+            render_offer(snapshot, base + ".txt", "txt", cache=cache)
+            outputs.append(base + ".txt")
+        return (filename, True, outputs, "", time.perf_counter() - start)
+    except Exception as e:
+        return (filename, False, outputs, str(e), time.perf_counter() - start)
+
+
+# Stan korespondencji seryjnej w procesie: (id, dane firmy, pozycje, data,
+# szablon, tabela pozycji, wspólna część klucza pamięci podręcznej). Procesy uruchomione przez fork dziedziczą go
+# z procesu głównego, pozostałe budują go raz przy starcie.
+_merge_state = None
+
+
+def merge_file_name(recipient, offer_date, used):
+    """
+    Zwraca nazwę pliku oferty odbiorcy (jak w oknie zapisu), unikalną
+    w zbiorze used.
+    """
+    name = re.sub(r'[\\/:*?"<>|\s]+', "_", str(recipient.get("name") or "").strip()) or "odbiorca"
+    base = f"Oferta_{name[:80]}_{offer_date.strftime('%Y%m%d')}"
+    filename = f"{base}.pdf"
+    counter = 2
+    while filename.lower() in used:
+        filename = f"{base}_{counter}.pdf"
+        counter += 1
+    used.add(filename.lower())
+    return filename
+
+
+def _build_merge_state(merge_id, company_data, items, offer_date):
+    template = get_offer_template()
+    with tracer.span("merge.items", items=len(items)):
+        block = OfferItemsBlock(template.compile(), items)
+    # Skrót firmy i pozycji do kluczy pamięci podręcznej - raz dla wszystkich odbiorców
+    shared_key = None
+    if render_cache:
+        shared_key = render_cache.shared_key(
+            OfferSnapshot(company_data, {}, items, offer_date, template), "pdf")
+    return merge_id, company_data, items, offer_date, template, block, shared_key
+
+
+def init_merge_worker(font_dirs, template_path, merge_id, company_data, items, offer_date):
+    """
+    Przygotowuje proces roboczy korespondencji seryjnej: fonty, szablon
+    i tabelę pozycji (jeśli nie została odziedziczona z procesu głównego).
+    """
+    global _merge_state
+    init_render_worker(font_dirs, template_path)
+    if _merge_state is None or _merge_state[0] != merge_id:
+        _merge_state = _build_merge_state(merge_id, company_data, items, offer_date)
+
+
+def render_merge_offer(job):
+    """
+    Generuje ofertę PDF jednego odbiorcy z tabelą pozycji z _merge_state
+    (lub kopiuje ją z pamięci podręcznej renderowania). Zwraca (plik,
+    komunikat błędu).
+    """
+    filename, recipient = job
+    merge_id, company_data, items, offer_date, template, block, shared_key = _merge_state
+    try:
+        snapshot = OfferSnapshot(company_data, recipient, items, offer_date, template)
+        render_offer(snapshot, filename, "pdf", items_block=block, shared_key=shared_key)
+        return filename, ""
+    except Exception as e:
+        return filename, str(e)
+
+
+def merge_offer_pdfs(company_data, recipients, items, output_dir, offer_date=None, workers=1,
+                     progress=None, start_method=None):
+    """
+    Korespondencja seryjna: generuje ofertę PDF z tą samą listą pozycji dla
+    każdego z odbiorców. Tabela pozycji jest budowana raz (w każdym procesie
+    roboczym najwyżej raz), a dla odbiorcy powstaje tylko nagłówek dokumentu.
+    Pliki są zapisywane równolegle w workers procesach. progress(gotowe,
+    wszystkie) jest wywoływane po każdym pliku. Zwraca listę (plik, błąd).
+    """
+    global _merge_state
+    if not load_reportlab():
+        raise RuntimeError("Biblioteka reportlab nie jest zainstalowana!")
+    offer_date = offer_date or datetime.now()
+    items = [dict(item.to_dict() if isinstance(item, OfferItem) else item) for item in items]
+    company_data = dict(company_data)
+    os.makedirs(output_dir, exist_ok=True)
+    used = set()
+    jobs = [(os.path.join(output_dir, merge_file_name(recipient, offer_date, used)), dict(recipient))
+            for recipient in recipients]
+    
+    merge_id = uuid.uuid4().hex
+    workers = max(1, min(workers, len(jobs)))
+    executor = None
+    if workers == 1:
+        _merge_state = _build_merge_state(merge_id, company_data, items, offer_date)
+        results = map(render_merge_offer, jobs)
+    else:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        mp_context = multiprocessing.get_context(start_method)
+        if mp_context.get_start_method() == "fork":
+            # Tabela pozycji powstaje raz - procesy robocze dziedziczą ją z pamięci
+            _merge_state = _build_merge_state(merge_id, company_data, items, offer_date)
+        template = get_offer_template()
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=mp_context, initializer=init_merge_worker,
+            initargs=(font_registry.search_dirs, template.source, merge_id, company_data,
+                      items, offer_date))
+        chunksize = max(1, min(16, len(jobs) // (workers * 4)))
+        results = executor.map(render_merge_offer, jobs, chunksize=chunksize)
+    
+    outcomes = []
+    try:
+        for done, outcome in enumerate(results, 1):
+            outcomes.append(outcome)
+            if progress:
+                progress(done, len(jobs))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        _merge_state = None
+    return outcomes
+
+
+def batch_main(argv=None):
+    """
+    Tryb wsadowy: renderuje wiele ofert JSON bez interfejsu graficznego.
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py batch",
+        description="Wsadowe generowanie ofert PDF/TXT z plików JSON.")
+    parser.add_argument("inputs", nargs="+",
+                        help="katalogi, wzorce glob lub pliki ofert JSON")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="katalog na wygenerowane pliki (domyślnie bieżący)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="liczba procesów roboczych")
+    parser.add_argument("--txt", action="store_true",
+                        help="generuj również ofertę w formacie TXT")
+    parser.add_argument("--no-pdf", action="store_true",
+                        help="nie generuj plików PDF")
+    parser.add_argument("--font-dir", action="append", default=[],
+                        help="dodatkowy katalog z fontami TTF (można podać wielokrotnie)")
+    parser.add_argument("--template",
+                        help="plik JSON z własnym szablonem oferty")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="renderuj wszystko od nowa (bez pamięci podręcznej)")
+    args = parser.parse_args(argv)
+    
+    pdf = not args.no_pdf
+    if pdf and not load_reportlab():
+        print("Biblioteka reportlab nie jest zainstalowana! "
+              "Zainstaluj ją poleceniem: pip install reportlab", file=sys.stderr)
+        return 2
+    if not pdf and not args.txt:
+        parser.error("nic do wygenerowania (użyto --no-pdf bez --txt)")
+    
+    files = collect_offer_files(args.inputs)
+    if not files:
+        print("Nie znaleziono plików ofert JSON.", file=sys.stderr)
+        return 1
+    
+    try:
+        init_render_worker(args.font_dir, args.template, warm=False)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Nie udało się wczytać szablonu: {e}", file=sys.stderr)
+        return 2
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    workers = max(1, min(args.workers, len(files)))
+    task = functools.partial(render_offer_file, output_dir=args.output_dir,
+                             pdf=pdf, txt=args.txt, cache=False if args.no_cache else None)
+    
+    start = time.perf_counter()
+    failed = 0
+    # Oferty o tej samej nazwie z różnych katalogów nie mogą się nadpisać
+    base_names = output_base_names(files)
+    if workers == 1:
+        results = map(task, files, base_names)
+        executor = None
+    else:
+        # Procesy robocze rejestrują fonty i kompilują szablon raz, przy starcie
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_render_worker,
+                                       initargs=(args.font_dir, args.template, pdf))
+        chunksize = max(1, min(16, len(files) // (workers * 4)))
+        results = executor.map(task, files, base_names, chunksize=chunksize)
+    try:
+        for filename, ok, outputs, error, seconds in results:
+            if ok:
+                print(f"OK    {filename} -> {', '.join(outputs)} ({seconds:.2f} s)")
+            else:
+                failed += 1
+                print(f"BŁĄD  {filename}: {error}", file=sys.stderr)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    elapsed = time.perf_counter() - start
+    
+    done = len(files) - failed
+    rate = len(files) / elapsed if elapsed > 0 else 0.0
+    print(f"Wygenerowano {done}/{len(files)} ofert w {elapsed:.2f} s "
+          f"({rate:.1f} ofert/s, procesów: {workers}), błędów: {failed}")
+    return 1 if failed else 0
+
+
+def merge_main(argv=None):
+    """
+    Korespondencja seryjna: jedna oferta (pozycje, firma, data) dla wielu
+    odbiorców z zapisanej listy odbiorców.
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py merge",
+        description="Korespondencja seryjna: oferta PDF z tymi samymi pozycjami "
+                    "dla wielu odbiorców z listy odbiorców.")
+    parser.add_argument("offer",
+                        help="plik oferty (JSON/.offb) z pozycjami, danymi firmy i datą")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="katalog na wygenerowane pliki (domyślnie bieżący)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="liczba procesów roboczych")
+    parser.add_argument("--db",
+                        help="baza SQLite z odbiorcami (domyślnie OFFER_DB lub recipients.json)")
+    parser.add_argument("-s", "--search",
+                        help="tylko odbiorcy pasujący do wyszukiwania (nazwa, miasto, NIP)")
+    parser.add_argument("--template",
+                        help="plik JSON z własnym szablonem oferty")
+    args = parser.parse_args(argv)
+    
+    if not load_reportlab():
+        print("Biblioteka reportlab nie jest zainstalowana! "
+              "Zainstaluj ją poleceniem: pip install reportlab", file=sys.stderr)
+        return 2
+    try:
+        init_render_worker(template_path=args.template)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Nie udało się wczytać szablonu: {e}", file=sys.stderr)
+        return 2
+    
+    try:
+        offer_data = load_offer_data(args.offer)
+        store = open_store(args.db)
         try:
-            # Rejestruj fonty obsługujące polskie znaki
-            # Próbuj użyć fontów DejaVu, jeśli są dostępne
-            font_name = 'Helvetica'  # Domyślny font
-            font_bold = 'Helvetica-Bold'
-            
-            # Próbuj zarejestrować DejaVu Sans (obsługuje polskie znaki)
+            recipients = RecipientRepository(store.load_recipients() or [])
+        finally:
+            store.close()
+    except (OSError, ValueError, TypeError, sqlite3.Error) as e:
+        print(f"Błąd: {e}", file=sys.stderr)
+        return 1
+    items = offer_data.get("items") or []
+    if not items:
+        print("Plik nie zawiera pozycji oferty!", file=sys.stderr)
+        return 1
+    
+    ids = recipients.search(args.search) if args.search else recipients.ids()
+    selected = [recipients.get(recipient_id) for recipient_id in ids]
+    if not selected:
+        print("Brak odbiorców do wygenerowania ofert.", file=sys.stderr)
+        return 1
+    
+    start = time.perf_counter()
+    outcomes = merge_offer_pdfs(offer_data.get("company") or {}, selected, items,
+                                args.output_dir, parse_offer_date(offer_data), args.workers)
+    elapsed = time.perf_counter() - start
+    failed = 0
+    for filename, error in outcomes:
+        if error:
+            failed += 1
+            print(f"BŁĄD  {filename}: {error}", file=sys.stderr)
+    rate = len(outcomes) / elapsed if elapsed > 0 else 0.0
+    print(f"Wygenerowano {len(outcomes) - failed}/{len(outcomes)} ofert w {elapsed:.2f} s "
+          f"({rate:.1f} ofert/s), błędów: {failed}")
+    return 1 if failed else 0
+
+
+def iter_offers_txt(files, errors):
+    """
+    Generator wierszy TXT wielu ofert w jednym strumieniu (oferty oddzielone
+    znakiem nowej strony). Błędne pliki są pomijane i dopisywane do errors.
+    """
+    first = True
+    for filename in files:
+        try:
+            snapshot = offer_snapshot_from_data(load_offer_data(filename))
+        except (OSError, ValueError) as e:
+            errors.append((filename, str(e)))
+            continue
+        if not first:
+            yield "\f\n"
+        first = False
+        yield from iter_offer_txt(*snapshot)
+
+
+def txt_main(argv=None):
+    """
+    Tryb tekstowy: renderuje oferty JSON do jednego strumienia TXT
+    (stdout lub plik) albo do osobnych plików.
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py txt",
+        description="Generowanie ofert TXT z plików JSON do jednego strumienia lub osobnych plików.")
+    parser.add_argument("inputs", nargs="+",
+                        help="katalogi, wzorce glob lub pliki ofert JSON")
+    parser.add_argument("-o", "--output", default="-",
+                        help="plik wynikowy dla wszystkich ofert ('-' - standardowe wyjście)")
+    parser.add_argument("--split", metavar="DIR",
+                        help="zapisz każdą ofertę do osobnego pliku TXT w katalogu DIR")
+    parser.add_argument("--template",
+                        help="plik JSON z własnym szablonem oferty")
+    args = parser.parse_args(argv)
+    
+    files = collect_offer_files(args.inputs)
+    if not files:
+        print("Nie znaleziono plików ofert JSON.", file=sys.stderr)
+        return 1
+    
+    if args.template:
+        try:
+            set_default_template(args.template)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Nie udało się wczytać szablonu: {e}", file=sys.stderr)
+            return 2
+    
+    errors = []
+    if args.split:
+        os.makedirs(args.split, exist_ok=True)
+        done = 0
+        for filename, ok, outputs, error, seconds in map(
+                functools.partial(render_offer_file, output_dir=args.split, pdf=False, txt=True),
+                files, output_base_names(files)):
+            if ok:
+                done += 1
+            else:
+                errors.append((filename, error))
+    elif args.output == "-":
+        if hasattr(sys.stdout, "reconfigure"):
+            sys.stdout.reconfigure(encoding="utf-8")
+        write_lines(sys.stdout, iter_offers_txt(files, errors))
+        sys.stdout.flush()
+        done = len(files) - len(errors)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            write_lines(f, iter_offers_txt(files, errors))
+        done = len(files) - len(errors)
+    
+    for filename, error in errors:
+        print(f"BŁĄD  {filename}: {error}", file=sys.stderr)
+    print(f"Wygenerowano {done}/{len(files)} ofert TXT, błędów: {len(errors)}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def catalog_main(argv=None):
+    """
+    Uzupełnia katalog produktów pozycjami z zapisanych ofert JSON.
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py catalog",
+        description="Buduje katalog produktów (nazwa i cena) z zapisanych ofert JSON.")
+    parser.add_argument("inputs", nargs="+",
+                        help="pliki ofert, wzorce glob (np. 'oferty/*.json') lub katalogi")
+    parser.add_argument("--catalog", default=CATALOG_FILE,
+                        help=f"plik katalogu (domyślnie {CATALOG_FILE})")
+    args = parser.parse_args(argv)
+    
+    files = collect_offer_files(args.inputs)
+    if not files:
+        print("Nie znaleziono plików ofert JSON.", file=sys.stderr)
+        return 1
+    
+    catalog = ProductCatalog(args.catalog)
+    try:
+        catalog.load()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Błąd: nie udało się wczytać katalogu: {e}", file=sys.stderr)
+        return 1
+    
+    changed = 0
+    failed = 0
+    for filename in files:
+        try:
+            changed += catalog.add_items(load_offer_data(filename).get("items") or [])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            failed += 1
+            print(f"BŁĄD {filename}: {e}", file=sys.stderr)
+    
+    catalog.save()
+    print(f"Katalog {args.catalog}: {len(catalog)} produktów "
+          f"(zmienionych: {changed}, plików: {len(files)}, błędów: {failed})")
+    return 1 if failed else 0
+
+
+def offb_main(argv=None):
+    """
+    Konwersja ofert między JSON a formatem binarnym .offb oraz szybkie
+    zestawienie ofert (z plików .offb czytane są tylko nagłówki).
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py offb",
+        description="Binarny format ofert .offb: konwersja i zestawienie.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser(
+        "convert", help="konwertuj JSON -> .offb oraz .offb -> JSON")
+    convert.add_argument("inputs", nargs="+",
+                         help="katalogi, wzorce glob lub pliki ofert")
+    convert.add_argument("-o", "--output-dir",
+                         help="katalog na wynikowe pliki (domyślnie obok źródła)")
+    listing = commands.add_parser(
+        "list", help="wypisz datę, odbiorcę, liczbę pozycji i sumę ofert")
+    listing.add_argument("inputs", nargs="+",
+                         help="katalogi, wzorce glob lub pliki ofert")
+    args = parser.parse_args(argv)
+    
+    files = collect_offer_files(args.inputs)
+    if not files:
+        print("Nie znaleziono plików ofert.", file=sys.stderr)
+        return 1
+    
+    failed = 0
+    if args.command == "convert":
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        for filename in files:
+            base, ext = os.path.splitext(filename)
+            if args.output_dir:
+                base = os.path.join(args.output_dir, os.path.basename(base))
             try:
-                # Sprawdź dostępność fontów DejaVu w typowych lokalizacjach
-                dejavu_paths = [
-                    'C:/Windows/Fonts/DejaVuSans.ttf',
-                    'C:/Windows/Fonts/dejavu/DejaVuSans.ttf',
-                    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-                    '/usr/share/fonts/TTF/DejaVuSans.ttf',
-                ]
-                
-                # Sprawdź również fonty Arial Unicode MS (Windows) lub Liberation Sans (Linux)
-                arial_unicode_paths = [
-                    'C:/Windows/Fonts/ARIALUNI.TTF',
-                    'C:/Windows/Fonts/arialuni.ttf',
-                ]
-                
-                liberation_paths = [
-                    '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
-                    '/usr/share/fonts/TTF/LiberationSans-Regular.ttf',
-                ]
-                
-                dejavu_found = False
-                
-                # Najpierw próbuj DejaVu
-                for path in dejavu_paths:
-                    if os.path.exists(path):
-                        try:
-                            pdfmetrics.registerFont(TTFont('DejaVuSans', path))
-                            bold_path = path.replace('DejaVuSans.ttf', 'DejaVuSans-Bold.ttf')
-                            if os.path.exists(bold_path):
-                                pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', bold_path))
-                            font_name = 'DejaVuSans'
-                            font_bold = 'DejaVuSans-Bold'
-                            dejavu_found = True
-                            break
-                        except Exception as e:
-                            continue
-                
-                # Jeśli DejaVu nie znaleziono, próbuj Arial Unicode MS
-                if not dejavu_found:
-                    for path in arial_unicode_paths:
-                        if os.path.exists(path):
-                            try:
-                                pdfmetrics.registerFont(TTFont('ArialUnicode', path))
-                                font_name = 'ArialUnicode'
-                                font_bold = 'ArialUnicode'  # Użyj tego samego fontu dla bold
-                                dejavu_found = True
-                                break
-                            except Exception as e:
-                                continue
-                
-                # Jeśli nadal nie znaleziono, próbuj Liberation Sans
-                if not dejavu_found:
-                    for path in liberation_paths:
-                        if os.path.exists(path):
-                            try:
-                                pdfmetrics.registerFont(TTFont('LiberationSans', path))
-                                bold_path = path.replace('LiberationSans-Regular.ttf', 'LiberationSans-Bold.ttf')
-                                if os.path.exists(bold_path):
-                                    pdfmetrics.registerFont(TTFont('LiberationSans-Bold', bold_path))
-                                font_name = 'LiberationSans'
-                                font_bold = 'LiberationSans-Bold'
-                                dejavu_found = True
-                                break
-                            except Exception as e:
-                                continue
-                
-                # Jeśli żaden font Unicode nie został znaleziony, użyj domyślnych
-                # Helvetica w reportlab ma ograniczone wsparcie dla Unicode
-                if not dejavu_found:
-                    font_name = 'Helvetica'
-                    font_bold = 'Helvetica-Bold'
-            except Exception as e:
-                # W razie problemów, użyj domyślnych fontów
-                font_name = 'Helvetica'
-                font_bold = 'Helvetica-Bold'
-            
-            # Utwórz dokument PDF
-            doc = SimpleDocTemplate(filename, pagesize=A4,
-                                   rightMargin=20*mm, leftMargin=20*mm,
-                                   topMargin=20*mm, bottomMargin=20*mm)
-            
-            # Kontener na elementy
-            story = []
-            
-            # Style z fontami obsługującymi polskie znaki
-            styles = getSampleStyleSheet()
-            
-            # Utwórz style z odpowiednimi fontami
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontName=font_bold,
-                fontSize=24,
-                textColor=colors.HexColor('#1a1a1a'),
-                spaceAfter=30,
-                alignment=TA_CENTER
-            )
-            
-            heading_style = ParagraphStyle(
-                'CustomHeading',
-                parent=styles['Heading2'],
-                fontName=font_bold,
-                fontSize=14,
-                textColor=colors.HexColor('#2c3e50'),
-                spaceAfter=12,
-                spaceBefore=12
-            )
-            
-            normal_style = ParagraphStyle(
-                'CustomNormal',
-                parent=styles['Normal'],
-                fontName=font_name,
-                fontSize=10
-            )
-            
-            # Tytuł
-            story.append(Paragraph("OFERTA", title_style))
-            story.append(Spacer(1, 10*mm))
-            
-            # Data
-            offer_date = datetime.now()
-            valid_until = offer_date + timedelta(days=30)  # +1 miesiąc (około 30 dni)
-            date_text = f"Data: {offer_date.strftime('%d.%m.%Y')}"
-            valid_until_text = f"Oferta wazna do: {valid_until.strftime('%d.%m.%Y')}"
-            story.append(Paragraph(date_text, normal_style))
-            story.append(Paragraph(valid_until_text, normal_style))
-            story.append(Spacer(1, 5*mm))
-            
-            # Przygotuj dane sprzedawcy jako tekst
-            company_text_parts = []
-            company_text_parts.append(Paragraph("<b>SPRZEDAWCA:</b>", heading_style))
-            for key, label in [
-                ("name", "Nazwa:"),
-                ("address", "Adres:"),
-                ("city", "Miasto:"),
-                ("postal_code", "Kod pocztowy:"),
-                ("nip", "NIP:"),
-                ("phone", "Telefon:"),
-                ("email", "Email:"),
-                ("bank_account", "Konto bankowe:")
-            ]:
-                value = self.company_data.get(key, "")
-                if value:
-                    company_text_parts.append(Paragraph(f"<b>{label}</b> {value}", normal_style))
-            
-            # Przygotuj dane odbiorcy jako tekst
-            recipient_text_parts = []
-            recipient_text_parts.append(Paragraph("<b>ODBIORCA:</b>", heading_style))
-            for key, label in [
-                ("name", "Nazwa:"),
-                ("address", "Adres:"),
-                ("city", "Miasto:"),
-                ("postal_code", "Kod pocztowy:"),
-                ("nip", "NIP:"),
-                ("phone", "Telefon:"),
-                ("email", "Email:")
-            ]:
-                value = recipient.get(key, "")
-                if value:
-                    recipient_text_parts.append(Paragraph(f"<b>{label}</b> {value}", normal_style))
-            
-            # Utwórz tabelę z dwiema kolumnami (sprzedawca po lewej, odbiorca po prawej)
-            # Oblicz szerokość kolumn
-            page_width = A4[0] - 40*mm  # Szerokość strony minus marginesy
-            col_width = (page_width - 10*mm) / 2  # Połowa szerokości minus odstęp między kolumnami
-            
-            # Znajdź maksymalną liczbę wierszy
-            max_rows = max(len(company_text_parts), len(recipient_text_parts))
-            
-            # Utwórz wiersze tabeli
-            side_by_side_data = []
-            for i in range(max_rows):
-                left_cell = company_text_parts[i] if i < len(company_text_parts) else Paragraph("", normal_style)
-                right_cell = recipient_text_parts[i] if i < len(recipient_text_parts) else Paragraph("", normal_style)
-                side_by_side_data.append([left_cell, right_cell])
-            
-            side_by_side_table = Table(side_by_side_data, colWidths=[col_width, col_width])
-            side_by_side_table.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('LEFTPADDING', (0, 0), (0, -1), 0),
-                ('RIGHTPADDING', (0, 0), (0, -1), 5*mm),
-                ('LEFTPADDING', (1, 0), (1, -1), 5*mm),
-                ('RIGHTPADDING', (1, 0), (1, -1), 0),
-                ('TOPPADDING', (0, 0), (-1, -1), 2),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-            ]))
-            story.append(side_by_side_table)
-            
-            story.append(Spacer(1, 8*mm))
-            
-            # Pozycje oferty
-            story.append(Paragraph("<b>POZYCJE OFERTY:</b>", heading_style))
-            
-            # Styl dla komórek tabeli
-            cell_style = ParagraphStyle(
-                'TableCell',
-                parent=normal_style,
-                fontName=font_name,
-                fontSize=10,
-                leading=12,
-                textColor=colors.black
-            )
-            
-            cell_style_bold = ParagraphStyle(
-                'TableCellBold',
-                parent=normal_style,
-                fontName=font_bold,
-                fontSize=10,
-                leading=12,
-                textColor=colors.black
-            )
-            
-            # Styl dla nagłówka tabeli (biały tekst)
-            header_cell_style = ParagraphStyle(
-                'TableHeader',
-                parent=normal_style,
-                fontName=font_bold,
-                fontSize=11,
-                leading=13,
-                textColor=colors.whitesmoke
-            )
-            
-            # Nagłówek tabeli - użyj Paragraph dla lepszej obsługi Unicode
-            items_data = [[
-                Paragraph('Lp', header_cell_style),
-                Paragraph('Nazwa', header_cell_style),
-                Paragraph('Ilosc', header_cell_style),
-                Paragraph('Cena jedn.', header_cell_style),
-                Paragraph('Wartosc', header_cell_style)
-            ]]
-            
-            total = 0
-            for i, item in enumerate(self.offer_items, 1):
-                # Użyj Paragraph dla nazwy (może zawierać polskie znaki)
-                # Dla pozostałych pól też użyj Paragraph dla spójności
-                items_data.append([
-                    Paragraph(str(i), cell_style),
-                    Paragraph(item['name'], cell_style),  # To jest kluczowe - nazwa może mieć polskie znaki
-                    Paragraph(f"{item['quantity']:.2f}", cell_style),
-                    Paragraph(f"{item['unit_price']:.2f} PLN", cell_style),
-                    Paragraph(f"{item['total']:.2f} PLN", cell_style)
-                ])
-                total += item['total']
-            
-            # Wiersz sumy
-            items_data.append([
-                Paragraph('', cell_style),
-                Paragraph('', cell_style),
-                Paragraph('', cell_style),
-                Paragraph('<b>SUMA:</b>', cell_style_bold),
-                Paragraph(f'<b>{total:.2f} PLN</b>', cell_style_bold)
-            ])
-            
-            items_table = Table(items_data, colWidths=[15*mm, 80*mm, 25*mm, 30*mm, 30*mm])
-            items_table.setStyle(TableStyle([
-                # Nagłówek
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                # Uwaga: FONTNAME i FONTSIZE są ignorowane gdy używamy Paragraph,
-                # fonty są określone w ParagraphStyle
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('TOPPADDING', (0, 0), (-1, 0), 12),
-                
-                # Wiersze danych
-                ('VALIGN', (0, 1), (-1, -2), 'MIDDLE'),
-                ('BOTTOMPADDING', (0, 1), (-1, -2), 8),
-                ('TOPPADDING', (0, 1), (-1, -2), 8),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#f8f9fa')]),
-                
-                # Wiersz sumy
-                ('VALIGN', (0, -1), (-1, -1), 'MIDDLE'),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#ecf0f1')),
-                ('BOTTOMPADDING', (0, -1), (-1, -1), 10),
-                ('TOPPADDING', (0, -1), (-1, -1), 10),
-                
-                # Obramowanie
-                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
-                ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#34495e')),
-                ('LINEABOVE', (0, -1), (-1, -1), 2, colors.HexColor('#34495e')),
-            ]))
-            
-            story.append(items_table)
-            
-            # Generuj PDF
-            doc.build(story)
-            
-            messagebox.showinfo("Sukces", f"Oferta PDF została zapisana do pliku:\n{filename}")
-        except Exception as e:
-            messagebox.showerror("Błąd", f"Nie udało się wygenerować PDF: {str(e)}")
+                if is_offer_binary(filename):
+                    target = base + ".json"
+                    with OfferBinaryFile(filename) as offer:
+                        offer_data = offer.to_dict()
+                    with open(target, "w", encoding="utf-8") as f:
+                        json.dump(mark_normalized(offer_data), f, ensure_ascii=False, indent=2)
+                else:
+                    target = base + OFFB_EXTENSION
+                    write_offer_binary(target, load_offer_data(filename))
+                print(f"OK    {filename} -> {target}")
+            except (OSError, ValueError, TypeError) as e:
+                failed += 1
+                print(f"BŁĄD  {filename}: {e}", file=sys.stderr)
+        print(f"Skonwertowano {len(files) - failed}/{len(files)} ofert, błędów: {failed}")
+        return 1 if failed else 0
     
-    def load_offer_json(self):
-        # Wybierz plik do wczytania
-        filename = filedialog.askopenfilename(
-            defaultextension=".json",
-            filetypes=[("Pliki JSON", "*.json"), ("Wszystkie pliki", "*.*")]
-        )
+    totals = []
+    for filename in files:
+        try:
+            date, recipient_name, item_count, total = read_offer_summary(filename)
+        except (OSError, ValueError, TypeError) as e:
+            failed += 1
+            print(f"BŁĄD  {filename}: {e}", file=sys.stderr)
+            continue
+        totals.append(total)
+        print(f"{date:<10}  {recipient_name[:40]:<40}  {item_count:>7}  {total:>14.2f}  "
+              f"{os.path.basename(filename)}")
+    print(f"Ofert: {len(totals)}, suma: {math.fsum(totals):.2f} PLN, błędów: {failed}")
+    return 1 if failed else 0
+
+
+# Usługa renderowania (app.py serve): domyślny adres i limity
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_BACKLOG = 32
+SERVICE_TIMEOUT = 60.0
+SERVICE_MAX_BODY = 64 * 1024 * 1024
+
+# Liczba ostatnich żądań, z których liczone są percentyle czasu odpowiedzi
+SERVICE_LATENCY_WINDOW = 1000
+
+_SERVICE_CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "txt": "text/plain; charset=utf-8",
+}
+
+
+def render_offer_bytes(offer_data, kind):
+    """
+    Renderuje ofertę w schemacie save_offer_json do PDF lub TXT i zwraca
+    (zawartość pliku, czy wynik pochodzi z pamięci podręcznej).
+    Wykonywana w procesach roboczych usługi renderowania.
+    """
+    import tempfile
+    snapshot = offer_snapshot_from_data(normalize_offer_data(offer_data))
+    fd, filename = tempfile.mkstemp(prefix="offer-", suffix=f".{kind}")
+    os.close(fd)
+    try:
+        hit = render_offer(snapshot, filename, kind)
+        with open(filename, "rb") as f:
+            return f.read(), hit
+    finally:
+        os.remove(filename)
+
+
+class LatencyStats:
+    """
+    Liczniki żądań i czasy odpowiedzi ostatnich SERVICE_LATENCY_WINDOW żądań
+    (percentyle dla /metrics). Bezpieczne dla wielu wątków.
+    """
+    
+    def __init__(self, window=SERVICE_LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)
+        self.counts = collections.Counter()
+        self.started = time.time()
+    
+    def record(self, outcome, seconds=None):
+        with self._lock:
+            self.counts[outcome] += 1
+            if seconds is not None:
+                self._latencies.append(seconds)
+    
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self.counts)
         
-        if not filename:
-            return
+        def percentile(fraction):
+            # Percentyl metodą najbliższej rangi
+            if not latencies:
+                return None
+            return round(latencies[max(0, math.ceil(fraction * len(latencies)) - 1)] * 1000, 1)
         
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "requests": counts,
+            "latency_ms": {
+                "window": len(latencies),
+                "p50": percentile(0.50),
+                "p90": percentile(0.90),
+                "p99": percentile(0.99),
+                "max": round(latencies[-1] * 1000, 1) if latencies else None,
+            },
+        }
+
+
+class RenderService:
+    """
+    Pula procesów roboczych z zarejestrowanymi fontami i skompilowanym
+    szablonem, uruchamianych przed przyjęciem pierwszego żądania. Żądania
+    ponad liczbę procesów czekają w kolejce ograniczonej do backlog; gdy jest
+    pełna, żądanie jest odrzucane od razu.
+    """
+    
+    def __init__(self, workers, backlog=SERVICE_BACKLOG, timeout=SERVICE_TIMEOUT,
+                 font_dirs=(), template_path=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.font_dirs = list(font_dirs)
+        self.template_path = template_path
+        self.stats = LatencyStats()
+        self._slots = threading.BoundedSemaphore(workers + backlog)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+    
+    def _new_executor(self):
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_render_worker,
+                                       initargs=(self.font_dirs, self.template_path, True))
         try:
-            with open(filename, "r", encoding="utf-8") as f:
-                offer_data = json.load(f)
-            
-            # Napraw kodowanie danych
-            offer_data = fix_string_encoding(offer_data)
-            
-            # Sprawdź czy plik ma poprawną strukturę
-            if not isinstance(offer_data, dict):
-                messagebox.showerror("Błąd", "Nieprawidłowy format pliku JSON!")
-                return
-            
-            # Wczytaj dane firmy (opcjonalnie - tylko jeśli są w pliku)
-            if "company" in offer_data and offer_data["company"]:
-                company_from_file = offer_data["company"]
-                # Aktualizuj tylko puste pola w danych firmy
-                for key in self.company_data.keys():
-                    if key in company_from_file and company_from_file[key]:
-                        # Aktualizuj w słowniku
-                        self.company_data[key] = company_from_file[key]
-                        # Aktualizuj w interfejsie (jeśli istnieje pole)
-                        if key in self.company_entries:
-                            self.company_entries[key].delete(0, tk.END)
-                            self.company_entries[key].insert(0, company_from_file[key])
-            
-            # Wczytaj odbiorcę
-            if "recipient" not in offer_data or not offer_data["recipient"]:
-                messagebox.showerror("Błąd", "Plik nie zawiera danych odbiorcy!")
+            # Każde zadanie zgłoszone przy braku wolnego procesu uruchamia nowy proces
+            for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        return executor
+    
+    def start(self):
+        """
+        Uruchamia pulę i czeka, aż wszystkie procesy będą gotowe.
+        """
+        executor = self._new_executor()
+        with self._executor_lock:
+            self._executor = executor
+    
+    def close(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    @property
+    def pending(self):
+        return self._pending
+    
+    def _release(self, future):
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+    
+    def render(self, offer_data, kind):
+        """
+        Zwraca (zawartość pliku, trafienie w pamięci podręcznej). Zgłasza
+        queue.Full przy pełnej kolejce, TimeoutError po przekroczeniu limitu
+        czasu i BrokenProcessPool, gdy pula jest uruchamiana ponownie; błędy
+        renderowania (np. ValueError) są przekazywane dalej.
+        """
+        from concurrent.futures.process import BrokenProcessPool
+        with self._executor_lock:
+            executor = self._executor
+        if executor is None:
+            raise RuntimeError("Usługa renderowania nie jest uruchomiona")
+        if not self._slots.acquire(blocking=False):
+            raise queue.Full
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            try:
+                future = executor.submit(render_offer_bytes, offer_data, kind)
+            except BaseException:
+                self._release(None)
+                raise
+            # Miejsce w kolejce zwalnia dopiero zakończenie zadania - także po
+            # przekroczeniu czasu, gdy proces roboczy nadal renderuje
+            future.add_done_callback(self._release)
+            try:
+                return future.result(timeout=self.timeout)
+            except TimeoutError:
+                future.cancel()
+                raise
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+    
+    def _restart(self, broken):
+        # Proces roboczy zakończył się nieoczekiwanie - pula nie przyjmie już
+        # zadań, więc jest tworzona od nowa. Do czasu podmiany (także gdy nowa
+        # pula nie wystartuje) żądania trafiają do zepsutej puli i dostają 503.
+        if not self._restart_lock.acquire(blocking=False):
+            # Pulę uruchamia już inne żądanie
+            return
+        try:
+            if self._executor is not broken:
                 return
-            
-            recipient = offer_data["recipient"]
-            recipient_name = recipient.get("name", "")
-            
-            if not recipient_name:
-                messagebox.showerror("Błąd", "Odbiorca w pliku nie ma nazwy!")
+            try:
+                executor = self._new_executor()
+            except Exception:
                 return
-            
-            # Sprawdź czy odbiorca istnieje w liście
-            recipient_exists = False
-            for r in self.recipients:
-                if r.get("name") == recipient_name:
-                    # Zaktualizuj dane istniejącego odbiorcy
-                    for key, value in recipient.items():
-                        r[key] = value
-                    recipient_exists = True
-                    break
-            
-            # Jeśli odbiorca nie istnieje, dodaj go
-            if not recipient_exists:
-                self.recipients.append(recipient)
-                self.save_recipients()
-                self.refresh_recipients_list()
-            
-            # Ustaw odbiorcę w combobox
-            self.update_recipient_combo()
-            self.selected_recipient.set(recipient_name)
-            
-            # Wczytaj pozycje oferty
-            if "items" not in offer_data or not offer_data["items"]:
-                messagebox.showwarning("Uwaga", "Plik nie zawiera pozycji oferty!")
-                self.offer_items = []
-            else:
-                self.offer_items = offer_data["items"]
-                # Upewnij się, że każda pozycja ma obliczoną wartość total
-                for item in self.offer_items:
-                    if "total" not in item or item["total"] == 0:
-                        quantity = item.get("quantity", 0)
-                        unit_price = item.get("unit_price", 0)
-                        item["total"] = quantity * unit_price
-            
-            # Odśwież listę pozycji i sumę
-            self.refresh_items_list()
-            self.update_total()
-            self.clear_item_form()
-            
-            # Wyświetl informację o dacie oferty jeśli jest dostępna
-            date_info = ""
-            if "date" in offer_data:
-                date_info = f"\nData oferty: {offer_data['date']}"
-            
-            messagebox.showinfo("Sukces", 
-                f"Oferta została wczytana z pliku:\n{filename}{date_info}\n\n"
-                f"Odbiorca: {recipient_name}\n"
-                f"Pozycji: {len(self.offer_items)}")
-            
-        except json.JSONDecodeError:
-            messagebox.showerror("Błąd", "Nieprawidłowy format pliku JSON!")
-        except Exception as e:
-            messagebox.showerror("Błąd", f"Nie udało się wczytać oferty: {str(e)}")
+            with self._executor_lock:
+                if self._executor is not broken:
+                    # Usługa została w międzyczasie zamknięta
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    return
+                self._executor = executor
+        finally:
+            self._restart_lock.release()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+class _RenderRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    POST /render/pdf, POST /render/txt - oferta JSON w treści żądania;
+    GET /metrics - liczniki i percentyle czasu odpowiedzi; GET /health.
+    """
     
-    def save_offer_json(self):
-        if not self.offer_items:
-            messagebox.showwarning("Uwaga", "Dodaj pozycje do oferty!")
+    server_version = "OfferRenderService/1"
+    
+    def _send(self, status, body, content_type="application/json", headers=()):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _error(self, status, message, headers=()):
+        self._send(status, {"error": message}, headers=headers)
+    
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/metrics":
+            metrics = service.stats.snapshot()
+            metrics["workers"] = service.workers
+            metrics["pending"] = service.pending
+            self._send(200, metrics)
+        elif self.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._error(404, "Nieznany adres")
+    
+    def do_POST(self):
+        from concurrent.futures.process import BrokenProcessPool
+        service = self.server.service
+        kind = self.path.rstrip("/").rsplit("/", 1)[-1]
+        if not self.path.startswith("/render/") or kind not in _SERVICE_CONTENT_TYPES:
+            self._error(404, "Nieznany adres (dostępne: /render/pdf, /render/txt)")
             return
         
-        recipient = self.get_selected_recipient_data()
-        if not recipient:
-            messagebox.showwarning("Uwaga", "Wybierz odbiorcę oferty!")
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self._error(411, "Brak nagłówka Content-Length")
+            return
+        if length > SERVICE_MAX_BODY:
+            service.stats.record("too_large")
+            self._error(413, "Zbyt duże żądanie")
+            return
+        try:
+            offer_data = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            service.stats.record("bad_request")
+            self._error(400, f"Nieprawidłowy JSON: {e}")
+            return
+        if not isinstance(offer_data, dict):
+            service.stats.record("bad_request")
+            self._error(400, "Oferta musi być obiektem JSON")
             return
         
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("Pliki JSON", "*.json"), ("Wszystkie pliki", "*.*")],
-            initialfile=f"Oferta_{recipient.get('name', '')}_{datetime.now().strftime('%Y%m%d')}.json"
-        )
-        
-        if not filename:
+        try:
+            content, hit = service.render(offer_data, kind)
+        except queue.Full:
+            service.stats.record("rejected")
+            self._error(503, "Kolejka renderowania jest pełna", headers=[("Retry-After", "1")])
+            return
+        except TimeoutError:
+            service.stats.record("timeout", time.perf_counter() - start)
+            self._error(504, f"Przekroczono limit czasu renderowania ({service.timeout:g} s)")
+            return
+        except BrokenProcessPool:
+            service.stats.record("error", time.perf_counter() - start)
+            self._error(503, "Proces roboczy zakończył się nieoczekiwanie, pula jest uruchamiana ponownie",
+                        headers=[("Retry-After", "1")])
+            return
+        except (ValueError, KeyError, TypeError) as e:
+            service.stats.record("bad_request", time.perf_counter() - start)
+            self._error(400, str(e))
             return
+        except Exception as e:
+            service.stats.record("error", time.perf_counter() - start)
+            self._error(500, str(e))
+            return
+        
+        seconds = time.perf_counter() - start
+        service.stats.record("ok", seconds)
+        self._send(200, content, _SERVICE_CONTENT_TYPES[kind],
+                   headers=[("X-Render-Cache", "hit" if hit else "miss"),
+                            ("X-Render-Time", f"{seconds * 1000:.1f}ms")])
+
+
+def serve_main(argv=None):
+    """
+    Usługa renderowania ofert przez HTTP (domyślnie tylko localhost) dla
+    innych programów, np. systemu ERP.
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py serve",
+        description="Lokalna usługa HTTP renderująca oferty JSON do PDF/TXT "
+                    "(POST /render/pdf, POST /render/txt, GET /metrics).")
+    parser.add_argument("--host", default=SERVICE_HOST,
+                        help=f"adres nasłuchu (domyślnie {SERVICE_HOST})")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT,
+                        help=f"port (domyślnie {SERVICE_PORT})")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="liczba procesów roboczych")
+    parser.add_argument("--backlog", type=int, default=SERVICE_BACKLOG,
+                        help=f"maksymalna liczba żądań czekających w kolejce (domyślnie {SERVICE_BACKLOG})")
+    parser.add_argument("--timeout", type=float, default=SERVICE_TIMEOUT,
+                        help=f"limit czasu jednego żądania w sekundach (domyślnie {SERVICE_TIMEOUT:g})")
+    parser.add_argument("--font-dir", action="append", default=[],
+                        help="dodatkowy katalog z fontami TTF (można podać wielokrotnie)")
+    parser.add_argument("--template",
+                        help="plik JSON z własnym szablonem oferty")
+    args = parser.parse_args(argv)
+    
+    if not load_reportlab():
+        print("Biblioteka reportlab nie jest zainstalowana! "
+              "Zainstaluj ją poleceniem: pip install reportlab", file=sys.stderr)
+        return 2
+    try:
+        # Sprawdź szablon przed uruchomieniem procesów roboczych
+        init_render_worker(args.font_dir, args.template, warm=False)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Nie udało się wczytać szablonu: {e}", file=sys.stderr)
+        return 2
+    
+    start = time.perf_counter()
+    service = RenderService(max(1, args.workers), max(0, args.backlog), args.timeout,
+                            args.font_dir, args.template)
+    service.start()
+    try:
+        server = http.server.ThreadingHTTPServer((args.host, args.port), _RenderRequestHandler)
+    except OSError as e:
+        service.close()
+        print(f"Nie udało się uruchomić usługi: {e}", file=sys.stderr)
+        return 1
+    server.daemon_threads = True
+    server.service = service
+    # SIGTERM (np. menedżer usług) kończy pracę tak samo jak Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Usługa renderowania: http://{args.host}:{server.server_port} "
+          f"(procesów: {service.workers}, gotowa w {time.perf_counter() - start:.2f} s)",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+# Wysyłka ofert e-mailem (app.py send): domyślne ustawienia SMTP
+SMTP_PORT = 587
+SMTP_CONNECTIONS = 2
+SMTP_RETRIES = 3
+SMTP_RETRY_DELAY = 2.0
+SMTP_TIMEOUT = 30.0
+
+# Po tylu wiadomościach połączenie jest otwierane od nowa (serwery często
+# ograniczają liczbę wiadomości w jednej sesji)
+SMTP_MESSAGES_PER_CONNECTION = 100
+
+# Hasło SMTP jest czytane ze zmiennej środowiskowej, nie z wiersza poleceń
+SMTP_PASSWORD_ENV = "OFFER_SMTP_PASSWORD"
+
+DELIVERY_LOG_FILE = "delivery_log.csv"
+DELIVERY_LOG_FIELDS = ("time", "file", "address", "status", "attempts", "error")
+
+OFFER_MAIL_SUBJECT = "Oferta {company} z dnia {date}"
+OFFER_MAIL_BODY = """Dzień dobry,
+
+w załączniku przesyłamy ofertę z dnia {date}.
+
+Z poważaniem
+{company}
+"""
+
+DeliveryResult = collections.namedtuple(
+    "DeliveryResult", ["key", "address", "status", "attempts", "error"])
+
+
+def build_offer_message(offer_data, pdf_data, attachment_name, sender=None,
+                        subject=OFFER_MAIL_SUBJECT, body=OFFER_MAIL_BODY):
+    """
+    Buduje wiadomość z ofertą PDF w załączniku do odbiorcy oferty (pole email).
+    Zgłasza ValueError, jeśli odbiorca nie ma adresu e-mail.
+    """
+    from email.message import EmailMessage
+    from email.utils import formatdate, make_msgid
+    
+    recipient = offer_data.get("recipient") or {}
+    company = offer_data.get("company") or {}
+    address = str(recipient.get("email") or "").strip()
+    if not address:
+        raise ValueError("Odbiorca nie ma adresu e-mail!")
+    sender = sender or str(company.get("email") or "").strip()
+    if not sender:
+        raise ValueError("Brak adresu nadawcy (podaj --sender lub e-mail firmy)!")
+    
+    fields = {"company": company.get("name", ""), "recipient": recipient.get("name", ""),
+              "date": parse_offer_date(offer_data).strftime("%d.%m.%Y")}
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = address
+    message["Subject"] = subject.format(**fields)
+    message["Date"] = formatdate(localtime=True)
+    message["Message-ID"] = make_msgid()
+    message.set_content(body.format(**fields))
+    message.add_attachment(pdf_data, maintype="application", subtype="pdf",
+                           filename=attachment_name)
+    return message
+
+
+def smtp_connector(host, port=SMTP_PORT, security="starttls", user=None, password=None,
+                   timeout=SMTP_TIMEOUT):
+    """
+    Zwraca funkcję otwierającą zalogowane połączenie SMTP. security: "starttls",
+    "ssl" albo "none" (np. lokalny serwer testowy).
+    """
+    import smtplib
+    import ssl
+    
+    def connect():
+        if security == "ssl":
+            connection = smtplib.SMTP_SSL(host, port, timeout=timeout,
+                                          context=ssl.create_default_context())
+        else:
+            connection = smtplib.SMTP(host, port, timeout=timeout)
+        try:
+            if security == "starttls":
+                connection.starttls(context=ssl.create_default_context())
+            if user:
+                connection.login(user, password or "")
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+    return connect
+
+
+def _smtp_retryable(error):
+    # Odpowiedzi 5xx (np. nieistniejący adres) są trwałe - ponowienie nic nie da
+    import smtplib
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPException, OSError))
+
+
+class OfferMailer:
+    """
+    Wysyła wiadomości przez kilka stałych połączeń SMTP - każdy wątek
+    wysyłający utrzymuje jedno połączenie dla kolejnych wiadomości zamiast
+    łączyć się osobno dla każdej. Błędy przejściowe (zerwane połączenie,
+    odpowiedzi 4xx) są ponawiane z rosnącym odstępem, odrzucenie logowania
+    przerywa całą wysyłkę.
+    """
+    
+    def __init__(self, connect, connections=SMTP_CONNECTIONS, retries=SMTP_RETRIES,
+                 retry_delay=SMTP_RETRY_DELAY, per_connection=SMTP_MESSAGES_PER_CONNECTION):
+        self.connect = connect
+        self.connections = max(1, connections)
+        self.retries = max(0, retries)
+        self.retry_delay = retry_delay
+        self.per_connection = per_connection
+        self._fatal = None
+    
+    def send(self, jobs, report=None):
+        """
+        Wysyła wiadomości z jobs - par (klucz, wiadomość) lub trójek (klucz,
+        wyjątek, adres odbiorcy), gdy wiadomości nie udało się zbudować
+        (adres trafia do wyniku pominiętej wiadomości). Wiadomości są pobierane na
+        bieżąco (przygotowanie kolejnych trwa w czasie wysyłki).
+        report(DeliveryResult) jest wywoływane po każdej wiadomości, z wątków
+        wysyłających. Zwraca listę wyników.
+        """
+        pending = queue.Queue(maxsize=self.connections * 2)
+        results = []
+        lock = threading.Lock()
+        
+        def finish(result):
+            with lock:
+                results.append(result)
+                if report:
+                    report(result)
+        
+        workers = [threading.Thread(target=self._worker, args=(pending, finish), daemon=True)
+                   for _ in range(self.connections)]
+        for worker in workers:
+            worker.start()
+        try:
+            for key, message, *address in jobs:
+                if isinstance(message, Exception):
+                    finish(DeliveryResult(key, "".join(address), "skipped", 0, str(message)))
+                else:
+                    pending.put((key, message))
+        finally:
+            for _ in workers:
+                pending.put(None)
+            for worker in workers:
+                worker.join()
+        return results
+    
+    def _worker(self, pending, finish):
+        connection = None
+        sent = 0
+        try:
+            while True:
+                job = pending.get()
+                if job is None:
+                    return
+                key, message = job
+                address = message["To"]
+                attempts = 0
+                while True:
+                    if self._fatal is not None:
+                        finish(DeliveryResult(key, address, "failed", attempts, str(self._fatal)))
+                        break
+                    attempts += 1
+                    try:
+                        if connection is not None and sent >= self.per_connection:
+                            connection = self._close(connection)
+                        if connection is None:
+                            connection = self._open()
+                            sent = 0
+                        connection.send_message(message)
+                        sent += 1
+                        finish(DeliveryResult(key, address, "sent", attempts, ""))
+                        break
+                    except Exception as e:
+                        connection = self._recover(connection, e)
+                        if self._fatal is None and _smtp_retryable(e) and attempts <= self.retries:
+                            time.sleep(self.retry_delay * 2 ** (attempts - 1))
+                            continue
+                        finish(DeliveryResult(key, address, "failed", attempts, str(e)))
+                        break
+        finally:
+            self._close(connection)
+    
+    def _open(self):
+        import smtplib
+        try:
+            return self.connect()
+        except smtplib.SMTPAuthenticationError as e:
+            # Kolejne próby logowania mogłyby zablokować konto
+            self._fatal = e
+            raise
+    
+    def _recover(self, connection, error):
+        # Odrzucona wiadomość nie psuje sesji - wystarczy RSET; po innych
+        # błędach połączenie jest otwierane od nowa
+        import smtplib
+        if connection is not None and isinstance(error, smtplib.SMTPResponseException):
+            try:
+                connection.rset()
+                return connection
+            except (smtplib.SMTPException, OSError):
+                pass
+        return self._close(connection)
+    
+    def _close(self, connection):
+        if connection is not None:
+            try:
+                connection.quit()
+            except Exception:
+                connection.close()
+        return None
+
+
+def read_delivery_log(filename):
+    """
+    Zwraca zbiór plików ofert wysłanych według dziennika wysyłki.
+    """
+    sent = set()
+    try:
+        with open(filename, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                if row.get("status") == "sent":
+                    sent.add(row.get("file"))
+    except FileNotFoundError:
+        pass
+    return sent
+
+
+def send_main(argv=None):
+    """
+    Wysyła oferty PDF e-mailem na adresy odbiorców z plików ofert.
+    """
+    parser = argparse.ArgumentParser(
+        prog="app.py send",
+        description="Wysyłka ofert PDF e-mailem do odbiorców (pole email) przez "
+                    "kilka stałych połączeń SMTP, z ponowieniami i dziennikiem wysyłki.")
+    parser.add_argument("inputs", nargs="+",
+                        help="katalogi, wzorce glob lub pliki ofert")
+    parser.add_argument("--smtp-host", required=True,
+                        help="serwer SMTP")
+    parser.add_argument("--smtp-port", type=int, default=SMTP_PORT,
+                        help=f"port serwera SMTP (domyślnie {SMTP_PORT})")
+    parser.add_argument("--security", choices=("starttls", "ssl", "none"), default="starttls",
+                        help="szyfrowanie połączenia (none - np. lokalny serwer testowy)")
+    parser.add_argument("--user",
+                        help=f"użytkownik SMTP (hasło w zmiennej {SMTP_PASSWORD_ENV})")
+    parser.add_argument("--sender",
+                        help="adres nadawcy (domyślnie e-mail firmy z oferty)")
+    parser.add_argument("--pdf-dir",
+                        help="katalog z wygenerowanymi plikami PDF (np. z app.py batch); "
+                             "brakujące są generowane")
+    parser.add_argument("-c", "--connections", type=int, default=SMTP_CONNECTIONS,
+                        help=f"liczba równoległych połączeń SMTP (domyślnie {SMTP_CONNECTIONS})")
+    parser.add_argument("--retries", type=int, default=SMTP_RETRIES,
+                        help=f"liczba ponowień po błędzie przejściowym (domyślnie {SMTP_RETRIES})")
+    parser.add_argument("--retry-delay", type=float, default=SMTP_RETRY_DELAY,
+                        help=f"odstęp przed pierwszym ponowieniem w sekundach (domyślnie {SMTP_RETRY_DELAY:g})")
+    parser.add_argument("--log", default=DELIVERY_LOG_FILE,
+                        help=f"dziennik wysyłki CSV (domyślnie {DELIVERY_LOG_FILE})")
+    parser.add_argument("--skip-sent", action="store_true",
+                        help="pomiń oferty wysłane już według dziennika")
+    args = parser.parse_args(argv)
+    
+    files = collect_offer_files(args.inputs)
+    if args.skip_sent:
+        sent = read_delivery_log(args.log)
+        files = [filename for filename in files if filename not in sent]
+    if not files:
+        print("Nie znaleziono plików ofert do wysłania.", file=sys.stderr)
+        return 1
+    if args.pdf_dir:
+        # Pliki PDF są dobierane po nazwie pliku oferty - oferty o tej samej
+        # nazwie z różnych katalogów dostałyby ten sam załącznik
+        by_name = collections.defaultdict(list)
+        for filename in files:
+            by_name[os.path.splitext(os.path.basename(filename))[0].lower()].append(filename)
+        duplicates = [names for names in by_name.values() if len(names) > 1]
+        if duplicates:
+            print("Oferty o tej samej nazwie pliku nie mogą być wysłane z --pdf-dir:", file=sys.stderr)
+            for names in duplicates:
+                print("  " + ", ".join(names), file=sys.stderr)
+            return 2
+    if not load_reportlab():
+        print("Biblioteka reportlab nie jest zainstalowana! "
+              "Zainstaluj ją poleceniem: pip install reportlab", file=sys.stderr)
+        return 2
+    
+    def messages():
+        # Oferty są przygotowywane w trakcie wysyłki poprzednich
+        for filename in files:
+            offer_data = {}
+            try:
+                offer_data = load_offer_data(filename)
+                base = os.path.splitext(os.path.basename(filename))[0]
+                pdf_file = os.path.join(args.pdf_dir, base + ".pdf") if args.pdf_dir else None
+                if pdf_file and os.path.exists(pdf_file):
+                    with open(pdf_file, "rb") as f:
+                        pdf_data = f.read()
+                else:
+                    pdf_data, _ = render_offer_bytes(offer_data, "pdf")
+                yield filename, build_offer_message(offer_data, pdf_data, base + ".pdf", args.sender)
+            except Exception as e:
+                # Adres odbiorcy (jeśli jest) pozwala ustalić w dzienniku, kogo pominięto
+                recipient = offer_data.get("recipient") or {}
+                yield filename, e, str(recipient.get("email") or "").strip()
+    
+    connect = smtp_connector(args.smtp_host, args.smtp_port, args.security, args.user,
+                             os.environ.get(SMTP_PASSWORD_ENV))
+    mailer = OfferMailer(connect, args.connections, args.retries, args.retry_delay)
+    
+    new_log = not os.path.exists(args.log)
+    with open(args.log, "a", encoding="utf-8", newline="") as log:
+        writer = csv.writer(log)
+        if new_log:
+            writer.writerow(DELIVERY_LOG_FIELDS)
+        
+        def report(result):
+            writer.writerow((datetime.now().isoformat(timespec="seconds"), result.key,
+                             result.address, result.status, result.attempts, result.error))
+            log.flush()
+            if result.status == "sent":
+                print(f"OK    {result.key} -> {result.address}")
+            else:
+                print(f"BŁĄD  {result.key}: {result.error}", file=sys.stderr)
         
+        start = time.perf_counter()
+        results = mailer.send(messages(), report)
+    
+    sent = sum(1 for result in results if result.status == "sent")
+    print(f"Wysłano {sent}/{len(files)} ofert w {time.perf_counter() - start:.2f} s "
+          f"(połączeń: {mailer.connections}), dziennik: {args.log}")
+    return 0 if sent == len(files) else 1
+
+
+# Rozmiary danych testów wydajności (--quick - tylko najmniejszy rozmiar)
+BENCH_SIZES = {
+    "encoding": (1000, 100000),
+    "render": (10, 1000, 10000),
+    "recipients": (1000, 100000),
+    "offer": (10, 1000, 10000),
+}
+
+BENCH_FORMAT_VERSION = 1
+
+# Względne spowolnienie względem wyniku bazowego uznawane za regresję
+BENCH_REGRESSION_THRESHOLD = 0.25
+
+# Różnice poniżej tej wartości (w sekundach) są szumem pomiaru, nie regresją
+BENCH_MIN_DIFFERENCE = 0.001
+
+BENCH_COMPANY = {
+    "name": "Firma Zażółć Sp. z o.o.",
+    "address": "ul. Długa 1",
+    "city": "Łódź",
+    "postal_code": "90-001",
+    "nip": "1234567890",
+    "phone": "+48 42 000 00 00",
+    "email": "biuro@firma.pl",
+    "bank_account": "PL 00 1111 2222 3333 4444 5555 6666"
+}
+
+
+def bench_recipients(count, damaged=False):
+    """
+    Zwraca syntetycznych odbiorców. damaged=True - nazwy i miasta ze znakami
+    zastępczymi, jak w plikach zapisanych w złym kodowaniu.
+    """
+    mark = "\ufffd" if damaged else "ó"
+    return [{
+        "id": f"bench-{i}",
+        "name": f"Przedsiębiorstwo Handl{mark}we {i} Sp. z o.o.",
+        "address": f"ul. Wierzbowa {i % 300 + 1}",
+        "city": f"Wr{mark}cław" if i % 2 else "Kraków",
+        "postal_code": f"{i % 90 + 10:02d}-{i % 1000:03d}",
+        "nip": f"{1000000000 + i}",
+        "phone": "",
+        "email": f"biuro{i}@example.pl"
+    } for i in range(count)]
+
+
+def bench_items(count):
+    """
+    Zwraca syntetyczne pozycje oferty.
+    """
+    items = []
+    for i in range(count):
+        quantity = i % 7 + 1
+        unit_price = round(2.5 + (i * 37 % 1000) / 7, 2)
+        items.append({
+            "name": f"Śruba ocynkowana M{i % 20 + 4} z nakrętką, opakowanie {i}",
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "total": round(quantity * unit_price, 2)
+        })
+    return items
+
+
+def bench_cases(directory, quick=False):
+    """
+    Zwraca listę (nazwa, rozmiar, funkcja) testów wydajności. Pliki robocze
+    powstają w katalogu directory.
+    """
+    def sizes(group):
+        return BENCH_SIZES[group][:1] if quick else BENCH_SIZES[group]
+    
+    def path(name):
+        return os.path.join(directory, name)
+    
+    def encoding_case(data):
+        def run():
+            # Naprawa ma działać na zimno, bez zapamiętanych wyników
+            _repair_encoding.cache_clear()
+            fix_string_encoding(data)
+        return run
+    
+    def recipients_save_case(store, recipients):
+        return lambda: store.save_recipients(recipients)
+    
+    def recipients_load_case(store):
+        return store.load_recipients
+    
+    def pdf_case(items, offer_date):
+        recipient = bench_recipients(1)[0]
+        return lambda: build_offer_pdf(path("offer.pdf"), BENCH_COMPANY, recipient, items, offer_date)
+    
+    def txt_case(items, offer_date):
+        recipient = bench_recipients(1)[0]
+        return lambda: write_offer_txt(path("offer.txt"), BENCH_COMPANY, recipient, items, offer_date)
+    
+    def offer_json_case(offer_data):
+        def run():
+            with open(path("offer.json"), "w", encoding="utf-8") as f:
+                json.dump(mark_normalized(offer_data), f, ensure_ascii=False, indent=2)
+            load_offer_data(path("offer.json"))
+        return run
+    
+    def offer_offb_case(offer_data):
+        def run():
+            write_offer_binary(path("offer.offb"), offer_data)
+            load_offer_data(path("offer.offb"))
+        return run
+    
+    cases = []
+    for count in sizes("encoding"):
+        cases.append(("encoding_clean", count, encoding_case(bench_recipients(count))))
+        cases.append(("encoding_damaged", count, encoding_case(bench_recipients(count, damaged=True))))
+    
+    offer_date = datetime(2026, 1, 15)
+    for count in sizes("render"):
+        items = bench_items(count)
+        if REPORTLAB_AVAILABLE:
+            cases.append(("render_pdf", count, pdf_case(items, offer_date)))
+        cases.append(("render_txt", count, txt_case(items, offer_date)))
+    
+    for count in sizes("recipients"):
+        recipients = bench_recipients(count)
+        store = JsonStore(path(f"recipients_{count}.json"), path("company_data.json"))
+        store.save_recipients(recipients)
+        cases.append(("recipients_save", count, recipients_save_case(store, recipients)))
+        cases.append(("recipients_load", count, recipients_load_case(store)))
+        # Starszy plik (sama lista, bez markera) - wczytanie z naprawą kodowania
+        legacy = JsonStore(path(f"recipients_legacy_{count}.json"), path("company_data.json"))
+        with open(legacy.recipients_file, "w", encoding="utf-8") as f:
+            json.dump(recipients, f, ensure_ascii=False, indent=2)
+        cases.append(("recipients_load_legacy", count, recipients_load_case(legacy)))
+    
+    for count in sizes("offer"):
         offer_data = {
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "company": self.company_data,
-            "recipient": recipient,
-            "items": self.offer_items,
-            "total": sum(item["total"] for item in self.offer_items)
+            "date": offer_date.strftime("%Y-%m-%d"),
+            "company": BENCH_COMPANY,
+            "recipient": bench_recipients(1)[0],
+            "items": bench_items(count)
         }
-        
+        cases.append(("offer_json_roundtrip", count, offer_json_case(offer_data)))
+        cases.append(("offer_offb_roundtrip", count, offer_offb_case(offer_data)))
+    return cases
+
+
+def run_bench_case(fn, repeat, max_seconds):
+    """
+    Uruchamia fn do repeat razy (po pierwszym przebiegu przerywa, gdy łączny
+    czas przekroczy max_seconds). Zwraca czasy kolejnych przebiegów w sekundach.
+    """
+    times = []
+    total = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        times.append(seconds)
+        total += seconds
+        if total >= max_seconds:
+            break
+    return times
+
+
+def bench_key(name, size):
+    return f"{name}[{size}]"
+
+
+def compare_bench(results, baseline, threshold=BENCH_REGRESSION_THRESHOLD):
+    """
+    Porównuje najlepsze czasy z wynikami bazowymi. Zwraca listę
+    (klucz, czas bazowy, czas bieżący, stosunek) dla testów wolniejszych
+    o więcej niż threshold (i więcej niż BENCH_MIN_DIFFERENCE).
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base or not base.get("min"):
+            continue
+        ratio = result["min"] / base["min"]
+        if ratio > 1 + threshold and result["min"] - base["min"] > BENCH_MIN_DIFFERENCE:
+            regressions.append((key, base["min"], result["min"], ratio))
+    return regressions
+
+
+def bench_main(argv=None):
+    """
+    Testy wydajności (bez interfejsu Tk) na danych syntetycznych: naprawa
+    kodowania, generowanie PDF i TXT, zapis i wczytanie odbiorców oraz ofert.
+    Wyniki w JSON można porównać z zapisanym wynikiem bazowym.
+    """
+    import platform
+    import statistics
+    import tempfile
+    
+    parser = argparse.ArgumentParser(
+        prog="app.py bench",
+        description="Testy wydajności na danych syntetycznych z wynikami w JSON.")
+    parser.add_argument("-o", "--output",
+                        help="zapisz wyniki do pliku JSON")
+    parser.add_argument("--baseline",
+                        help="plik JSON z wynikami bazowymi do porównania")
+    parser.add_argument("--threshold", type=float, default=BENCH_REGRESSION_THRESHOLD,
+                        help="dopuszczalne spowolnienie względem wyników bazowych "
+                             f"(domyślnie {BENCH_REGRESSION_THRESHOLD})")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="maksymalna liczba przebiegów każdego testu (domyślnie 5)")
+    parser.add_argument("--max-time", type=float, default=10.0,
+                        help="limit czasu jednego testu w sekundach (domyślnie 10)")
+    parser.add_argument("--quick", action="store_true",
+                        help="tylko najmniejsze rozmiary danych")
+    parser.add_argument("-k", "--filter", default="",
+                        help="uruchom tylko testy, których nazwa zawiera podany tekst")
+    args = parser.parse_args(argv)
+    
+    baseline = None
+    if args.baseline:
         try:
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(offer_data, f, ensure_ascii=False, indent=2)
-            messagebox.showinfo("Sukces", f"Oferta została zapisana do pliku:\n{filename}")
-        except Exception as e:
-            messagebox.showerror("Błąd", f"Nie udało się zapisać oferty: {str(e)}")
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)["results"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Nie udało się wczytać wyników bazowych: {e}", file=sys.stderr)
+            return 2
+    
+    # Fonty i szablon są przygotowywane przed pomiarem, jak w procesach wsadowych
+    init_render_worker()
+    
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="offer-bench-") as directory:
+        for name, size, fn in bench_cases(directory, args.quick):
+            if args.filter not in name:
+                continue
+            times = run_bench_case(fn, max(1, args.repeat), args.max_time)
+            key = bench_key(name, size)
+            results[key] = {
+                "name": name,
+                "size": size,
+                "runs": len(times),
+                "min": min(times),
+                "median": statistics.median(times),
+                "max": max(times),
+            }
+            print(f"{key:<34} {min(times) * 1000:10.2f} ms  "
+                  f"(mediana {statistics.median(times) * 1000:.2f} ms, przebiegów: {len(times)})")
+    
+    report = {
+        "version": BENCH_FORMAT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "reportlab": REPORTLAB_VERSION,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    if baseline is None:
+        return 0
+    regressions = compare_bench(results, baseline, args.threshold)
+    for key, base_seconds, seconds, ratio in regressions:
+        print(f"REGRESJA  {key}: {base_seconds * 1000:.2f} ms -> {seconds * 1000:.2f} ms "
+              f"(x{ratio:.2f})", file=sys.stderr)
+    print(f"Porównano z {args.baseline}: regresji {len(regressions)} "
+          f"(próg +{args.threshold:.0%})", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+# Docelowy czas do wyświetlenia gotowego okna (od startu procesu)
+STARTUP_TARGET_SECONDS = 0.5
+
+
+class StartupTimer:
+    """
+    Pomiar etapów startu aplikacji liczonych od startu procesu
+    (OFFER_STARTUP_REPORT=1 lub "python app.py startup" wypisuje raport).
+    """
+    
+    def __init__(self, start=_PROCESS_START):
+        self.start = start
+        self.stages = []
+    
+    def mark(self, stage):
+        self.stages.append((stage, time.perf_counter() - self.start))
+    
+    def elapsed(self, stage):
+        for name, seconds in self.stages:
+            if name == stage:
+                return seconds
+        return None
+    
+    def report(self, target=STARTUP_TARGET_SECONDS):
+        """
+        Zwraca tekst raportu i informację, czy okno było gotowe w czasie target.
+        """
+        lines = []
+        previous = 0.0
+        for stage, seconds in self.stages:
+            lines.append(f"{stage:<20} {seconds * 1000:8.1f} ms  (+{(seconds - previous) * 1000:.1f} ms)")
+            previous = seconds
+        ready = self.elapsed("okno gotowe")
+        ok = ready is not None and ready <= target
+        status = "OK" if ok else "PRZEKROCZONY"
+        lines.append(f"Cel {target * 1000:.0f} ms do gotowego okna: {status}")
+        return "\n".join(lines), ok
+
+
+def main(argv=None):
+    """
+    Uruchamia interfejs lub podaną komendę. "--trace PLIK" przed komendą
+    (lub OFFER_TRACE=PLIK) zapisuje śledzenie czasu operacji po jej zakończeniu.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    trace_file = os.environ.get(TRACE_ENV)
+    if len(argv) >= 2 and argv[0] == "--trace":
+        trace_file = argv[1]
+        argv = argv[2:]
+    if not trace_file:
+        return run_command(argv)
+    
+    # Procesy robocze trybu wsadowego nie są śledzone (--workers 1 - całość
+    # w jednym procesie)
+    tracer.start(trace_file)
+    try:
+        return run_command(argv)
+    finally:
+        try:
+            tracer.save()
+        except OSError as e:
+            print(f"Nie udało się zapisać śledzenia: {e}", file=sys.stderr)
+        print(tracer.report(), file=sys.stderr)
 
 
-def main():
+def run_command(argv):
+    if argv and argv[0] == "batch":
+        return batch_main(argv[1:])
+    if argv and argv[0] == "db":
+        return db_main(argv[1:])
+    if argv and argv[0] == "catalog":
+        return catalog_main(argv[1:])
+    if argv and argv[0] == "txt":
+        return txt_main(argv[1:])
+    if argv and argv[0] == "offb":
+        return offb_main(argv[1:])
+    if argv and argv[0] == "archive":
+        return archive_main(argv[1:])
+    if argv and argv[0] == "bench":
+        return bench_main(argv[1:])
+    if argv and argv[0] == "serve":
+        return serve_main(argv[1:])
+    if argv and argv[0] == "send":
+        return send_main(argv[1:])
+    if argv and argv[0] == "merge":
+        return merge_main(argv[1:])
+    
+    # "startup" - pomiar startu: okno zamyka się po wczytaniu odbiorców
+    measure_only = bool(argv) and argv[0] == "startup"
+    timer = StartupTimer()
+    timer.mark("import modułów")
+    
     root = tk.Tk()
-    app = OfferCreatorApp(root)
+    timer.mark("okno Tk")
+    app = OfferCreatorApp(root, startup=timer)
+    timer.mark("interfejs")
     
-    # Wczytaj odbiorców przy starcie
+    # Wczytaj odbiorców przy starcie (w tle - okno jest gotowe wcześniej)
     app.load_recipients()
+    root.after_idle(timer.mark, "okno gotowe")
+    
+    if measure_only:
+        def quit_when_loaded():
+            if app._recipients_loading or timer.elapsed("okno gotowe") is None:
+                root.after(10, quit_when_loaded)
+            else:
+                root.destroy()
+        root.after(10, quit_when_loaded)
     
     root.mainloop()
+    
+    if measure_only or os.environ.get("OFFER_STARTUP_REPORT"):
+        report, ok = timer.report()
+        print(report, file=sys.stderr)
+        if measure_only:
+            return 0 if ok else 1
 
 
 if __name__ == "__main__":
-    main()
-
+    sys.exit(main())
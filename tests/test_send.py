@@ -0,0 +1,149 @@
+"""
+Wysyłka ofert (app.py send) przez lokalny zastępczy serwer SMTP.
+"""
+import csv
+import email
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    # Najprostszy serwer SMTP: przyjmuje wiadomości, adresy z "odrzuc" dostają 550
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost")
+        while True:
+            line = self.rfile.readline().decode("utf-8", "replace").rstrip("\r\n")
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in ("EHLO", "HELO", "MAIL", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif command == "RCPT":
+                self.reply("550 Brak skrzynki" if "odrzuc" in line else "250 OK")
+            elif command == "DATA":
+                self.reply("354 Dalej")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b".\r\n", b""):
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                self.server.messages.append(email.message_from_bytes(b"".join(lines)))
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Koniec")
+                return
+            else:
+                self.reply("502 Nieobsługiwane")
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.messages = []
+        self.connections = 0
+
+
+@unittest.skipUnless(app.load_reportlab(), "reportlab nie jest zainstalowany")
+class SendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _SMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.pdf_dir = os.path.join(self.dir, "pdf")
+        os.makedirs(self.pdf_dir)
+        self.log = os.path.join(self.dir, "delivery_log.csv")
+
+    def write_offer(self, name, recipient_email, company_email="biuro@firma.pl"):
+        offer_data = {
+            "date": "2026-03-01",
+            "company": {"name": "Firma", "email": company_email},
+            "recipient": {"name": f"Odbiorca {name}", "email": recipient_email},
+            "items": [{"name": "Usługa", "quantity": 1, "unit_price": 10.0, "total": 10.0}]
+        }
+        with open(os.path.join(self.dir, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(offer_data, f, ensure_ascii=False)
+        # Gotowy plik PDF (--pdf-dir) - test nie renderuje ofert
+        with open(os.path.join(self.pdf_dir, f"{name}.pdf"), "wb") as f:
+            f.write(b"%PDF-1.4 " + name.encode())
+
+    def send(self, *options, inputs=()):
+        return app.send_main([
+            os.path.join(self.dir, "*.json"), *inputs, "--smtp-host", "127.0.0.1",
+            "--smtp-port", str(self.server.server_address[1]), "--security", "none",
+            "--pdf-dir", self.pdf_dir, "--log", self.log, "--retry-delay", "0",
+            "-c", "2", *options])
+
+    def read_log(self):
+        with open(self.log, "r", encoding="utf-8", newline="") as f:
+            return {os.path.basename(row["file"]): row for row in csv.DictReader(f)}
+
+    def test_send(self):
+        for i in range(5):
+            self.write_offer(f"a{i}", f"klient{i}@example.com")
+        self.write_offer("odrzucona", "odrzuc@example.com")
+        self.write_offer("bez_nadawcy", "b@x.pl", company_email="")
+
+        self.assertEqual(self.send(), 1)
+        log = self.read_log()
+        self.assertEqual(len(log), 7)
+        for i in range(5):
+            self.assertEqual(log[f"a{i}.json"]["status"], "sent")
+            self.assertEqual(log[f"a{i}.json"]["address"], f"klient{i}@example.com")
+        self.assertEqual(log["odrzucona.json"]["status"], "failed")
+        # Błąd 550 jest trwały - bez ponowień
+        self.assertEqual(log["odrzucona.json"]["attempts"], "1")
+        self.assertEqual(log["bez_nadawcy.json"]["status"], "skipped")
+        self.assertEqual(log["bez_nadawcy.json"]["address"], "b@x.pl")
+
+        # Stałe połączenia: najwyżej jedno na wątek (odrzucenie kończy się RSET)
+        self.assertLessEqual(self.server.connections, 2)
+        self.assertEqual(len(self.server.messages), 5)
+        message = next(m for m in self.server.messages if m["To"] == "klient0@example.com")
+        [attachment] = [part for part in message.walk() if part.get_filename()]
+        self.assertEqual(attachment.get_filename(), "a0.pdf")
+        self.assertEqual(attachment.get_payload(decode=True), b"%PDF-1.4 a0")
+
+    def test_skip_sent(self):
+        self.write_offer("a", "a@example.com")
+        self.assertEqual(self.send(), 0)
+        self.write_offer("b", "b@example.com")
+        self.assertEqual(self.send("--skip-sent"), 0)
+        self.assertEqual([m["To"] for m in self.server.messages], ["a@example.com", "b@example.com"])
+
+    def test_duplicate_names_with_pdf_dir(self):
+        # Dwie oferty "a" z różnych katalogów dostałyby ten sam plik PDF
+        self.write_offer("a", "a@example.com")
+        other_dir = os.path.join(self.dir, "inne")
+        os.makedirs(other_dir)
+        os.replace(os.path.join(self.dir, "a.json"), os.path.join(other_dir, "a.json"))
+        self.write_offer("a", "a2@example.com")
+        self.assertEqual(self.send(inputs=[os.path.join(other_dir, "*.json")]), 2)
+        self.assertEqual(self.server.messages, [])
+        self.assertFalse(os.path.exists(self.log))
+
+
+if __name__ == "__main__":
+    unittest.main()